@@ -0,0 +1,97 @@
+"""Benchmark the audio silence detector on WAV fixtures.
+
+Writes WAV files with tone, noise and silent stretches to a temporary folder,
+runs them through AudioSilenceDetector as fast as possible, and reports how
+many times faster than real time the detection runs, the CPU share needed to
+keep up with the given number of streams, and the events detected.
+
+Usage:
+    python -m benchmarks.audio_detector [--minutes 10] [--streams 4]
+"""
+import argparse
+import os.path
+import tempfile
+import time
+import wave
+
+import numpy
+
+from silence_notifier.audio_detector import AudioSilenceDetector
+
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+
+def write_fixture(path, minutes, seed=0):
+    """Write a WAV file alternating between sound and silence.
+
+    Returns:
+        List of (start, stop) seconds of each silence in the file.
+    """
+    rng = numpy.random.default_rng(seed)
+    silences = []
+    position = 0.0
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        while position < minutes * 60:
+            sound = rng.uniform(30, 120)
+            silence = rng.uniform(15, 60)
+            t = numpy.arange(int(sound * SAMPLE_RATE)) / SAMPLE_RATE
+            tone = 0.3 * numpy.sin(2 * numpy.pi * 440 * t)
+            tone += rng.normal(0, 0.05, len(t))
+            quiet = rng.normal(0, 0.0005, int(silence * SAMPLE_RATE))
+            audio = numpy.concatenate([tone, quiet])
+            frames = numpy.repeat(audio[:, None], CHANNELS, axis=1)
+            wav.writeframes((frames * 32767).astype("<i2").tobytes())
+            silences.append((position + sound, position + sound + silence))
+            position += sound + silence
+    return silences
+
+
+def run_fixture(path):
+    """Run the detector over path, returning events and seconds taken."""
+    events = []
+    detector = AudioSilenceDetector(
+        lambda: events.append("start"),
+        lambda: events.append("stop"),
+        sample_rate=SAMPLE_RATE,
+        channels=CHANNELS
+    )
+    with wave.open(path, "rb") as wav:
+        num_frames = wav.getnframes()
+        cpu_start = time.process_time()
+        while True:
+            data = wav.readframes(detector.window_frames)
+            if not data:
+                break
+            detector.feed(data)
+        cpu = time.process_time() - cpu_start
+    return events, cpu, num_frames / SAMPLE_RATE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--streams", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "fixture.wav")
+        silences = write_fixture(path, args.minutes)
+        events, cpu, duration = run_fixture(path)
+
+    speed = duration / cpu
+    print("Audio: {:.0f} s, {} silences, events detected: {}".format(
+        duration, len(silences), len(events)
+    ))
+    print("CPU time: {:.3f} s, {:.0f}x real time".format(cpu, speed))
+    print("CPU share for {} streams in real time: {:.2f}% of one core".format(
+        args.streams, 100 * args.streams / speed
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark the time from process start to the first warning on Slack.
+
+Starts a stub Slack Web API and Radio REST API plus a dummy LiquidSoap, then
+starts silence-notifier in fresh processes, driving the plugin the way RtmBot
+does. Each process reports its startup trace, and the median time of each step
+is printed, along with which of the slower third-party modules were loaded
+by then. The benchmark fails if the first post takes longer than the given
+threshold.
+
+With --like-rtmbot, each process first imports what RtmBot's launcher has
+loaded before it creates the plugin: yaml for rtmbot.conf, and rtmbot.core,
+which loads slackclient and with it requests.
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5] [--max-first-post-ms 1500]
+        [--like-rtmbot]
+"""
+import argparse
+import json
+import os.path
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.stubs import DummyLiquidSoap, StubServer, write_settings
+
+
+# Imported by RtmBot's launcher before the plugin is created
+RTMBOT_PRELUDE = """
+import yaml
+import rtmbot.core
+"""
+
+# Third-party modules which are slow to import
+HEAVY_MODULES = ("requests", "yaml", "psutil", "slackclient")
+
+CHILD = """
+import json, sys, time
+from silence_notifier import startup_trace
+from silence_notifier.settings import Settings
+Settings.get_default_user_config_file = lambda self: {settings!r}
+Settings.get_default_cache_file = lambda self: {cache!r}
+from silence_notifier.rtmbot_plugin import SilencePlugin
+from benchmarks.stubs import StubSlackClient
+
+client = StubSlackClient({url!r})
+plugin = SilencePlugin(slack_client=client)
+plugin.register_jobs()
+deadline = time.monotonic() + 30
+while not startup_trace._reported and time.monotonic() < deadline:
+    for job in plugin.jobs:
+        if job.check():
+            job.run(slack_client=client)
+    time.sleep(0.001)
+print(json.dumps({{
+    "marks": startup_trace.get_marks(),
+    "modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_once(folder, settings, url, like_rtmbot=False):
+    """Start silence-notifier once.
+
+    Returns:
+        Tuple of the startup trace and the list of HEAVY_MODULES loaded by
+        the time of the first post.
+    """
+    # The previous run exits during its silence, which would otherwise be
+    # resumed with the first warning already given
+    try:
+        os.remove(os.path.join(folder, ".episode_snapshot"))
+    except FileNotFoundError:
+        pass
+    code = CHILD.format(
+        settings=settings,
+        cache=os.path.join(folder, ".settings_cache"),
+        url=url,
+        heavy=HEAVY_MODULES
+    )
+    if like_rtmbot:
+        code = RTMBOT_PRELUDE + code
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stderr=subprocess.DEVNULL
+    )
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    return result["marks"], result["modules"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-first-post-ms", type=float, default=1500)
+    parser.add_argument("--like-rtmbot", action="store_true",
+                        help="import what RtmBot's launcher does first")
+    args = parser.parse_args(argv)
+
+    server = StubServer().start()
+    with tempfile.TemporaryDirectory() as folder:
+        liquidsoap = DummyLiquidSoap(folder)
+        try:
+            settings = write_settings(folder, server.url, liquidsoap.script)
+            results = [run_once(folder, settings, server.url,
+                                args.like_rtmbot)
+                       for _ in range(args.runs)]
+        finally:
+            liquidsoap.stop()
+            server.stop()
+
+    traces = [trace for trace, _ in results]
+    steps = [step for step, _ in traces[0]]
+    print("Median milliseconds since process start, over {} runs:".format(
+        args.runs
+    ))
+    medians = dict()
+    for step in steps:
+        times = [dict(trace)[step] * 1000 for trace in traces
+                 if step in dict(trace)]
+        medians[step] = statistics.median(times)
+        print("{:>9.1f}  {}".format(medians[step], step))
+    # The first run also loads yaml to fill the settings cache
+    loaded = sorted(set.intersection(*(
+        set(modules) for _, modules in results
+    )))
+    print("Loaded by the first post in every run: {}".format(
+        ", ".join(loaded) or "none"
+    ))
+
+    first_post = medians.get("first post")
+    if first_post is None or first_post > args.max_first_post_ms:
+        print("FAIL: first post took longer than {} ms".format(
+            args.max_first_post_ms
+        ))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
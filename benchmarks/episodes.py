@@ -0,0 +1,391 @@
+"""Benchmark whole silence episodes, end to end.
+
+Starts a stub Slack Web API with an RTM websocket, a stub Radio REST API and a
+dummy LiquidSoap, then runs silence-notifier in fresh processes, driven the way
+RtmBot drives it. Each episode follows the same script: warnings are given,
+two users volunteer and then withdraw through mentions on RTM, and the episode
+ends either with SIGTERM (the silence is over) or with LiquidSoap exiting.
+Episodes alternate between the two endings.
+
+The results are printed as JSON:
+
+- time_to_first_warning_ms: From starting the process until the first warning
+  reached Slack.
+- warning_lateness_ms: How much later than scheduled each following warning
+  reached Slack.
+- reply_latency_ms: From a mention being sent on RTM until the first reply
+  (message or reaction) reached Slack.
+- sound_latency_ms / not_running_latency_ms: From SIGTERM, respectively
+  LiquidSoap exiting, until the final message reached Slack.
+- api_calls_per_episode: Mean number of calls to each Web API method.
+- peak_rss_kb: Highest peak resident set size of silence-notifier.
+- cpu_seconds_per_episode: Mean CPU time used by silence-notifier.
+
+Latencies are summarized by their 50th, 90th and 99th percentile and maximum.
+
+With --runtime async, silence-notifier is run by the asyncio runtime instead
+of the RtmBot loop.
+
+Usage:
+    python -m benchmarks.episodes [--runs 4] [--warnings 3]
+        [--sec-per-min 1.0] [--latency 0.0] [--status-message]
+        [--runtime rtmbot|async] [--output results.json]
+"""
+import argparse
+import json
+import os
+import os.path
+import re
+import signal
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.stubs import BOT_USER_ID, CHANNEL_ID, DummyLiquidSoap, \
+    StubRtmServer, StubServer, write_settings
+
+
+# RtmBot sleeps this long between each round of reading events and running jobs
+RTMBOT_TICK = 0.1
+
+CHILD = """
+import json, resource, time
+from silence_notifier.settings import Settings
+Settings.get_default_user_config_file = lambda self: {settings!r}
+Settings.get_default_cache_file = lambda self: {cache!r}
+from benchmarks.stubs import StubRtmClient, StubSlackClient
+
+client = StubSlackClient({url!r})
+rtm = StubRtmClient(client.api_call("rtm.connect")["url"])
+try:
+    from silence_notifier.rtmbot_plugin import SilencePlugin
+    plugin = SilencePlugin(slack_client=client)
+    plugin.register_jobs()
+    while True:
+        for event in rtm.read_events():
+            if event.get("type") == "message":
+                plugin.process_message(event)
+        for job in plugin.jobs:
+            if job.check():
+                job.run(slack_client=client)
+        time.sleep({tick!r})
+except (KeyboardInterrupt, SystemExit):
+    pass
+usage = resource.getrusage(resource.RUSAGE_SELF)
+print(json.dumps({{
+    "max_rss_kb": usage.ru_maxrss,
+    "cpu_seconds": usage.ru_utime + usage.ru_stime,
+}}))
+"""
+
+ASYNC_CHILD = """
+import asyncio, json, resource
+from silence_notifier.settings import Settings
+Settings.get_default_user_config_file = lambda self: {settings!r}
+Settings.get_default_cache_file = lambda self: {cache!r}
+from silence_notifier.async_runtime import AsyncRuntime
+
+runtime = AsyncRuntime("xoxb-benchmark", {url!r} + "/api/")
+try:
+    asyncio.run(runtime.run())
+except KeyboardInterrupt:
+    pass
+usage = resource.getrusage(resource.RUSAGE_SELF)
+print(json.dumps({{
+    "max_rss_kb": usage.ru_maxrss,
+    "cpu_seconds": usage.ru_utime + usage.ru_stime,
+}}))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mentions sent during each episode: (user, whether they volunteer or withdraw)
+MENTIONS = [("U1", "volunteer"), ("U2", "volunteer"),
+            ("U1", "withdraw"), ("U2", "withdraw")]
+
+# Web API methods used to reply to a mention
+REPLY_METHODS = {"chat.postMessage", "reactions.add"}
+
+
+class MessageClassifier:
+    """Tell which message type a posted text was made from."""
+
+    def __init__(self, messages):
+        """
+        Args:
+            messages: The messages setting.
+        """
+        self._patterns = []
+        for message_type, templates in messages.items():
+            if isinstance(templates, dict):
+                templates = [template for threshold in templates.values()
+                             for template in threshold]
+            elif not isinstance(templates, list):
+                # An option, like warnings_cumulative
+                continue
+            for template in templates:
+                self._patterns.append(
+                    (re.compile(self._to_regex(template)), message_type)
+                )
+
+    @staticmethod
+    def _to_regex(template):
+        parts = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            parts.append(re.escape(literal))
+            if field is not None:
+                parts.append(".*")
+        return "^" + "".join(parts) + "$"
+
+    def classify(self, text):
+        """Return the message type text was made from, or None."""
+        for pattern, message_type in self._patterns:
+            if pattern.match(text):
+                return message_type
+        return None
+
+    def classify_merged(self, text):
+        """Return set of the message types of the messages merged into text,
+        one per line, by the Slack queue."""
+        return {self.classify(line) for line in text.split("\n")}
+
+
+def percentiles(values):
+    """Return dictionary with the 50th, 90th and 99th percentile and maximum
+    of values (in seconds), converted to milliseconds."""
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        index = max(0, int(round(p / 100 * len(values))) - 1)
+        return round(values[index] * 1000, 1)
+
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99),
+            "max": round(values[-1] * 1000, 1)}
+
+
+class Episode:
+    """One run of silence-notifier, from start to exit."""
+
+    def __init__(self, server, rtm_server, classifier, warning_minutes,
+                 args):
+        self.server = server
+        self.rtm_server = rtm_server
+        self.classifier = classifier
+        self.warning_minutes = warning_minutes
+        self.args = args
+        self.first_call = len(server.calls)
+
+    def calls(self):
+        """Return the calls made to the stub server during this episode."""
+        return self.server.calls[self.first_call:]
+
+    def posts(self, message_type):
+        """Return arrival time of posts of message_type."""
+        return [at for at, method, params in self.calls()
+                if method == "chat.postMessage" and
+                message_type in self.classifier.classify_merged(
+                    params.get("text", "")
+                )]
+
+    def wait_for(self, condition, timeout=30):
+        """Wait until condition() returns something truthy, and return it."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = condition()
+            if result:
+                return result
+            time.sleep(0.001)
+        raise TimeoutError("Episode did not progress as expected")
+
+    def replies_since(self, since):
+        """Return arrival time of the replies arriving after since."""
+        return [at for at, method, params in self.calls()
+                if at >= since and method in REPLY_METHODS and
+                self.classifier.classify_merged(params.get("text", "")) -
+                {"warnings"}]
+
+    def mention(self, user, number):
+        """Mention the bot as user, and return the reply latency."""
+        ts = "{}.{:06d}".format(int(time.time()), number)
+        sent = time.time()
+        self.rtm_server.send_event({
+            "type": "message",
+            "channel": CHANNEL_ID,
+            "user": user,
+            "text": "<@{}> fikser".format(BOT_USER_ID),
+            "ts": ts,
+        })
+        replied = self.wait_for(lambda: self.replies_since(sent))[0]
+        # Let the rest of the replies arrive before the next mention
+        self.wait_for(lambda: not self.replies_since(time.time() - 0.2),
+                      timeout=10)
+        return replied - sent
+
+    def run(self, folder, settings, ending):
+        """Run the episode, ending it with "sigterm" or "process_exit".
+
+        Returns:
+            Dictionary with the measurements of this episode.
+        """
+        result = {"ending": ending}
+        liquidsoap = DummyLiquidSoap(folder)
+        settings_file = write_settings(
+            folder, self.server.url, liquidsoap.script, settings
+        )
+        child = ASYNC_CHILD if self.args.runtime == "async" else CHILD
+        code = child.format(
+            settings=settings_file,
+            cache=os.path.join(folder, ".settings_cache"),
+            url=self.server.url,
+            tick=RTMBOT_TICK
+        )
+        started = time.time()
+        process = subprocess.Popen(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            first = self.wait_for(lambda: self.posts("warnings"))[0]
+            result["time_to_first_warning"] = first - started
+
+            warnings = self.wait_for(
+                lambda: (len(self.posts("warnings")) >= self.args.warnings and
+                         self.posts("warnings"))
+            )
+            result["warning_lateness"] = [
+                at - (first + minutes * self.args.sec_per_min)
+                for minutes, at in zip(self.warning_minutes,
+                                       warnings[:self.args.warnings])
+            ][1:]
+
+            result["reply_latency"] = [
+                self.mention(user, number)
+                for number, (user, _) in enumerate(MENTIONS)
+            ]
+
+            if ending == "sigterm":
+                message_type = "sound"
+                ended = time.time()
+                process.send_signal(signal.SIGTERM)
+            else:
+                message_type = "not_running"
+                ended = time.time()
+                liquidsoap.stop()
+            final = self.wait_for(lambda: self.posts(message_type))[0]
+            result[message_type + "_latency"] = final - ended
+
+            output, _ = process.communicate(timeout=30)
+            result.update(json.loads(output.decode().strip().splitlines()[-1]))
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            liquidsoap.stop()
+
+        result["api_calls"] = dict()
+        for _, method, _ in self.calls():
+            result["api_calls"][method] = result["api_calls"].get(method, 0) + 1
+        return result
+
+
+def summarize(results):
+    """Return the summary of the results of all episodes."""
+    def collect(key):
+        values = []
+        for result in results:
+            value = result.get(key)
+            if isinstance(value, list):
+                values.extend(value)
+            elif value is not None:
+                values.append(value)
+        return values
+
+    methods = sorted({method for result in results
+                      for method in result["api_calls"]})
+    return {
+        "episodes": len(results),
+        "time_to_first_warning_ms": percentiles(
+            collect("time_to_first_warning")
+        ),
+        "warning_lateness_ms": percentiles(collect("warning_lateness")),
+        "reply_latency_ms": percentiles(collect("reply_latency")),
+        "sound_latency_ms": percentiles(collect("sound_latency")),
+        "not_running_latency_ms": percentiles(collect("not_running_latency")),
+        "api_calls_per_episode": {
+            method: sum(result["api_calls"].get(method, 0)
+                        for result in results) / len(results)
+            for method in methods
+        },
+        "peak_rss_kb": max(collect("max_rss_kb")),
+        "cpu_seconds_per_episode": round(
+            sum(collect("cpu_seconds")) / len(results), 3
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=4,
+                        help="number of episodes to run")
+    parser.add_argument("--warnings", type=int, default=3,
+                        help="warnings to wait for before volunteering")
+    parser.add_argument("--sec-per-min", type=float, default=1.0,
+                        help="the sec_per_min setting to use")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the stub servers wait before answering")
+    parser.add_argument("--status-message", action="store_true",
+                        help="use the status_message setting")
+    parser.add_argument("--runtime", choices=("rtmbot", "async"),
+                        default="rtmbot",
+                        help="how to run silence-notifier")
+    parser.add_argument("--output", help="write the JSON here, too")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(ROOT, "settings_default.yaml")) as fp:
+        messages = yaml.safe_load(fp)["messages"]
+    classifier = MessageClassifier(messages)
+    settings = "sec_per_min: {}\nwarning_delays:\n  - 1\n".format(
+        args.sec_per_min
+    )
+    if args.status_message:
+        settings += "status_message: yes\n"
+        # Only warnings reaching a new threshold are posted
+        warning_minutes = sorted(messages["warnings"])
+    else:
+        warning_minutes = range(args.warnings)
+
+    server = StubServer(latency=args.latency).start()
+    rtm_server = StubRtmServer().start()
+    server.rtm_server = rtm_server
+    results = []
+    try:
+        for run in range(args.runs):
+            ending = "sigterm" if run % 2 == 0 else "process_exit"
+            # A fresh folder each time, since the dummy LiquidSoap executable
+            # cannot be replaced while it runs
+            with tempfile.TemporaryDirectory() as folder:
+                episode = Episode(
+                    server, rtm_server, classifier, warning_minutes, args
+                )
+                results.append(episode.run(folder, settings, ending))
+    finally:
+        server.stop()
+
+    text = json.dumps(summarize(results), indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Benchmark delivering messages to several notifier backends.
+
+Sets up a fast webhook, a slow webhook, a command standing in for an SMS
+gateway and a webhook which is down, and times how long after a message is
+sent each backend has it, when delivered in parallel by NotifierFanout and
+when delivered by one backend after the other. Also times the call to
+NotifierFanout.notify, which the warning path makes.
+
+Usage:
+    python -m benchmarks.fanout [--messages 5] [--slow 1.0]
+"""
+import argparse
+import logging
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.stubs import StubServer
+from silence_notifier.notifiers import CommandNotifier, NotifierFanout, \
+    WebhookNotifier
+
+
+def unused_port():
+    """Return a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def create_notifiers(fast, slow):
+    return [
+        WebhookNotifier(fast.url + "/api/webhook", name="fast-webhook"),
+        WebhookNotifier(slow.url + "/api/webhook", name="slow-webhook"),
+        CommandNotifier("sh -c 'cat > /dev/null; sleep 0.3'", name="sms"),
+        WebhookNotifier("http://127.0.0.1:{}/".format(unused_port()),
+                        name="down-webhook", timeout=1.0, attempts=2,
+                        retry_delay=0.5),
+    ]
+
+
+def record_deliveries(notifiers):
+    """Make each notifier record when it delivered each message.
+
+    Returns:
+        Dictionary mapping backend names to lists of perf_counter times.
+    """
+    delivered = {notifier.name: [] for notifier in notifiers}
+    lock = threading.Lock()
+    for notifier in notifiers:
+        def deliver(text, message_type, notifier=notifier,
+                    original=notifier.deliver):
+            original(text, message_type)
+            with lock:
+                delivered[notifier.name].append(time.perf_counter())
+        notifier.deliver = deliver
+    return delivered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5,
+                        help="number of messages to send in parallel")
+    parser.add_argument("--slow", type=float, default=1.0,
+                        help="seconds the slow webhook takes to answer")
+    args = parser.parse_args(argv)
+    # The webhook which is down is expected to fail
+    logging.disable(logging.ERROR)
+
+    fast = StubServer(latency=0.02).start()
+    slow = StubServer(latency=args.slow).start()
+    try:
+        notifiers = create_notifiers(fast, slow)
+        delivered = record_deliveries(notifiers)
+        fanout = NotifierFanout(notifiers)
+        sent = []
+        notify_us = []
+        for number in range(args.messages):
+            sent.append(time.perf_counter())
+            fanout.notify("Advarsel {}".format(number), "warnings")
+            notify_us.append((time.perf_counter() - sent[-1]) * 1e6)
+            # Give the slow webhook time to catch up
+            time.sleep(args.slow + 0.2)
+        fanout.flush(60)
+        print("notify: median {:.0f} us".format(statistics.median(notify_us)))
+        print("In parallel, median seconds from sending to delivery:")
+        for name, times in delivered.items():
+            if not times:
+                print("  {:<14} never".format(name))
+                continue
+            print("  {:<14} {:6.3f}".format(name, statistics.median(
+                done - start for start, done in zip(sent, times)
+            )))
+
+        notifiers = create_notifiers(fast, slow)
+        start = time.perf_counter()
+        finished = []
+        for notifier in notifiers:
+            try:
+                notifier.deliver("Advarsel", "warnings")
+                finished.append(time.perf_counter() - start)
+            except Exception:
+                finished.append(None)
+        print("One after another, seconds from sending to delivery:")
+        for notifier, seconds in zip(notifiers, finished):
+            if seconds is None:
+                print("  {:<14} never".format(notifier.name))
+            else:
+                print("  {:<14} {:6.3f}".format(notifier.name, seconds))
+    finally:
+        fast.stop()
+        slow.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
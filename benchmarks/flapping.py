@@ -0,0 +1,133 @@
+"""Benchmark the Slack messages posted while the stream flaps.
+
+Runs SilencePlugin in daemon mode against the stub servers, and starts and
+stops the silence over and over with short, random durations, like
+LiquidSoap's fallback transitions do when the stream flaps. This is done
+first without and then with episode_grace_period and min_silence_duration,
+and the number of warnings, sound messages and Slack calls are printed for
+both.
+
+Without daemon mode, every start would also spawn a new silence-notifier
+process, so the number of starts is printed as well.
+
+Usage:
+    python -m benchmarks.flapping [--cycles 50] [--grace-period 2]
+        [--min-duration 0.2] [--sec-per-min 1.0]
+"""
+import argparse
+import os.path
+import random
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.episodes import ROOT, MessageClassifier
+from benchmarks.stubs import DummyLiquidSoap, StubServer, StubSlackClient, \
+    write_settings
+
+# Silences and sounds last this many "minutes" (see sec_per_min) each
+FLAP_MINUTES = (0.05, 0.5)
+
+
+def flap(folder, server, liquidsoap, classifier, settings, args):
+    """Flap the silence on a fresh plugin using settings.
+
+    Returns:
+        Dictionary with the number of starts, messages posted of each type,
+        and Slack calls by method.
+    """
+    from silence_notifier.settings import Settings
+    settings_file = write_settings(folder, server.url, liquidsoap.script,
+                                   settings)
+    Settings.get_default_user_config_file = lambda self: settings_file
+    Settings.get_default_cache_file = lambda self: folder + "/.settings_cache"
+
+    from silence_notifier.rtmbot_plugin import SilencePlugin
+    client = StubSlackClient(server.url)
+    plugin = SilencePlugin(slack_client=client)
+    plugin.register_jobs()
+    monitor = plugin.get_monitor()
+    first_call = len(server.calls)
+
+    rng = random.Random(0)
+    for _ in range(args.cycles):
+        plugin.start_episode()
+        silence_until = time.monotonic() + \
+            rng.uniform(*FLAP_MINUTES) * args.sec_per_min
+        # Run the warning job while silent, like the runtimes do
+        while time.monotonic() < silence_until:
+            for job in plugin.jobs:
+                if job.check():
+                    job.run(client)
+            time.sleep(0.01)
+        plugin.stop_episode()
+        time.sleep(rng.uniform(*FLAP_MINUTES) * args.sec_per_min)
+
+    # Let the grace period run out, and the last messages reach Slack
+    while monitor.is_active():
+        time.sleep(0.05)
+    plugin.communicator.sender.flush(10)
+    plugin.handle_sigterm()
+
+    calls = dict()
+    messages = dict()
+    for _, method, params in server.calls[first_call:]:
+        calls[method] = calls.get(method, 0) + 1
+        if method == "chat.postMessage":
+            # Merged messages are counted one by one
+            for line in params.get("text", "").splitlines():
+                message_type = classifier.classify(line)
+                messages[message_type] = messages.get(message_type, 0) + 1
+    return {"starts": args.cycles, "messages": messages, "calls": calls}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=50,
+                        help="number of times the silence starts and stops")
+    parser.add_argument("--grace-period", type=float, default=2.0,
+                        help="episode_grace_period, in minutes")
+    parser.add_argument("--min-duration", type=float, default=0.2,
+                        help="min_silence_duration, in minutes")
+    parser.add_argument("--sec-per-min", type=float, default=1.0,
+                        help="the sec_per_min setting to use")
+    args = parser.parse_args(argv)
+
+    common = "daemon_mode: yes\nsec_per_min: {}\nwarning_delays:\n  - 1\n" \
+        .format(args.sec_per_min)
+    with open(os.path.join(ROOT, "settings_default.yaml")) as fp:
+        classifier = MessageClassifier(yaml.safe_load(fp)["messages"])
+    server = StubServer().start()
+    results = []
+    try:
+        for name, extra in (
+                ("without coalescing", ""),
+                ("with coalescing",
+                 "episode_grace_period: {}\nmin_silence_duration: {}\n"
+                 .format(args.grace_period * args.sec_per_min,
+                         args.min_duration * args.sec_per_min))):
+            with tempfile.TemporaryDirectory() as folder:
+                liquidsoap = DummyLiquidSoap(folder)
+                try:
+                    settings = common + "trigger_socket: {}/trigger.sock\n" \
+                        .format(folder) + extra
+                    results.append((name, flap(folder, server, liquidsoap,
+                                               classifier, settings, args)))
+                finally:
+                    liquidsoap.stop()
+    finally:
+        server.stop()
+
+    for name, result in results:
+        print("{}: {} starts, {} warnings, {} sound messages, {} Slack calls"
+              .format(name, result["starts"],
+                      result["messages"].get("warnings", 0),
+                      result["messages"].get("sound", 0),
+                      sum(result["calls"].values())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Benchmark writing and aggregating the silence history.
+
+Records years of made up silences with EpisodeHistory, timing each call to
+record (which the warning path makes), then times the statistics the
+episode_history CLI computes over the whole history, over one show (using the
+show index) and over one month (using a binary search on the end times).
+
+Usage:
+    python -m benchmarks.history_stats [--years 10] [--per-day 5]
+"""
+import argparse
+import os.path
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from silence_notifier.episode_history import ENDINGS, EpisodeHistory, \
+    HistoryReader, summarize
+
+SHOWS = ["Show {}".format(number) for number in range(60)]
+USERS = ["U{:04d}".format(number) for number in range(40)]
+
+
+def write_history(filename, args):
+    """Record made up silences to filename.
+
+    Returns:
+        List of seconds each call to record took.
+    """
+    history = EpisodeHistory(filename)
+    rng = random.Random(0)
+    started = time.time() - args.years * 365 * 86400
+    timings = []
+    for _ in range(int(args.years * 365 * args.per_day)):
+        started += rng.expovariate(args.per_day / 86400)
+        volunteers = rng.sample(USERS, rng.choice((0, 1, 1, 2, 3)))
+        start = time.perf_counter()
+        history.record(
+            rng.choice(("main", "second")),
+            started,
+            started + rng.expovariate(1 / 600),
+            rng.choice(ENDINGS),
+            warnings=rng.randint(0, 8),
+            volunteers=volunteers,
+            first_volunteer=rng.uniform(10, 900) if volunteers else None,
+            show=rng.choice(SHOWS)
+        )
+        timings.append(time.perf_counter() - start)
+        if len(timings) % history.max_queued == 0:
+            # Writing this many silences at once is not what we measure
+            history.flush(60)
+    history.flush(60)
+    return timings
+
+
+def time_query(filename, query):
+    """Return milliseconds it takes to open the history and run query."""
+    start = time.perf_counter()
+    reader = HistoryReader(filename)
+    try:
+        query(reader)
+    finally:
+        reader.close()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=float, default=10,
+                        help="years of history to make up")
+    parser.add_argument("--per-day", type=float, default=5,
+                        help="silences per day")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, ".episode_history")
+        timings = sorted(write_history(filename, args))
+        size = sum(os.path.getsize(filename + suffix)
+                   for suffix in ("", ".strings", ".idx"))
+        print("{} silences, {:.0f} kB on disk".format(len(timings),
+                                                      size / 1000))
+        print("record: median {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+            statistics.median(timings) * 1e6,
+            timings[int(0.99 * (len(timings) - 1))] * 1e6,
+            timings[-1] * 1e6
+        ))
+
+        month_end = time.time() - 180 * 86400
+        queries = [
+            ("everything", lambda reader: summarize(
+                reader.records(), reader.strings)),
+            ("everything by show", lambda reader: summarize(
+                reader.records(), reader.strings, "show")),
+            ("everything by volunteer", lambda reader: summarize(
+                reader.records(), reader.strings, "volunteer")),
+            ("one show", lambda reader: summarize(
+                reader.records(show=SHOWS[0]), reader.strings)),
+            ("one month", lambda reader: summarize(
+                reader.records(month_end - 30 * 86400, month_end),
+                reader.strings)),
+        ]
+        for name, query in queries:
+            runs = sorted(time_query(filename, query) for _ in range(5))
+            print("{:<25} {:7.1f} ms".format(name, runs[len(runs) // 2]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Benchmark asking LiquidSoap's server what is on air.
+
+Starts a fake LiquidSoap telnet server and times queries made over the
+persistent connection of LiquidSoapClient: one command, several commands sent
+together, the same commands one query at a time, and one command over a new
+connection each time (the cost the persistent connection saves). Then runs
+SilencePlugin in daemon mode with liquidsoap_server set, switches the fake
+LiquidSoap to silence and back, and prints how long the plugin took to start
+and stop the silence.
+
+Usage:
+    python -m benchmarks.liquidsoap_server [--queries 2000]
+        [--poll-interval 0.1]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.stubs import DummyLiquidSoap, FakeLiquidSoapServer, \
+    StubServer, StubSlackClient, write_settings
+from silence_notifier.liquidsoap_server import LiquidSoapClient
+
+COMMANDS = ["on_air", "main.status", "live.status", "backup.status"]
+
+
+def time_queries(client, commands, num_queries, reconnect=False, split=False):
+    """Return sorted list of microseconds each check took."""
+    timings = []
+    for _ in range(num_queries):
+        if reconnect:
+            client.close()
+        start = time.perf_counter()
+        if split:
+            for command in commands:
+                client.query([command])
+        else:
+            client.query(commands)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return sorted(timings)
+
+
+def time_transitions(fake, args):
+    """Return seconds from LiquidSoap switching to silence until the silence
+    started, and from switching back until it stopped."""
+    from silence_notifier.settings import Settings
+    server = StubServer().start()
+    with tempfile.TemporaryDirectory() as folder:
+        liquidsoap = DummyLiquidSoap(folder)
+        try:
+            settings_file = write_settings(
+                folder, server.url, liquidsoap.script,
+                "daemon_mode: yes\ntrigger_socket: {}/trigger.sock\n"
+                "liquidsoap_server:\n  address: \"{}\"\n"
+                "  commands: [on_air]\n  silent_answers: [blank]\n"
+                "  poll_interval: {}\n".format(folder, fake.address,
+                                              args.poll_interval)
+            )
+            Settings.get_default_user_config_file = \
+                lambda self: settings_file
+            Settings.get_default_cache_file = \
+                lambda self: folder + "/.settings_cache"
+
+            from silence_notifier.rtmbot_plugin import SilencePlugin
+            plugin = SilencePlugin(slack_client=StubSlackClient(server.url))
+            plugin.register_jobs()
+            monitor = plugin.get_monitor()
+            delays = []
+            for active in (True, False):
+                fake.answers["on_air"] = "blank" if active else "live"
+                switched = time.monotonic()
+                while monitor.is_active() != active:
+                    time.sleep(0.001)
+                delays.append(time.monotonic() - switched)
+            plugin.handle_sigterm()
+            return delays
+        finally:
+            liquidsoap.stop()
+            server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000,
+                        help="number of checks of each kind to time")
+    parser.add_argument("--poll-interval", type=float, default=0.1,
+                        help="poll_interval to run the plugin with")
+    args = parser.parse_args(argv)
+
+    fake = FakeLiquidSoapServer({command: "live" for command in COMMANDS})
+    fake.start()
+    client = LiquidSoapClient(fake.address)
+    client.query(["on_air"])
+    for name, commands, options in (
+            ("1 command", COMMANDS[:1], {}),
+            ("4 commands, pipelined", COMMANDS, {}),
+            ("4 commands, one by one", COMMANDS, {"split": True}),
+            ("1 command, new connection", COMMANDS[:1], {"reconnect": True})):
+        timings = time_queries(client, commands, args.queries, **options)
+        print("{:<27} median {:6.1f} us, p99 {:6.1f} us".format(
+            name + ":",
+            statistics.median(timings),
+            timings[int(0.99 * (len(timings) - 1))]
+        ))
+    client.close()
+
+    connections = fake.connections
+    start_delay, stop_delay = time_transitions(fake, args)
+    print("silence started after {:.0f} ms, stopped after {:.0f} ms, using "
+          "{} connection(s)".format(start_delay * 1000, stop_delay * 1000,
+                                    fake.connections - connections))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
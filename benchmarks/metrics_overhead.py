@@ -0,0 +1,75 @@
+"""Benchmark the overhead of recording metrics.
+
+Times one histogram observation (including the two perf_counter calls around
+the measured code), one counter increment and one observation on a labelled
+histogram, and fails if any of them takes a microsecond or more.
+
+Usage:
+    python -m benchmarks.metrics_overhead [--events 1000000]
+"""
+import argparse
+import sys
+import time
+
+from silence_notifier.metrics import Counter, Histogram, Registry
+
+
+def per_event(function, events):
+    """Return the best of three timings of function, in seconds per call."""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        function(events)
+        elapsed = (time.perf_counter() - start) / events
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    registry = Registry()
+    histogram = Histogram("benchmark_seconds", "Benchmark.", registry=registry)
+    labelled = Histogram("benchmark_labelled_seconds", "Benchmark.",
+                         ["method"], registry=registry).labels("chat.post")
+    counter = Counter("benchmark_events", "Benchmark.", registry=registry)
+
+    def baseline(events):
+        for _ in range(events):
+            pass
+
+    def timed(events):
+        perf_counter = time.perf_counter
+        for _ in range(events):
+            start = perf_counter()
+            histogram.observe(perf_counter() - start)
+
+    def increment(events):
+        for _ in range(events):
+            counter.inc()
+
+    def observe_labelled(events):
+        for _ in range(events):
+            labelled.observe(0.003)
+
+    loop = per_event(baseline, args.events)
+    failed = False
+    for name, function in (("timed histogram observation", timed),
+                           ("counter increment", increment),
+                           ("labelled histogram observation",
+                            observe_labelled)):
+        seconds = per_event(function, args.events) - loop
+        print("{:>8.0f} ns  {}".format(seconds * 1e9, name))
+        if seconds >= 1e-6:
+            failed = True
+
+    if failed:
+        print("FAIL: recording a metric took a microsecond or more")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
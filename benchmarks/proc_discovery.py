@@ -0,0 +1,89 @@
+"""Benchmark LiquidSoap discovery against a synthetic /proc tree.
+
+Creates a fake /proc with many processes, of which a few are LiquidSoap, and
+times how long ProcIndex takes to find the one we look for, both on the first
+scan and later (when the index is warm), as well as how long a warm rescan of
+all processes takes.
+
+Usage:
+    python -m benchmarks.proc_discovery [--processes 10000] [--liquidsoaps 3]
+"""
+import argparse
+import os
+import os.path
+import tempfile
+import time
+
+from silence_notifier.proc_index import ProcIndex
+
+
+def create_proc_tree(root, num_processes, num_liquidsoaps):
+    """Populate root with num_processes fake process directories.
+
+    Returns:
+        Absolute path of the script used by the last LiquidSoap process.
+    """
+    os.makedirs(os.path.join(root, "self"))
+    script = None
+    for pid in range(1, num_processes + 1):
+        is_ls = pid % (num_processes // num_liquidsoaps) == 0
+        name = "liquidsoap" if is_ls else "worker-{}".format(pid % 50)
+        proc_dir = os.path.join(root, str(pid))
+        os.mkdir(proc_dir)
+
+        with open(os.path.join(proc_dir, "comm"), "w") as fp:
+            fp.write(name + "\n")
+        with open(os.path.join(proc_dir, "stat"), "w") as fp:
+            fp.write("{} ({}) S ".format(pid, name) + " ".join(
+                str(pid * 7 if i == 19 else 0) for i in range(50)
+            ))
+        cwd = os.path.join(root, "cwd-{}".format(pid % 10))
+        os.makedirs(cwd, exist_ok=True)
+        os.symlink(cwd, os.path.join(proc_dir, "cwd"))
+
+        if is_ls:
+            script = os.path.join(cwd, "radio-{}.liq".format(pid))
+            args = ["liquidsoap", "--verbose", "radio-{}.liq".format(pid)]
+        else:
+            args = [name, "--serve", "/etc/{}.conf".format(name)]
+        with open(os.path.join(proc_dir, "cmdline"), "w") as fp:
+            fp.write("\0".join(args) + "\0")
+    return script
+
+
+def time_call(func, repeat):
+    """Return the best of repeat timings of func, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=10000)
+    parser.add_argument("--liquidsoaps", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        script = create_proc_tree(root, args.processes, args.liquidsoaps)
+
+        cold = time_call(lambda: ProcIndex(root).find(script), args.repeat)
+        index = ProcIndex(root)
+        index.find(script)
+        warm = time_call(lambda: index.find(script), args.repeat)
+        rescan = time_call(index.scan, args.repeat)
+
+    print("Processes: {}, LiquidSoap processes: {}".format(
+        args.processes, args.liquidsoaps
+    ))
+    print("First scan: {:.2f} ms".format(cold))
+    print("Warm find:  {:.2f} ms".format(warm))
+    print("Warm scan:  {:.2f} ms".format(rescan))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Replay RTM events through SilencePlugin at accelerated speed.
+
+Events are either read from a recording (see the rtm_record_file setting) or
+generated to look like a busy workspace: messages in many channels, bot
+messages, edits and joins, replies in other people's threads, and a few
+mentions of us. Each event is handed to the plugin at its recorded time
+divided by the speed-up, the way RtmBot would, and we measure whether the
+plugin keeps up.
+
+Usage:
+    python -m benchmarks.rtm_replay [--recording events.jsonl]
+        [--events 20000] [--rate 50] [--speed 100]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.stubs import BOT_USER_ID, CHANNEL_ID, DummyLiquidSoap, \
+    StubServer, StubSlackClient, write_settings
+from silence_notifier.rtm_recording import read_recording
+
+
+def synthetic_events(num_events, rate, seed=0):
+    """Yield (time, event) for num_events events, rate events per second."""
+    rng = random.Random(seed)
+    channels = ["C{:06d}".format(i) for i in range(200)] + [CHANNEL_ID]
+    users = ["U{:06d}".format(i) for i in range(500)]
+    texts = [
+        "Noen som vet når neste sending er?",
+        "<@{}> kan du se på dette?".format(users[1]),
+        "Husk møtet i morgen",
+        # Not a mention of us, but contains our user id
+        "<@{}2> hei".format(BOT_USER_ID),
+        "Har noen sett {}?".format(BOT_USER_ID),
+    ]
+    start = time.time()
+    for i in range(num_events):
+        event = {
+            "type": "message",
+            "channel": rng.choice(channels),
+            "user": rng.choice(users),
+            "text": rng.choice(texts),
+            "ts": "{:.6f}".format(start + i / rate),
+        }
+        kind = rng.random()
+        if kind < 0.15:
+            event["subtype"] = "bot_message"
+            event.pop("user")
+            event["bot_id"] = "B000001"
+        elif kind < 0.20:
+            event["subtype"] = "message_changed"
+        elif kind < 0.22:
+            event["subtype"] = "channel_join"
+        elif kind < 0.40:
+            event["thread_ts"] = "{:.6f}".format(start - rng.random() * 3600)
+        elif kind < 0.402:
+            event["channel"] = CHANNEL_ID
+            event["text"] = "<@{}> fikser".format(BOT_USER_ID)
+        yield start + i / rate, event
+
+
+def replay(plugin, events, speed):
+    """Hand events to plugin, speed times faster than they were received.
+
+    Returns:
+        Tuple of the number of events, seconds it took, seconds spent in
+        process_message for each event, and how far behind schedule we were
+        at worst and at the end (in seconds).
+    """
+    events = list(events)
+    first = events[0][0]
+    started = time.perf_counter()
+    durations = []
+    max_lag = lag = 0.0
+    for at, event in events:
+        due = started + (at - first) / speed
+        now = time.perf_counter()
+        lag = max(0.0, now - due)
+        max_lag = max(max_lag, lag)
+        if now < due:
+            time.sleep(due - now)
+        before = time.perf_counter()
+        if event.get("type") == "message":
+            plugin.process_message(event)
+        durations.append(time.perf_counter() - before)
+    return len(events), time.perf_counter() - started, durations, max_lag, \
+        lag
+
+
+def create_plugin(folder, server, liquidsoap):
+    """Return a SilencePlugin using the stubs, which has posted its first
+    warning."""
+    from silence_notifier.settings import Settings
+    settings = write_settings(folder, server.url, liquidsoap.script)
+    Settings.get_default_user_config_file = lambda self: settings
+    Settings.get_default_cache_file = lambda self: folder + "/.settings_cache"
+
+    from silence_notifier.rtmbot_plugin import SilencePlugin
+    client = StubSlackClient(server.url)
+    plugin = SilencePlugin(slack_client=client)
+    plugin.register_jobs()
+    for job in plugin.jobs:
+        if job.check():
+            job.run(slack_client=client)
+    # Wait until we know which channel our warnings are in
+    plugin.communicator.sender.flush(10)
+    return plugin
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recording", help="replay events from this file")
+    parser.add_argument("--events", type=int, default=20000,
+                        help="number of events to generate")
+    parser.add_argument("--rate", type=float, default=50,
+                        help="events per second to generate")
+    parser.add_argument("--speed", type=float, default=100,
+                        help="how many times faster to replay")
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        events = read_recording(args.recording)
+    else:
+        events = synthetic_events(args.events, args.rate)
+
+    server = StubServer().start()
+    with tempfile.TemporaryDirectory() as folder:
+        liquidsoap = DummyLiquidSoap(folder)
+        try:
+            plugin = create_plugin(folder, server, liquidsoap)
+            num_events, elapsed, durations, max_lag, lag = replay(
+                plugin, events, args.speed
+            )
+        finally:
+            liquidsoap.stop()
+            server.stop()
+
+    durations.sort()
+    print("{} events in {:.2f} s ({:.0f} events/s)".format(
+        num_events, elapsed, num_events / elapsed
+    ))
+    print("process_message: median {:.1f} us, p99 {:.1f} us, max {:.1f} us"
+          .format(durations[len(durations) // 2] * 1e6,
+                  durations[int(len(durations) * 0.99)] * 1e6,
+                  durations[-1] * 1e6))
+    print("Behind schedule: {:.1f} ms at worst, {:.1f} ms at the end".format(
+        max_lag * 1000, lag * 1000
+    ))
+    if lag > 1.0:
+        print("FAIL: the plugin did not keep up")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Benchmark how long silence-notifier takes to stop when Slack is slow.
+
+Runs silence-notifier like benchmarks.episodes does. Once the warnings have
+started, the stub Slack starts answering slowly, two users mention the bot,
+and the process gets SIGTERM right away, so the replies and the final message
+are all waiting to be sent. For each latency, prints how long the process
+took to exit, whether the final message reached Slack, and how many calls
+were given up on. Fails if any shutdown took longer than shutdown_timeout
+plus a second.
+
+Usage:
+    python -m benchmarks.shutdown [--latency 0.5 2 10] [--shutdown-timeout 5]
+        [--runtime rtmbot|async]
+"""
+import argparse
+import os.path
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.episodes import ASYNC_CHILD, CHILD, ROOT, RTMBOT_TICK, \
+    Episode, MessageClassifier
+from benchmarks.stubs import BOT_USER_ID, CHANNEL_ID, DummyLiquidSoap, \
+    StubRtmServer, StubServer, write_settings
+
+
+def stop_once_slow(server, rtm_server, classifier, folder, latency, args):
+    """Run silence-notifier, and stop it while Slack answers after latency
+    seconds.
+
+    Returns:
+        Tuple of seconds from SIGTERM until the process exited, whether the
+        final message arrived, and the number of calls given up on.
+    """
+    episode = Episode(server, rtm_server, classifier, [], args)
+    liquidsoap = DummyLiquidSoap(folder)
+    settings_file = write_settings(
+        folder, server.url, liquidsoap.script,
+        "sec_per_min: 1.0\nshutdown_timeout: {}\n".format(
+            args.shutdown_timeout
+        )
+    )
+    child = ASYNC_CHILD if args.runtime == "async" else CHILD
+    code = child.format(
+        settings=settings_file,
+        cache=os.path.join(folder, ".settings_cache"),
+        url=server.url,
+        tick=RTMBOT_TICK
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    try:
+        episode.wait_for(lambda: episode.posts("warnings"))
+        server.latency = latency
+        for number, user in enumerate(("U1", "U2")):
+            rtm_server.send_event({
+                "type": "message",
+                "channel": CHANNEL_ID,
+                "user": user,
+                "text": "<@{}> fikser".format(BOT_USER_ID),
+                "ts": "{}.{:06d}".format(int(time.time()), number),
+            })
+        # Let the mentions be handled before stopping
+        time.sleep(2 * RTMBOT_TICK)
+        stopped = time.monotonic()
+        process.send_signal(signal.SIGTERM)
+        _, errors = process.communicate(timeout=60)
+        exit_seconds = time.monotonic() - stopped
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        liquidsoap.stop()
+        server.latency = 0.0
+
+    # Calls still being answered arrive once the latency has passed
+    time.sleep(latency)
+    dropped = errors.decode().count("Gave up on Slack call at shutdown")
+    # The final message may have been merged with others
+    arrived = any(
+        classifier.classify(line) == "sound"
+        for _, method, params in episode.calls()
+        if method == "chat.postMessage"
+        for line in params.get("text", "").splitlines()
+    )
+    return exit_seconds, arrived, dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, nargs="+",
+                        default=[0.5, 2.0, 10.0],
+                        help="seconds Slack takes to answer each call")
+    parser.add_argument("--shutdown-timeout", type=float, default=5.0,
+                        help="the shutdown_timeout setting to use")
+    parser.add_argument("--runtime", choices=("rtmbot", "async"),
+                        default="rtmbot",
+                        help="how to run silence-notifier")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(ROOT, "settings_default.yaml")) as fp:
+        classifier = MessageClassifier(yaml.safe_load(fp)["messages"])
+    server = StubServer().start()
+    rtm_server = StubRtmServer().start()
+    server.rtm_server = rtm_server
+    failed = False
+    try:
+        for latency in args.latency:
+            with tempfile.TemporaryDirectory() as folder:
+                exit_seconds, arrived, dropped = stop_once_slow(
+                    server, rtm_server, classifier, folder, latency, args
+                )
+            print("latency {:5.1f} s: exited after {:5.2f} s, final message "
+                  "{}, {} calls dropped".format(
+                      latency, exit_seconds,
+                      "arrived" if arrived else "lost", dropped
+                  ))
+            if exit_seconds > args.shutdown_timeout + 1.0:
+                failed = True
+    finally:
+        server.stop()
+
+    if failed:
+        print("FAIL: shutdown took longer than shutdown_timeout")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
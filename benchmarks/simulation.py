@@ -0,0 +1,72 @@
+"""Benchmark simulating silences with silence_notifier.simulation.
+
+Makes up silences of random lengths, some of which someone volunteers for, and
+runs them through the warning state machine on simulated time with the default
+settings and with warnings given less often. Prints how many silences were
+simulated per second, and the warnings each setting gave.
+
+Usage:
+    python -m benchmarks.simulation [--silences 5000]
+"""
+import argparse
+import random
+import sys
+import time
+
+from silence_notifier.settings import Settings
+from silence_notifier.simulation import Simulator, summarize
+
+
+def make_silences(number):
+    """Return list of made up silences, as expected by run_episode."""
+    rng = random.Random(0)
+    silences = []
+    for _ in range(number):
+        duration = rng.expovariate(1 / 1200)
+        events = []
+        if rng.random() < 0.6:
+            events.append({"at": rng.uniform(0, duration),
+                           "message": "U{:03d}".format(rng.randrange(40))})
+        if rng.random() < 0.2:
+            events.append({"at": rng.uniform(0, duration), "stop": True})
+            events.append({"at": rng.uniform(0, duration), "start": True})
+        silences.append({
+            "duration": duration,
+            "show": "Show {}".format(rng.randrange(60)),
+            "ending": "not_running" if rng.random() < 0.1 else "sound",
+            "events": sorted(events, key=lambda event: event["at"]),
+        })
+    return silences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--silences", type=int, default=5000,
+                        help="number of silences to simulate")
+    args = parser.parse_args(argv)
+
+    silences = make_silences(args.silences)
+    defaults = Settings(Settings.process_config_path("settings_default.yaml"))
+    for name, overrides in (
+            ("default settings", {}),
+            ("warnings after 1, 5 and 15 minutes", {
+                "warning_delays": [1, 4, 10],
+                "max_warning_delay": 30})):
+        settings = defaults.derive(overrides)
+        start = time.perf_counter()
+        simulator = Simulator(settings)
+        results = [simulator.run_episode(silence) for silence in silences]
+        elapsed = time.perf_counter() - start
+        summary = summarize(results, simulator.settings)
+        print("{}: {:.0f} silences per second, {:.2f} warnings and {:.2f} "
+              "Slack calls per silence".format(
+                  name,
+                  len(results) / elapsed,
+                  summary["warnings_per_silence"],
+                  summary["slack_calls_per_silence"]
+              ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
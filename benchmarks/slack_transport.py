@@ -0,0 +1,91 @@
+"""Benchmark the persistent connections of SlackWebClient.
+
+Starts a stub of the Slack Web API serving HTTPS with a self-signed
+certificate, and times chat.postMessage calls made over a new connection each
+time (what slackclient does), over a connection kept open between calls, and
+the first call made by a new client, with and without opening its connection
+ahead of time (as SilencePlugin does while starting).
+
+The stub runs locally, so the handshakes only cost CPU time here. Against
+Slack, each new connection also waits for two round trips over the network.
+
+Usage:
+    python -m benchmarks.slack_transport [--calls 500] [--first-calls 20]
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.stubs import CHANNEL_ID, StubServer, make_ssl_contexts
+from silence_notifier.slack_web import SlackWebClient
+
+
+def time_calls(client, num_calls):
+    """Return sorted list of milliseconds each call took."""
+    timings = []
+    for number in range(num_calls):
+        start = time.perf_counter()
+        data = client.api_call("chat.postMessage", channel=CHANNEL_ID,
+                               text="Advarsel {}".format(number))
+        timings.append((time.perf_counter() - start) * 1000)
+        assert data["ok"], data
+    return sorted(timings)
+
+
+def time_first_calls(url, client_context, num_clients, prewarm):
+    """Return sorted list of milliseconds the first call of a new client
+    took."""
+    timings = []
+    for _ in range(num_clients):
+        client = SlackWebClient("xoxb-benchmark", url, client_context)
+        if prewarm:
+            client.prewarm()
+            # The rest of the startup
+            time.sleep(0.05)
+        timings.extend(time_calls(client, 1))
+        client.close()
+    return sorted(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500,
+                        help="number of calls to time per connection kind")
+    parser.add_argument("--first-calls", type=int, default=20,
+                        help="number of new clients to time the first call of")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        server_context, client_context = make_ssl_contexts(folder)
+    server = StubServer(ssl_context=server_context).start()
+    url = server.url + "/api/"
+    try:
+        new_connections = SlackWebClient("xoxb-benchmark", url,
+                                         client_context)
+        new_connections.max_idle_connections = 0
+        kept_open = SlackWebClient("xoxb-benchmark", url, client_context)
+        results = [
+            ("new connection per call", time_calls(new_connections,
+                                                   args.calls)),
+            ("connection kept open", time_calls(kept_open, args.calls)),
+            ("first call, cold", time_first_calls(
+                url, client_context, args.first_calls, prewarm=False)),
+            ("first call, pre-warmed", time_first_calls(
+                url, client_context, args.first_calls, prewarm=True)),
+        ]
+        kept_open.close()
+        for name, timings in results:
+            print("{:<25} median {:6.2f} ms, p99 {:6.2f} ms".format(
+                name + ":",
+                statistics.median(timings),
+                timings[int(0.99 * (len(timings) - 1))]
+            ))
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
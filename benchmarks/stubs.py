@@ -0,0 +1,396 @@
+"""Local stand-ins for Slack, the Radio REST API and LiquidSoap, used by the
+benchmarks."""
+import base64
+import hashlib
+import json
+import os
+import os.path
+import select
+import shutil
+import signal
+import socket
+import ssl
+import struct
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+
+BOT_USER_ID = "UBOT"
+BOT_USER = "silence-notifier"
+CHANNEL_ID = "CSTUB"
+
+
+class StubServer:
+    """HTTP server answering like the Slack Web API and the Radio REST API.
+
+    Every call is recorded with the time it arrived, so benchmarks can tell
+    when messages reached "Slack".
+    """
+
+    def __init__(self, latency=0.0, ssl_context=None):
+        """
+        Args:
+            latency: Seconds to wait before answering each request, to
+                simulate a remote service.
+            ssl_context: Server side ssl.SSLContext to serve HTTPS with, like
+                the one returned by make_ssl_contexts.
+        """
+        self.latency = latency
+        self.rtm_server = None
+        self.calls = []
+        self._lock = threading.Lock()
+        self._ts = 1000000
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body are written separately. Waiting for the
+            # headers to be acknowledged before sending the body would make
+            # every request on a kept-alive connection take 40 ms.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._handle(self, self.path, dict())
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode()
+                params = {k: v[0] for k, v in parse_qs(body).items()}
+                stub._handle(self, self.path, params)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        scheme = "http"
+        if ssl_context is not None:
+            self.server.socket = ssl_context.wrap_socket(self.server.socket,
+                                                         server_side=True)
+            scheme = "https"
+        self.url = "{}://127.0.0.1:{}".format(scheme,
+                                              self.server.server_port)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def calls_to(self, method):
+        """Return the recorded calls to the given method."""
+        with self._lock:
+            return [call for call in self.calls if call[1] == method]
+
+    def _handle(self, handler, path, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if path.startswith("/api/"):
+            method = path[len("/api/"):]
+            with self._lock:
+                self.calls.append((time.time(), method, params))
+            data = self._slack_response(method, params)
+        elif path.startswith("/v2/sendinger/currentshows"):
+            with self._lock:
+                self.calls.append((time.time(), "currentshows", params))
+            data = self._current_shows()
+        else:
+            handler.send_error(404)
+            return
+
+        body = json.dumps(data).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        try:
+            handler.wfile.write(body)
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    def _slack_response(self, method, params):
+        if method == "auth.test":
+            return {"ok": True, "user_id": BOT_USER_ID, "user": BOT_USER}
+        if method == "rtm.connect" and self.rtm_server:
+            return {"ok": True, "url": self.rtm_server.url,
+                    "self": {"id": BOT_USER_ID, "name": BOT_USER}}
+        with self._lock:
+            self._ts += 1
+            ts = "{}.000100".format(self._ts)
+        message = {"text": params.get("text", "")}
+        if "thread_ts" in params:
+            message["thread_ts"] = params["thread_ts"]
+        return {"ok": True, "ts": ts, "channel": CHANNEL_ID,
+                "message": message}
+
+    @staticmethod
+    def _current_shows():
+        now = datetime.now().astimezone().replace(microsecond=0)
+
+        def show(title, start, end):
+            return {
+                "title": title,
+                "starttime": (now + start).isoformat(),
+                "endtime": (now + end).isoformat(),
+            }
+
+        return {
+            "previous": show("Morgenshow", timedelta(hours=-2),
+                             timedelta(hours=-1)),
+            "current": show("Benchmarkshow", timedelta(hours=-1),
+                            timedelta(hours=1)),
+            "next": show("Kveldshow", timedelta(hours=1), timedelta(hours=2)),
+        }
+
+
+def make_ssl_contexts(folder):
+    """Create a self-signed certificate for 127.0.0.1 in folder with openssl.
+
+    Returns:
+        Tuple of (server side ssl.SSLContext using the certificate, client
+        side ssl.SSLContext trusting it).
+    """
+    certfile = os.path.join(folder, "stub.crt")
+    keyfile = os.path.join(folder, "stub.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", keyfile, "-out", certfile],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(certfile, keyfile)
+    client_context = ssl.create_default_context(cafile=certfile)
+    return server_context, client_context
+
+
+class StubSlackClient:
+    """Minimal SlackClient calling the Web API of a StubServer."""
+
+    def __init__(self, url, token="xoxb-benchmark"):
+        self.url = url
+        self.token = token
+        self.server = None
+
+    def api_call(self, method, timeout=None, **kwargs):
+        kwargs["token"] = self.token
+        request = Request(
+            "{}/api/{}".format(self.url, method),
+            data=urlencode(kwargs).encode()
+        )
+        with urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode())
+
+
+class DummyLiquidSoap:
+    """A process which looks like LiquidSoap running a script."""
+
+    def __init__(self, folder):
+        self.script = os.path.join(folder, "radio.liq")
+        open(self.script, "w").close()
+        executable = os.path.join(folder, "liquidsoap")
+        shutil.copy("/bin/sh", executable)
+        # The shell is kept around (instead of exec-ing sleep) by the "true".
+        # In a session of its own, so stop can kill sleep along with it.
+        self.process = subprocess.Popen(
+            [executable, "-c", "sleep 3600; true", self.script],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+    def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+
+class FakeLiquidSoapServer:
+    """Server answering commands like LiquidSoap's telnet server.
+
+    The answer to each command is looked up in answers, which may be changed
+    while the server runs, for example to switch the source on air. Every
+    connection made is counted.
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.connections = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(8)
+        self.address = "127.0.0.1:{}".format(self._sock.getsockname()[1])
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            conn, _ = self._sock.accept()
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,),
+                             daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile("rb") as reader:
+            for line in reader:
+                command = line.decode().strip()
+                if command in ("quit", "exit"):
+                    conn.sendall(b"Bye!\r\n")
+                    return
+                answer = self.answers.get(
+                    command,
+                    'ERROR: unknown command, type "help" to get a list of '
+                    'commands.'
+                )
+                try:
+                    conn.sendall(answer.encode() + b"\r\nEND\r\n")
+                except OSError:
+                    return
+
+
+def write_settings(folder, server_url, script, extra=""):
+    """Write a settings.yaml for use with the stubs, returning its path."""
+    path = os.path.join(folder, "settings.yaml")
+    with open(path, "w") as fp:
+        fp.write('channel: "#benchmark"\n')
+        fp.write('rr_api: "{}"\n'.format(server_url))
+        fp.write('liquidsoap_script: "{}"\n'.format(script))
+        fp.write('episode_snapshot_file: "{}"\n'.format(
+            os.path.join(folder, ".episode_snapshot")
+        ))
+        fp.write('identity_cache_file: "{}"\n'.format(
+            os.path.join(folder, ".identity_cache")
+        ))
+        fp.write('episode_history_file: "{}"\n'.format(
+            os.path.join(folder, ".episode_history")
+        ))
+        fp.write(extra)
+    return path
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class StubRtmServer:
+    """Websocket server pushing RTM events, like Slack's RTM API."""
+
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(8)
+        self.url = "ws://127.0.0.1:{}/".format(self._sock.getsockname()[1])
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def send_event(self, event):
+        """Send event (a dictionary) to every connected client."""
+        payload = json.dumps(event).encode()
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x81, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x81, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x81, 127, length)
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(header + payload)
+                except OSError:
+                    # The client has gone away
+                    self._clients.remove(client)
+                    client.close()
+
+    def _accept(self):
+        while True:
+            conn, _ = self._sock.accept()
+            request = b""
+            while b"\r\n\r\n" not in request:
+                request += conn.recv(4096)
+            key = None
+            for line in request.decode().split("\r\n"):
+                if line.lower().startswith("sec-websocket-key:"):
+                    key = line.split(":", 1)[1].strip()
+            accept = base64.b64encode(
+                hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+            ).decode()
+            with self._lock:
+                # Registered together with the handshake, so no event sent
+                # after the client sees the connection is missed
+                conn.sendall((
+                    "HTTP/1.1 101 Switching Protocols\r\n"
+                    "Upgrade: websocket\r\n"
+                    "Connection: Upgrade\r\n"
+                    "Sec-WebSocket-Accept: {}\r\n\r\n".format(accept)
+                ).encode())
+                self._clients.append(conn)
+            self.send_event({"type": "hello"})
+
+
+class StubRtmClient:
+    """Minimal websocket client reading events from a StubRtmServer."""
+
+    def __init__(self, url):
+        host, port = url[len("ws://"):].rstrip("/").split(":")
+        self._sock = socket.create_connection((host, int(port)))
+        key = base64.b64encode(os.urandom(16)).decode()
+        self._sock.sendall((
+            "GET / HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\n"
+            "Connection: Upgrade\r\nSec-WebSocket-Key: {}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n".format(host, key)
+        ).encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            response += self._sock.recv(1)
+        self._buffer = b""
+
+    def read_events(self, timeout=0.0):
+        """Return list of the events received, waiting at most timeout
+        seconds for the first one."""
+        readable, _, _ = select.select([self._sock], [], [], timeout)
+        if readable:
+            data = self._sock.recv(65536)
+            if not data:
+                raise ConnectionError("RTM connection closed")
+            self._buffer += data
+
+        events = []
+        while len(self._buffer) >= 2:
+            length = self._buffer[1] & 0x7f
+            offset = 2
+            if length == 126:
+                if len(self._buffer) < 4:
+                    break
+                length = struct.unpack("!H", self._buffer[2:4])[0]
+                offset = 4
+            elif length == 127:
+                if len(self._buffer) < 10:
+                    break
+                length = struct.unpack("!Q", self._buffer[2:10])[0]
+                offset = 10
+            if len(self._buffer) < offset + length:
+                break
+            payload = self._buffer[offset:offset + length]
+            self._buffer = self._buffer[offset + length:]
+            events.append(json.loads(payload.decode()))
+        return events
@@ -0,0 +1,408 @@
+"""Small HTTP/1.1 and websocket client built on asyncio streams.
+
+Only what we need from Slack and the Radio REST API is supported: GET and POST
+requests, responses with a Content-Length or chunked body, and websocket text
+messages. Connections are kept open and reused for later requests to the same
+host, so only the first request pays for the TCP and TLS handshakes.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import ssl
+import struct
+from urllib.parse import urlencode, urlsplit
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class HTTPError(Exception):
+    """The server answered with an error status."""
+
+
+class Response:
+    """Response to an HTTP request, read in full."""
+
+    def __init__(self, url, status_code, headers, content):
+        """
+        Args:
+            url: The requested URL.
+            status_code: The status code, like 200.
+            headers: Dictionary of the headers, with lower case names.
+            content: The body, as bytes.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        """Return the body decoded as JSON."""
+        return json.loads(self.content.decode("utf-8"))
+
+    def raise_for_status(self):
+        """Raise HTTPError if the server answered with an error status."""
+        if self.status_code >= 400:
+            raise HTTPError("{} error for {}".format(self.status_code,
+                                                     self.url))
+
+
+class AsyncHTTPSession:
+    """HTTP client keeping connections open between requests.
+
+    Connections which are not in use are kept per host, so requests made one
+    after another share one connection, while requests made at the same time
+    get one each.
+    """
+    # Idle connections kept per host
+    max_idle_connections = 4
+
+    def __init__(self, ssl_context=None):
+        """
+        Args:
+            ssl_context: The ssl.SSLContext used for HTTPS. Defaults to one
+                verifying certificates the usual way, created when needed.
+        """
+        self._ssl_context = ssl_context
+        self._idle = dict()
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    async def request(self, method, url, data=None, headers=None,
+                      timeout=None) -> Response:
+        """Make an HTTP request and read the whole response.
+
+        Args:
+            method: The HTTP method, like GET.
+            url: The URL to request.
+            data: Dictionary sent as a form, or bytes sent as they are.
+            headers: Dictionary of extra headers.
+            timeout: Seconds to wait for the response, or None to wait
+                forever.
+
+        A connection which the server has closed since it was last used is
+        replaced by a new one, but only if sending the request on it failed.
+
+        Raises:
+            OSError if the connection failed, asyncio.TimeoutError on timeout,
+            asyncio.IncompleteReadError if the connection closed before the
+            whole response was read.
+        """
+        return await asyncio.wait_for(
+            self._request(method, url, data, headers or dict()),
+            timeout
+        )
+
+    async def get(self, url, timeout=None) -> Response:
+        return await self.request("GET", url, timeout=timeout)
+
+    async def post(self, url, data=None, timeout=None) -> Response:
+        return await self.request("POST", url, data=data, timeout=timeout)
+
+    async def _request(self, method, url, data, headers):
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname,
+                  parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + ("?" + parts.query if parts.query
+                                        else "")
+        if isinstance(data, dict):
+            data = urlencode(data).encode()
+            headers.setdefault("Content-Type",
+                               "application/x-www-form-urlencoded")
+        request = self._format_request(method, target, parts.netloc, data,
+                                       headers)
+
+        while True:
+            reader, writer, reused = await self._connection(origin)
+            try:
+                writer.write(request)
+                await writer.drain()
+            except ConnectionError:
+                writer.close()
+                if reused:
+                    # The server closed the idle connection, try a new one
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            break
+        # Once sent, the server may have acted on the request (say, posted a
+        # message), so it is not sent again when no answer comes
+        try:
+            response, keep_alive = await self._read_response(url, reader)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._release(origin, reader, writer)
+        else:
+            writer.close()
+        return response
+
+    @staticmethod
+    def _format_request(method, target, host, data, headers):
+        lines = ["{} {} HTTP/1.1".format(method, target),
+                 "Host: {}".format(host),
+                 "Accept-Encoding: identity"]
+        if data is not None or method == "POST":
+            lines.append("Content-Length: {}".format(len(data or b"")))
+        lines.extend("{}: {}".format(name, value)
+                     for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode() + (data or b"")
+
+    async def _connection(self, origin):
+        """Return (reader, writer, whether it was used before) for origin."""
+        idle = self._idle.get(origin)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = origin
+        reader, writer = await asyncio.open_connection(
+            host,
+            port,
+            ssl=self.ssl_context if scheme == "https" else None
+        )
+        return reader, writer, False
+
+    def _release(self, origin, reader, writer):
+        idle = self._idle.setdefault(origin, [])
+        if len(idle) < self.max_idle_connections:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    @staticmethod
+    async def _read_response(url, reader):
+        """Return the response and whether the connection can be reused."""
+        status_line = await reader.readuntil(b"\r\n")
+        version, status_code = status_line.decode("latin-1").split(" ", 2)[:2]
+        headers = await _read_headers(reader)
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0],
+                           16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            content = b"".join(chunks)
+            length_known = True
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+            length_known = True
+        else:
+            content = await reader.read()
+            length_known = False
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+        return (Response(url, int(status_code), headers, content),
+                keep_alive and length_known)
+
+    def close(self):
+        """Close the idle connections."""
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_headers(reader):
+    """Read header lines up to the empty line, returning them as a
+    dictionary with lower case names."""
+    headers = dict()
+    while True:
+        line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+        if not line:
+            return headers
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+
+
+class BlockingSession:
+    """Front for an AsyncHTTPSession with the interface of requests.Session,
+    for code running in other threads than the event loop."""
+
+    def __init__(self, session, loop):
+        """
+        Args:
+            session: The AsyncHTTPSession to make the requests with.
+            loop: The event loop session is used from.
+        """
+        self.session = session
+        self.loop = loop
+
+    def get(self, url, timeout=None) -> Response:
+        return self.run(self.session.get(url, timeout=timeout))
+
+    def post(self, url, data=None, timeout=None) -> Response:
+        return self.run(self.session.post(url, data=data, timeout=timeout))
+
+    def run(self, coroutine):
+        """Run coroutine on the event loop, and wait for its result.
+
+        Raises:
+            RuntimeError if called from the event loop itself, which would
+            wait for itself forever.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coroutine.close()
+            raise RuntimeError("Cannot block the event loop to wait for it")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+class WebSocketClosed(ConnectionError):
+    """The websocket connection was closed."""
+
+
+class WebSocket:
+    """Client side of a websocket connection, exchanging text messages."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, url, ssl_context=None, timeout=10.0):
+        """Open a websocket connection to url (ws:// or wss://).
+
+        Raises:
+            OSError if the connection or handshake failed,
+            asyncio.TimeoutError on timeout.
+        """
+        return await asyncio.wait_for(cls._connect(url, ssl_context),
+                                      timeout)
+
+    @classmethod
+    async def _connect(cls, url, ssl_context):
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        if secure and ssl_context is None:
+            ssl_context = ssl.create_default_context()
+        reader, writer = await asyncio.open_connection(
+            parts.hostname,
+            parts.port or (443 if secure else 80),
+            ssl=ssl_context if secure else None
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        target = (parts.path or "/") + ("?" + parts.query if parts.query
+                                        else "")
+        writer.write((
+            "GET {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: {}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n".format(target, parts.netloc,
+                                                       key)
+        ).encode())
+        try:
+            await writer.drain()
+            status_line = await reader.readuntil(b"\r\n")
+            headers = await _read_headers(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        expected = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        if status_line.split(b" ")[1:2] != [b"101"] or \
+                headers.get("sec-websocket-accept") != expected:
+            writer.close()
+            raise ConnectionError("Websocket handshake with {} failed: {}"
+                                  .format(parts.netloc, status_line))
+        return cls(reader, writer)
+
+    async def receive(self) -> str:
+        """Return the next text message, answering pings while waiting.
+
+        Raises:
+            WebSocketClosed if the connection was closed.
+        """
+        fragments = []
+        while True:
+            try:
+                header = await self._reader.readexactly(2)
+                fin, opcode = header[0] & 0x80, header[0] & 0x0f
+                length = header[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack(
+                        "!H", await self._reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack(
+                        "!Q", await self._reader.readexactly(8))[0]
+                if header[1] & 0x80:
+                    mask = await self._reader.readexactly(4)
+                    payload = _mask(await self._reader.readexactly(length),
+                                    mask)
+                else:
+                    payload = await self._reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                self._writer.close()
+                raise WebSocketClosed("Websocket connection lost") from e
+
+            if opcode == 0x8:
+                self._send_frame(0x8, payload[:2])
+                self._writer.close()
+                raise WebSocketClosed("Websocket closed by the server")
+            elif opcode == 0x9:
+                self._send_frame(0xa, payload)
+            elif opcode in (0x0, 0x1, 0x2):
+                fragments.append(payload)
+                if fin:
+                    return b"".join(fragments).decode("utf-8")
+            else:
+                logging.debug("Ignoring websocket frame with opcode {}"
+                              .format(opcode))
+
+    async def send(self, text):
+        """Send a text message."""
+        self._send_frame(0x1, text.encode("utf-8"))
+        await self._writer.drain()
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        if not self._writer.is_closing():
+            self._writer.write(header + mask + _mask(payload, mask))
+
+    def close(self):
+        """Close the connection."""
+        if not self._writer.is_closing():
+            self._send_frame(0x8, struct.pack("!H", 1000))
+            self._writer.close()
+
+
+def _mask(payload, mask):
+    """Return payload XORed with the 4 byte mask, as websocket frames are."""
+    length = len(payload)
+    if not length:
+        return payload
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^
+            int.from_bytes(repeated, "big")).to_bytes(length, "big")
@@ -0,0 +1,380 @@
+"""Run SilencePlugin on an asyncio event loop, instead of with RtmBot.
+
+RtmBot reads the RTM websocket and asks the jobs whether they are due in a
+loop with a 0.1 second sleep, so events and warnings wait for the next pass,
+and the process wakes up ten times a second even when nothing happens. Here,
+the RTM connection is read by a task which handles each event as soon as it
+arrives, and the warnings of each stream are given by a task sleeping until
+the next one is due. LiquidSoap exiting is noticed through its pidfd on the
+loop. Nothing runs while we wait.
+
+The states and the rest of the plugin are used through the same interface as
+under RtmBot. Since they block (on locks, on waiting for the show schedule),
+they are run in one worker thread per stream, which also keeps the events of
+each stream in order. HTTP requests to Slack and the Radio REST API, including
+those made by the plugin's threads, are made on the loop with an
+AsyncHTTPSession.
+
+Usage (from the silence-notifier folder, with rtmbot.conf there):
+    python -m silence_notifier.async_runtime [-c rtmbot.conf]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from silence_notifier.async_http import AsyncHTTPSession, BlockingSession, \
+    HTTPError, WebSocket
+from silence_notifier.slack_web import encode_arguments
+
+
+class AsyncSlackClient:
+    """Slack Web API client making its calls with an AsyncHTTPSession.
+
+    Coroutines use call. Code running in other threads uses api_call, which
+    works like SlackClient.api_call.
+    """
+    base_url = "https://slack.com/api/"
+    timeout = 30.0
+
+    def __init__(self, token, session, loop, base_url=None):
+        """
+        Args:
+            token: The Slack token to authenticate with.
+            session: The AsyncHTTPSession to make requests with.
+            loop: The event loop session is used from.
+            base_url: Location of the Web API, ending in a slash.
+        """
+        self.token = token
+        self.session = session
+        self.base_url = base_url or self.base_url
+        self._blocking = BlockingSession(session, loop)
+
+    async def call(self, method, timeout=None, **kwargs) -> dict:
+        """Call the Web API method with the given arguments.
+
+        Returns:
+            The decoded response. When rate limited, this has "ok" set to
+            False, "error" set to "ratelimited" and the Retry-After header
+            under "headers", like SlackClient's.
+        """
+        kwargs["token"] = self.token
+        response = await self.session.post(
+            self.base_url + method,
+            data=encode_arguments(kwargs),
+            timeout=timeout or self.timeout
+        )
+        if response.status_code == 429:
+            return {
+                "ok": False,
+                "error": "ratelimited",
+                "headers": {"Retry-After": response.headers.get(
+                    "retry-after", "1"
+                )},
+            }
+        response.raise_for_status()
+        return response.json()
+
+    def api_call(self, method, timeout=None, **kwargs) -> dict:
+        """Call the Web API method, blocking until it is done.
+
+        Must not be used from the event loop.
+        """
+        return self._blocking.run(self.call(method, timeout, **kwargs))
+
+
+class RtmClient:
+    """Connection to Slack's RTM API, reconnected when lost."""
+    # Seconds without hearing from Slack before we ping it. When twice this
+    # has passed, the connection is taken to be dead.
+    ping_interval = 30.0
+    max_reconnect_delay = 60.0
+
+    def __init__(self, slack_client, on_event):
+        """
+        Args:
+            slack_client: The AsyncSlackClient used to connect.
+            on_event: Function called on the event loop with each event
+                received, as a dictionary.
+        """
+        self.slack_client = slack_client
+        self.on_event = on_event
+        self._last_received = 0.0
+        self._ping_id = 0
+
+    async def run(self):
+        """Receive events until cancelled.
+
+        Whatever goes wrong, we connect again, waiting longer and longer
+        between attempts while it keeps going wrong.
+        """
+        delay = 1.0
+        while True:
+            try:
+                data = await self.slack_client.call("rtm.connect")
+                if not data.get("ok"):
+                    raise ConnectionError("rtm.connect failed: {}".format(
+                        data.get("error")
+                    ))
+                websocket = await WebSocket.connect(data["url"])
+            except (OSError, ValueError, EOFError, asyncio.TimeoutError,
+                    HTTPError):
+                logging.exception("Could not connect to Slack's RTM API, "
+                                  "retrying in {:.0f} seconds".format(delay))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            try:
+                await self._receive(websocket)
+                delay = 1.0
+                continue
+            except ConnectionError:
+                logging.warning("Lost the connection to Slack's RTM API, "
+                                "reconnecting")
+                delay = 1.0
+                continue
+            except Exception:
+                logging.exception("Error while receiving from Slack's RTM "
+                                  "API, reconnecting in {:.0f} seconds"
+                                  .format(delay))
+            finally:
+                websocket.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _receive(self, websocket):
+        """Hand each event received on websocket to on_event, until the
+        connection is lost or Slack asks us to reconnect."""
+        self._last_received = time.monotonic()
+        keepalive = asyncio.ensure_future(self._keep_alive(websocket))
+        try:
+            while True:
+                event = json.loads(await websocket.receive())
+                self._last_received = time.monotonic()
+                if event.get("type") == "goodbye":
+                    logging.info("Slack asked us to reconnect")
+                    return
+                try:
+                    self.on_event(event)
+                except Exception:
+                    logging.exception("Error while handling RTM event")
+        finally:
+            keepalive.cancel()
+
+    async def _keep_alive(self, websocket):
+        """Ping Slack when the connection has been quiet, and close it if
+        Slack does not answer."""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            quiet = time.monotonic() - self._last_received
+            if quiet >= 2 * self.ping_interval:
+                logging.warning("No answer from Slack's RTM API")
+                websocket.close()
+                return
+            if quiet >= self.ping_interval:
+                self._ping_id += 1
+                await websocket.send(json.dumps({
+                    "id": self._ping_id,
+                    "type": "ping",
+                }))
+
+
+class AsyncRuntime:
+    """Run SilencePlugin until SIGTERM, or until the silence is over outside
+    of daemon mode."""
+    # Seconds to wait before running a job again after it failed
+    job_retry_delay = 1.0
+
+    def __init__(self, token, slack_api_url=None):
+        """
+        Args:
+            token: The Slack token to use.
+            slack_api_url: Location of the Slack Web API, if not Slack's.
+        """
+        self.token = token
+        self.slack_api_url = slack_api_url
+        self.loop = None
+        self.plugin = None
+        self.slack_client = None
+        self._executors = dict()
+        self._stop_reason = None
+        self._stopped = None
+
+    async def run(self):
+        """Run the plugin, returning once the program should exit."""
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.loop.add_signal_handler(signal.SIGTERM, self._stop, "sigterm")
+        session = AsyncHTTPSession()
+        self.slack_client = AsyncSlackClient(
+            self.token,
+            session,
+            self.loop,
+            self.slack_api_url
+        )
+        tasks = []
+        try:
+            # Created in a worker thread, since it makes blocking calls to
+            # Slack which need the loop to be running
+            self.plugin = await self.loop.run_in_executor(
+                None,
+                self._create_plugin,
+                BlockingSession(session, self.loop)
+            )
+            for monitor in self.plugin.monitors.values():
+                self._executors[monitor.name] = ThreadPoolExecutor(
+                    1,
+                    thread_name_prefix="stream-" + monitor.name
+                )
+                monitor.on_exit = functools.partial(
+                    self.loop.call_soon_threadsafe, self._stop, "exit"
+                )
+            await self.loop.run_in_executor(None, self.plugin.register_jobs)
+
+            for job in self.plugin.jobs:
+                executor = self._executors[job.stream]
+                job.use_event_loop(self.loop, executor)
+                tasks.append(asyncio.ensure_future(
+                    self._run_job(job, executor)
+                ))
+            rtm = RtmClient(self.slack_client, self._handle_event)
+            tasks.append(asyncio.ensure_future(rtm.run()))
+            for task in tasks:
+                task.add_done_callback(_log_task_exit)
+
+            await self._stopped.wait()
+            if self._stop_reason == "sigterm":
+                logging.debug("Reacting to SIGTERM")
+                await self.loop.run_in_executor(None,
+                                                self.plugin.handle_sigterm)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            self.loop.remove_signal_handler(signal.SIGTERM)
+            session.close()
+
+    def _create_plugin(self, http_session):
+        from silence_notifier.rtmbot_plugin import SilencePlugin
+        return SilencePlugin(
+            slack_client=self.slack_client,
+            http_session=http_session,
+            handle_signals=False
+        )
+
+    def _stop(self, reason):
+        if self._stop_reason is None:
+            self._stop_reason = reason
+            self._stopped.set()
+        else:
+            logging.debug("Asked to stop ({}), but we are already stopping"
+                          .format(reason))
+
+    def _handle_event(self, data):
+        """Handle an RTM event, on the event loop.
+
+        Events are filtered right away, and the relevant ones are handed to
+        the worker thread of the stream they are about.
+        """
+        self.plugin.catch_all(data)
+        if data.get("type") != "message" or \
+                not self.plugin.relevant_message(data):
+            return
+        logging.debug("Relevant message: " + data["text"])
+        monitor = self.plugin.route_message(data)
+        if monitor is None:
+            logging.debug("No stream to pass the message on to")
+            return
+        self.loop.run_in_executor(
+            self._executors[monitor.name],
+            _log_exceptions,
+            monitor.handle_message,
+            data
+        )
+
+    async def _run_job(self, job, executor):
+        """Run job each time a warning is due, sleeping in between."""
+        wake_up = asyncio.Event()
+        job.on_schedule_changed = functools.partial(
+            self.loop.call_soon_threadsafe, wake_up.set
+        )
+        while True:
+            wake_up.clear()
+            delay = job.seconds_until_due()
+            if delay is not None and delay <= 0:
+                succeeded = await self.loop.run_in_executor(
+                    executor,
+                    _log_exceptions,
+                    job.run,
+                    self.slack_client
+                )
+                if not succeeded:
+                    await asyncio.sleep(self.job_retry_delay)
+                continue
+            # Not wait_for, which loses a cancellation arriving just as
+            # wake_up is set, leaving us to wait forever
+            waiter = asyncio.ensure_future(wake_up.wait())
+            try:
+                await asyncio.wait([waiter], timeout=delay)
+            finally:
+                waiter.cancel()
+
+
+def _log_task_exit(task):
+    """Log that task, which should run until cancelled, has stopped."""
+    if task.cancelled():
+        return
+    logging.error("{} stopped".format(task.get_coro().__qualname__),
+                  exc_info=task.exception())
+
+
+def _log_exceptions(function, *args):
+    """Call function, logging any exception instead of raising it.
+
+    Returns:
+        True if function returned, False if it raised an exception.
+    """
+    try:
+        function(*args)
+        return True
+    except Exception:
+        logging.exception("Error in " + getattr(function, "__qualname__",
+                                                 repr(function)))
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--config", default="rtmbot.conf",
+                        help="the rtmbot.conf to read the Slack token, log "
+                             "file and debug flag from")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as fp:
+        config = yaml.safe_load(fp)
+    # The same logging as RtmBot sets up
+    logging.basicConfig(
+        filename=config.get("LOGFILE", "rtmbot.log"),
+        level=logging.DEBUG if config.get("DEBUG") else logging.INFO,
+        format="%(asctime)s %(message)s"
+    )
+    runtime = AsyncRuntime(config["SLACK_TOKEN"])
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Detect silence by analysing the audio of the stream ourselves.
+
+This needs NumPy, which is not required otherwise: pip install numpy
+"""
+import logging
+import subprocess
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RingBuffer:
+    """Fixed size buffer of interleaved 16 bit samples, from which whole
+    windows are taken out."""
+
+    def __init__(self, num_frames, channels):
+        self.channels = channels
+        self._data = numpy.zeros((num_frames, channels), dtype=numpy.int16)
+        self._start = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def write(self, frames):
+        """Append frames (array of shape (n, channels)) to the buffer.
+
+        If the buffer overflows, the oldest frames are discarded.
+        """
+        size = len(self._data)
+        if len(frames) >= size:
+            frames = frames[-size:]
+            self._start = 0
+            self._length = 0
+        num_frames = len(frames)
+
+        end = (self._start + self._length) % size
+        first = min(num_frames, size - end)
+        self._data[end:end + first] = frames[:first]
+        self._data[:num_frames - first] = frames[first:]
+
+        overflow = max(0, self._length + num_frames - size)
+        self._start = (self._start + overflow) % size
+        self._length += num_frames - overflow
+
+    def read(self, num_frames):
+        """Remove and return the num_frames oldest frames."""
+        size = len(self._data)
+        indices = (self._start + numpy.arange(num_frames)) % size
+        frames = self._data[indices]
+        self._start = (self._start + num_frames) % size
+        self._length -= num_frames
+        return frames
+
+
+class AudioSilenceDetector:
+    """Tell when the audio goes silent and when the sound comes back.
+
+    Raw PCM (signed 16 bit little endian, interleaved channels) is read into a
+    ring buffer, and the RMS level of each window is computed for all channels
+    at once. Silence starts once every channel has been below
+    silence_threshold_db for silence_after seconds, and stops once any channel
+    has been above sound_threshold_db for sound_after seconds. Having the sound
+    threshold above the silence threshold keeps quiet passages hovering around
+    one threshold from flapping between silence and sound.
+
+    When the audio ends (say, ffmpeg loses the stream), the stream is not
+    monitored until the source is opened or the command run again, which is
+    retried after restart_delay seconds, doubled each time it ends again soon
+    after, up to max_restart_delay.
+    """
+    restart_delay = 1.0
+    max_restart_delay = 60.0
+
+    def __init__(self, on_silence_start, on_silence_stop, sample_rate=44100,
+                 channels=2, window=0.5, silence_threshold_db=-50.0,
+                 sound_threshold_db=-40.0, silence_after=10.0,
+                 sound_after=2.0):
+        """
+        Args:
+            on_silence_start: Function called with no arguments when the
+                silence starts.
+            on_silence_stop: Function called with no arguments when the
+                silence stops.
+            sample_rate: Frames per second of the audio.
+            channels: Number of interleaved channels in the audio.
+            window: Length (in seconds) of the windows levels are computed for.
+            silence_threshold_db: Level (in dBFS) under which audio is silent.
+            sound_threshold_db: Level (in dBFS) over which audio is sound.
+            silence_after: Seconds of silence before the silence starts.
+            sound_after: Seconds of sound before the silence stops.
+        """
+        if numpy is None:
+            raise ImportError("The audio silence detector requires NumPy")
+        if sound_threshold_db < silence_threshold_db:
+            raise ValueError("sound_threshold_db must not be lower than "
+                             "silence_threshold_db")
+
+        self.on_silence_start = on_silence_start
+        self.on_silence_stop = on_silence_stop
+        self.channels = channels
+        self.window_frames = max(1, int(sample_rate * window))
+        self.silence_windows = max(1, round(silence_after / window))
+        self.sound_windows = max(1, round(sound_after / window))
+        self.silence_threshold = self._db_to_amplitude(silence_threshold_db)
+        self.sound_threshold = self._db_to_amplitude(sound_threshold_db)
+
+        self.silent = False
+        self._streak = 0
+        self._buffer_frames = self.window_frames * 8
+        self._buffer = RingBuffer(self._buffer_frames, channels)
+        self._thread = None
+        self._process = None
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _db_to_amplitude(db):
+        """Convert dBFS to amplitude, as a fraction of full scale."""
+        return 10 ** (db / 20)
+
+    def levels(self, frames):
+        """Return RMS level of each channel, as fractions of full scale.
+
+        Args:
+            frames: Array of shape (n, channels) of 16 bit samples.
+        """
+        samples = frames.astype(numpy.float32) / 32768.0
+        return numpy.sqrt(numpy.mean(numpy.square(samples), axis=0))
+
+    def feed(self, data):
+        """Analyse the bytes of PCM in data, and fire events as appropriate.
+
+        Incomplete frames must not be split between calls.
+        """
+        frames = numpy.frombuffer(data, dtype="<i2").reshape(-1, self.channels)
+        step = self.window_frames
+        for i in range(0, len(frames), step):
+            self._buffer.write(frames[i:i + step])
+            while len(self._buffer) >= step:
+                self._handle_window(self.levels(self._buffer.read(step)))
+
+    def _handle_window(self, rms):
+        """Update the state using the RMS levels of one window."""
+        if self.silent:
+            is_other_state = bool((rms > self.sound_threshold).any())
+            needed = self.sound_windows
+        else:
+            is_other_state = bool((rms < self.silence_threshold).all())
+            needed = self.silence_windows
+
+        self._streak = self._streak + 1 if is_other_state else 0
+        if self._streak < needed:
+            return
+
+        self._streak = 0
+        self.silent = not self.silent
+        if self.silent:
+            logging.debug("Audio detector: silence started")
+            self.on_silence_start()
+        else:
+            logging.debug("Audio detector: silence stopped")
+            self.on_silence_stop()
+
+    def run(self, fp):
+        """Analyse PCM read from the file object fp until it ends."""
+        frame_size = 2 * self.channels
+        chunk_size = self.window_frames * frame_size
+        rest = b""
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                return
+            data = rest + data
+            usable = len(data) - len(data) % frame_size
+            rest = data[usable:]
+            try:
+                self.feed(data[:usable])
+            except Exception:
+                logging.exception("Error in the audio silence detector")
+
+    def start(self, source=None, command=None):
+        """Analyse audio in a background thread.
+
+        Args:
+            source: Path to a file or FIFO with raw PCM.
+            command: List with a command (like ffmpeg) which writes raw PCM to
+                its standard output. Used if source is not given.
+        """
+        self._thread = threading.Thread(
+            target=self._run_source,
+            args=(source, command),
+            name="audio-detector",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop analysing audio."""
+        self._stopped.set()
+        process = self._process
+        if process is not None:
+            process.kill()
+
+    def _run_source(self, source, command):
+        """Analyse the audio, reading it again whenever it ends."""
+        delay = self.restart_delay
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                self._read_source(source, command)
+            except Exception:
+                logging.exception("Could not read the audio for the silence "
+                                  "detector")
+            if self._stopped.is_set():
+                return
+            if time.monotonic() - started > self.max_restart_delay:
+                # It ran for a good while, so this is not the same problem
+                delay = self.restart_delay
+            logging.error("The audio for the silence detector has ended, the "
+                          "stream is not monitored until it is read again in "
+                          "{:.0f} seconds".format(delay))
+            # Do not mix the old audio with the new
+            self._streak = 0
+            self._buffer = RingBuffer(self._buffer_frames, self.channels)
+            if self._stopped.wait(delay):
+                return
+            delay = min(delay * 2, self.max_restart_delay)
+
+    def _read_source(self, source, command):
+        """Analyse the audio from source or command until it ends."""
+        if source:
+            with open(source, "rb") as fp:
+                self.run(fp)
+            return
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        try:
+            self.run(self._process.stdout)
+        finally:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
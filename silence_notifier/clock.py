@@ -0,0 +1,38 @@
+"""Where the warning state machine gets the time from.
+
+StreamMonitor, SilenceNotifyJob and WarningScheduler ask a Clock for the time
+and for delayed calls instead of using the time and threading modules
+directly, so the simulator in silence_notifier.simulation can run them on
+simulated time.
+"""
+import threading
+import time
+
+
+class Clock:
+    """The real time."""
+
+    def monotonic(self) -> float:
+        """Return the time on a clock which never goes backwards, like
+        time.monotonic."""
+        return time.monotonic()
+
+    def time(self) -> float:
+        """Return seconds since the epoch, like time.time."""
+        return time.time()
+
+    def call_later(self, seconds, function, *args):
+        """Call function with args once seconds have passed, in a thread of
+        its own.
+
+        Returns:
+            Object with a cancel method, which stops the call if it has not
+            been made yet.
+        """
+        timer = threading.Timer(seconds, function, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+SYSTEM_CLOCK = Clock()
@@ -1,21 +1,60 @@
 import logging
 import random
+import threading
+import time
 
-import requests
-from slackclient import SlackClient
+from silence_notifier import metrics, startup_trace
+from silence_notifier.show_schedule import ShowSchedule
+from silence_notifier.slack_sender import SlackSender
+from silence_notifier.status_message import StatusMessage
 
 
 class Communicator:
     """Class handling communication to Slack, and with Radio REST API."""
     channel_mention = "<!channel>"
-    current_shows_uri = "/v2/sendinger/currentshows"
 
-    def __init__(self, slack_client: SlackClient, settings):
+    def __init__(self, slack_client, settings, sender=None,
+                 schedule=None, identity_cache=None, notifiers=None):
+        """
+        Args:
+            slack_client: The SlackClient to use.
+            settings: Instance of settings.Settings.
+            sender: The SlackSender to queue messages on. Give the same one to
+                all communicators, so they share Slack's rate limits.
+            schedule: The ShowSchedule to look up shows in. Created if not
+                given.
+            identity_cache: The identity_cache.IdentityCache to look up who
+                we are logged in as in, instead of asking Slack, if any.
+            notifiers: The notifiers.NotifierFanout to hand the messages
+                posted on Slack to, if any.
+        """
         self.slack_client = slack_client
         self.settings = settings
+        self.sender = sender or SlackSender(slack_client)
+        self.schedule = schedule or ShowSchedule(
+            self.settings.rr_api,
+            max_age=self.settings.show_schedule_max_age,
+            timezone=self.settings.rr_api_timezone
+        )
         self.first_message_ts = None
+        self.channel_id = None
+        self._posted_ts = set()
         self.username = None
         self.userid = None
+        self.identity_cache = identity_cache
+        self.notifiers = notifiers
+        # Called without arguments whenever a message has been posted
+        self.on_posted = None
+        # Called without arguments if the cached identity turned out wrong,
+        # once userid and username are corrected
+        self.on_identity_changed = None
+        self.status_message = StatusMessage(
+            self.sender,
+            self.settings.channel,
+            on_posted=self._record_message_ts
+        )
+        self._status_updated_at = None
+        self._warning_level = None
 
     def send(self, message_type, num_minutes=None, reply_to=None, **kwargs):
         """Send the given message type to Slack.
@@ -35,20 +74,10 @@ class Communicator:
             kwargs: The text string will have {key} replaced with value for
                 each key=value given to this method.
         """
-        possible_unformatted_message = self.settings.messages[message_type]
-
-        if num_minutes is not None:
-            matching_messages = []
-            max_from_minute = 0
-            for from_minute, messages in possible_unformatted_message.items():
-                if from_minute <= num_minutes:
-                    if self.settings.messages['warnings_cumulative']:
-                        matching_messages.extend(messages)
-                    elif from_minute >= max_from_minute:
-                        matching_messages = messages
-                        max_from_minute = from_minute
-
-            possible_unformatted_message = matching_messages
+        possible_unformatted_message = self.settings.message_catalog.lookup(
+            message_type,
+            num_minutes
+        )
 
         unformatted_message = random.choice(possible_unformatted_message)
 
@@ -56,10 +85,11 @@ class Communicator:
             channel=self.channel_mention,
             **kwargs
         )
-        self.send_custom(formatted_message, reply_to)
+        self.send_custom(formatted_message, reply_to, message_type)
 
-    def send_custom(self, message, reply_to=None):
-        """Send the given message to Slack.
+    def send_custom(self, message, reply_to=None, message_type=None):
+        """Queue the given message for sending to Slack, and hand it to the
+        notifiers.
 
         Args:
             message: The text to post on Slack.
@@ -67,7 +97,10 @@ class Communicator:
                 message whose information is provided in this argument. Its
                 format is equal to the dictionary received in message events
                 from Slack.
+            message_type: The type of message, used by the notifiers to pick
+                the messages they deliver.
         """
+        start = time.perf_counter()
         other_message_args = {
             'channel': self.settings.channel,
         }
@@ -80,29 +113,59 @@ class Communicator:
             other_message_args['thread_ts'] = thread_ts
             other_message_args['channel'] = reply_to['channel']
 
-        data = self.slack_client.api_call(
+        self.sender.submit(
             "chat.postMessage",
+            on_success=self._record_message_ts,
             text=message,
             as_user=True,
             **other_message_args
         )
-        assert data['ok'], data
+        if self.notifiers is not None:
+            self.notifiers.notify(message, message_type)
+        metrics.SEND_CUSTOM_SECONDS.observe(time.perf_counter() - start)
+
+    def _record_message_ts(self, data):
+        """Remember the ts of messages once they have been sent (and of the
+        messages they reply to), and the id of the channel they were sent to.
+        """
         if not self.first_message_ts:
             self.first_message_ts = data['ts']
+            startup_trace.finish(self.settings.startup_trace_file)
+            # Whichever stream posts first checks the cached identity
+            cached = self.identity_cache and self.identity_cache.claim_check()
+            if cached:
+                threading.Thread(
+                    target=self.verify_identity,
+                    args=(cached,),
+                    name="identity-check",
+                    daemon=True
+                ).start()
+        thread_ts = data.get('message', {}).get('thread_ts')
+        if thread_ts:
+            self._posted_ts.add(thread_ts)
+        else:
+            self.channel_id = data['channel']
+        self._posted_ts.add(data['ts'])
+        if self.on_posted:
+            self.on_posted()
+
+    def has_posted(self, ts):
+        """Return True if we have posted the message with the given ts, or
+        replied to it, during this silence."""
+        return ts in self._posted_ts
 
     def thumb_up_msg(self, received_message):
-        """React with :+1: to the given message.
+        """Queue a :+1: reaction to the given message.
 
         Args:
             received_message: The dictionary received from a Slack message event
         """
-        data = self.slack_client.api_call(
+        self.sender.submit(
             "reactions.add",
             name="+1",
             timestamp=received_message["ts"],
             channel=received_message["channel"]
         )
-        assert data['ok'], data
 
     def get_userid(self):
         """Get the userid of the logged in bot."""
@@ -117,30 +180,160 @@ class Communicator:
         return self.username
 
     def populate_identity(self):
-        """Populate username and userid of the logged in bot."""
-        data = self.slack_client.api_call(
-            "auth.test"
-        )
+        """Populate username and userid of the logged in bot.
+
+        When the identity cache knows who we are, Slack is not asked. The
+        cached identity is instead checked against Slack in the background,
+        once the first message has been posted.
+        """
+        start = time.perf_counter()
+        try:
+            cached = None
+            if self.identity_cache:
+                cached = self.identity_cache.get(self.slack_client.token)
+            if cached:
+                self.userid, self.username = cached
+                return
+
+            data = self.slack_client.api_call(
+                "auth.test"
+            )
+        finally:
+            metrics.POPULATE_IDENTITY_SECONDS.observe(
+                time.perf_counter() - start
+            )
         assert data['ok'], data
         self.userid = data['user_id']
         self.username = data['user']
+        if self.identity_cache:
+            self.identity_cache.put(
+                self.slack_client.token,
+                self.userid,
+                self.username
+            )
+
+    def verify_identity(self, cached):
+        """Check the cached identity against Slack, and correct it if wrong.
+
+        Args:
+            cached: Tuple of the userid and username from the identity cache.
+        """
+        try:
+            data = self.slack_client.api_call("auth.test")
+        except Exception:
+            logging.exception("Could not verify the cached identity")
+            return
+        if not data.get('ok'):
+            logging.error("Could not verify the cached identity: {}".format(
+                data
+            ))
+            self.identity_cache.remove()
+            return
+
+        identity = (data['user_id'], data['user'])
+        if identity == tuple(cached):
+            return
+        logging.warning("The cached identity {} was wrong, we are {}".format(
+            tuple(cached),
+            identity
+        ))
+        self.userid, self.username = identity
+        self.identity_cache.put(self.slack_client.token, *identity)
+        if self.on_identity_changed:
+            self.on_identity_changed()
+
+    def reset(self):
+        """Forget about messages sent during an earlier silence."""
+        self.first_message_ts = None
+        self._posted_ts = set()
+        self.status_message.reset()
+        self.status_message.channel = self.settings.channel
+        self._status_updated_at = None
+        self._warning_level = None
+
+    def update_status(self, minutes, users, over=False, periodic=False):
+        """Show how the silence is going in the status message.
+
+        Args:
+            minutes: Number of minutes the silence has lasted.
+            users: Mentions of the responsible users, or None if there are
+                none.
+            over: Set to True when the silence is over.
+            periodic: Set to True when only the number of minutes has
+                changed. The message is then only edited if
+                status_message_interval minutes have passed since the last
+                time.
+        """
+        if periodic and self._status_updated_at is not None and \
+                minutes - self._status_updated_at < \
+                self.settings.status_message_interval:
+            return
+        self._status_updated_at = minutes
+
+        template = self.settings.message_catalog.lookup(
+            "status_over" if over else "status"
+        )[0]
+        self.status_message.set_text(template.format(
+            channel=self.channel_mention,
+            min=minutes,
+            show=self.get_current_show(),
+            users=users or "ingen"
+        ))
+
+    def is_escalation(self, minutes):
+        """Return True if a warning at minutes is the first one using the
+        messages of its threshold, and should thus be posted anew when using
+        the status message."""
+        level = self.settings.message_catalog.threshold("warnings", minutes)
+        if level == self._warning_level:
+            return False
+        self._warning_level = level
+        return True
+
+    def snapshot(self):
+        """Return dictionary with what we know about the messages posted
+        during this silence, for use with restore."""
+        return {
+            "first_message_ts": self.first_message_ts,
+            "channel_id": self.channel_id,
+            "posted_ts": sorted(self._posted_ts),
+            "status_ts": self.status_message.ts,
+            "status_channel_id": self.status_message.channel_id,
+            "warning_level": self._warning_level,
+        }
+
+    def restore(self, snapshot):
+        """Continue a silence from the dictionary returned by snapshot."""
+        self.first_message_ts = snapshot["first_message_ts"]
+        self.channel_id = snapshot["channel_id"]
+        self._posted_ts = set(snapshot["posted_ts"])
+        self.status_message.restore(
+            snapshot.get("status_ts"),
+            snapshot.get("status_channel_id")
+        )
+        self._warning_level = snapshot.get("warning_level")
 
     def get_first_message_ts(self):
         """Get the ts of the first message sent by us in this session."""
         return self.first_message_ts
 
     def get_current_show(self):
-        """Get the name of the show currently active on radio."""
+        """Get the name of the show currently active on radio.
+
+        The show is looked up in the locally indexed schedule, so this does not
+        wait on the Radio REST API.
+        """
+        start = time.perf_counter()
         try:
-            r = requests.get(self.settings.rr_api + self.current_shows_uri, timeout=10.0)
-            r.raise_for_status()
-        except Exception as e:
-            logging.exception("Error occurred while retrieving current show")
+            show = self.schedule.current_show()
+        except LookupError:
             return "Ukjent (ikke kontakt med pappagorg, eller APIet er nede)"
-        data = r.json()
-        try:
-            return data["current"]["title"]
-        except KeyError:
+        finally:
+            metrics.GET_CURRENT_SHOW_SECONDS.observe(
+                time.perf_counter() - start
+            )
+        if show is None:
             logging.error("No show found when trying to obtain current show")
             return "Ukjent (ingen sending i autoavvikler)"
+        return show
 
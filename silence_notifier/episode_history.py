@@ -0,0 +1,468 @@
+"""Append-only history of the silences, and statistics over it.
+
+Each silence is written as a fixed size binary record when it is over, so
+years of history take a few hundred kilobytes and can be read straight from a
+memory map. The history consists of three files:
+
+    <name>          A header followed by one record per silence, in the order
+                    the silences ended. Since the records are sorted by end
+                    time, a time range is found with a binary search.
+    <name>.strings  Stream names, show titles and user IDs, one JSON string per
+                    line. Records refer to them by line number, starting at 1,
+                    with 0 meaning none.
+    <name>.idx      The show index: one (show, record number) pair per record,
+                    so the silences during one show are found without reading
+                    the others.
+
+Records are written by a thread of their own, so recording a silence never
+waits for the disk.
+
+Usage (from the silence-notifier folder):
+    python -m silence_notifier.episode_history [--file .episode_history]
+        [--since 2024-01-01] [--until 2025-01-01] [--show TITLE]
+        [--stream NAME] [--by show|stream|hour|weekday|month|ending|volunteer]
+        [--json]
+"""
+import argparse
+import bisect
+import datetime
+import json
+import logging
+import mmap
+import os
+import queue
+import statistics
+import struct
+import sys
+import threading
+import time
+
+from silence_notifier.settings import Settings
+
+MAGIC = b"SNEH"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+# Start and end (seconds since the epoch), seconds until the first volunteer
+# (-1 if nobody volunteered), stream, show, number of warnings, ending, number
+# of volunteers and the first MAX_VOLUNTEERS of them
+MAX_VOLUNTEERS = 4
+RECORD = struct.Struct("<ddfIIHBB{}I".format(MAX_VOLUNTEERS))
+INDEX_ENTRY = struct.Struct("<II")
+
+# How a silence ended. "short" silences were over before the first warning,
+# "crash" silences were left behind by a process which never came back.
+ENDINGS = ("sound", "not_running", "crash", "short")
+
+
+class EpisodeHistory:
+    """Writer appending silences to the history.
+
+    Silences are queued by record and written by a background thread, which
+    is started when first needed.
+    """
+    # Records waiting to be written before new ones are dropped
+    max_queued = 1000
+    # Seconds to wait for the records to be written before exiting
+    flush_timeout = 2.0
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._queue = queue.Queue(self.max_queued)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # Set up by the writer thread
+        self._strings = None
+        self._strings_fp = None
+        self._log = None
+        self._index = None
+        self._num_records = 0
+        self._last_ended = 0.0
+
+    def record(self, stream, started, ended, ending, warnings=0,
+               volunteers=(), first_volunteer=None, show=None,
+               schedule=None):
+        """Queue a silence for writing, without waiting for it.
+
+        Args:
+            stream: Name of the stream.
+            started: When the silence started, in seconds since the epoch.
+            ended: When the silence ended, in seconds since the epoch.
+            ending: How the silence ended, one of ENDINGS.
+            warnings: Number of warnings given.
+            volunteers: User IDs of everyone who took responsibility, in the
+                order they did.
+            first_volunteer: Seconds from the start until the first of them
+                did, or None.
+            show: Title of the show on air when the silence started.
+            schedule: ShowSchedule to look the show up in, when show is not
+                given. This is done by the writer thread, since the schedule
+                may have to be fetched first.
+        """
+        entry = (stream, started, ended, ending, warnings, list(volunteers),
+                 first_volunteer, show, schedule)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            logging.warning("Too many silences waiting to be written to {}, "
+                            "dropping the one on {}".format(self.filename,
+                                                            stream))
+            return
+        self._ensure_thread()
+
+    def flush(self, timeout):
+        """Wait up to timeout seconds for the queued silences to be written.
+
+        Returns:
+            True if they were written in time.
+        """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        self._ensure_thread()
+        return done.wait(timeout)
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._write_forever,
+                    name="episode-history",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _write_forever(self):
+        try:
+            self._open()
+        except (OSError, ValueError):
+            logging.exception("Could not open " + self.filename +
+                              ", silences will not be recorded")
+            self._log = None
+        while True:
+            entry = self._queue.get()
+            if isinstance(entry, threading.Event):
+                entry.set()
+                continue
+            if self._log is None:
+                continue
+            try:
+                self._write(*entry)
+            except Exception:
+                logging.exception("Could not write silence to " +
+                                  self.filename)
+
+    def _open(self):
+        """Open the files for appending, cutting off anything left half
+        written by a crash."""
+        self._strings = dict()
+        strings_file = self.filename + ".strings"
+        with open(strings_file, "a+b") as fp:
+            fp.seek(0)
+            data = fp.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            if len(complete) < len(data):
+                fp.truncate(len(complete))
+        for number, line in enumerate(complete.splitlines(), 1):
+            self._strings[json.loads(line.decode("utf-8"))] = number
+        self._strings_fp = open(strings_file, "ab")
+
+        self._log = open(self.filename, "a+b")
+        self._log.seek(0)
+        header = self._log.read(HEADER.size)
+        if not header:
+            self._log.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self._log.flush()
+        elif header != HEADER.pack(MAGIC, VERSION, RECORD.size):
+            self._log.close()
+            raise ValueError("{} is not a silence history of version {}"
+                             .format(self.filename, VERSION))
+        size = self._log.seek(0, os.SEEK_END)
+        self._num_records = (size - HEADER.size) // RECORD.size
+        self._log.truncate(HEADER.size + self._num_records * RECORD.size)
+        if self._num_records:
+            self._log.seek(HEADER.size + (self._num_records - 1) * RECORD.size)
+            self._last_ended = RECORD.unpack(self._log.read(RECORD.size))[1]
+        self._log.seek(0, os.SEEK_END)
+
+        self._index = open(self.filename + ".idx", "a+b")
+        size = self._index.seek(0, os.SEEK_END)
+        indexed = min(size // INDEX_ENTRY.size, self._num_records)
+        self._index.truncate(indexed * INDEX_ENTRY.size)
+        self._index.seek(0, os.SEEK_END)
+        # Index the records written just before a crash
+        for number in range(indexed, self._num_records):
+            self._log.seek(HEADER.size + number * RECORD.size)
+            show = RECORD.unpack(self._log.read(RECORD.size))[4]
+            self._index.write(INDEX_ENTRY.pack(show, number))
+        self._log.seek(0, os.SEEK_END)
+        self._index.flush()
+
+    def _string_id(self, text):
+        """Return the number of text in the strings file, adding it if new."""
+        if text is None:
+            return 0
+        number = self._strings.get(text)
+        if number is None:
+            number = len(self._strings) + 1
+            self._strings_fp.write(json.dumps(text).encode("utf-8") + b"\n")
+            self._strings[text] = number
+        return number
+
+    def _write(self, stream, started, ended, ending, warnings, volunteers,
+               first_volunteer, show, schedule):
+        if show is None and schedule is not None:
+            try:
+                show = schedule.current_show(started)
+            except LookupError:
+                pass
+        # Keep the records sorted by end time, even if the clock is set back
+        ended = max(ended, self._last_ended)
+        volunteer_ids = [self._string_id(user)
+                         for user in volunteers[:MAX_VOLUNTEERS]]
+        volunteer_ids += [0] * (MAX_VOLUNTEERS - len(volunteer_ids))
+        show_id = self._string_id(show)
+        record = RECORD.pack(
+            started,
+            ended,
+            -1.0 if first_volunteer is None else first_volunteer,
+            self._string_id(stream),
+            show_id,
+            min(warnings, 0xffff),
+            ENDINGS.index(ending) + 1,
+            min(len(volunteers), 0xff),
+            *volunteer_ids
+        )
+        # The strings go first, so a record never refers to a missing one
+        self._strings_fp.flush()
+        self._log.write(record)
+        self._log.flush()
+        self._index.write(INDEX_ENTRY.pack(show_id, self._num_records))
+        self._index.flush()
+        self._num_records += 1
+        self._last_ended = ended
+
+
+class _EndTimes:
+    """Sequence of the end times of the records in a memory map, for bisect.
+    """
+
+    def __init__(self, data, num_records):
+        self._data = data
+        self._num_records = num_records
+
+    def __len__(self):
+        return self._num_records
+
+    def __getitem__(self, number):
+        return RECORD.unpack_from(self._data,
+                                  HEADER.size + number * RECORD.size)[1]
+
+
+class HistoryReader:
+    """Read-only view of the history, memory mapped."""
+
+    def __init__(self, filename):
+        """
+        Raises:
+            OSError if the history could not be read, ValueError if it is not
+            a history we understand.
+        """
+        self.filename = filename
+        with open(filename + ".strings", "rb") as fp:
+            self.strings = [None] + [json.loads(line.decode("utf-8"))
+                                     for line in fp if line.endswith(b"\n")]
+        self._string_ids = {text: number
+                            for number, text in enumerate(self.strings)}
+        self._string_ids.pop(None)
+        self._data = _map(filename)
+        if self._data[:HEADER.size] != HEADER.pack(MAGIC, VERSION,
+                                                   RECORD.size):
+            raise ValueError("{} is not a silence history of version {}"
+                             .format(filename, VERSION))
+        self.num_records = (len(self._data) - HEADER.size) // RECORD.size
+        try:
+            self._index = _map(filename + ".idx")
+        except FileNotFoundError:
+            self._index = b""
+
+    def find_range(self, since=None, until=None):
+        """Return (first, end) record numbers of the silences which ended
+        within [since, until)."""
+        end_times = _EndTimes(self._data, self.num_records)
+        first = 0 if since is None else bisect.bisect_left(end_times, since)
+        end = self.num_records if until is None else \
+            bisect.bisect_left(end_times, until)
+        return first, end
+
+    def records(self, since=None, until=None, show=None):
+        """Return iterable of the raw records (tuples of RECORD's fields) of
+        the silences which ended within [since, until), optionally only those
+        during the show with the given title."""
+        first, end = self.find_range(since, until)
+        if show is None:
+            return RECORD.iter_unpack(memoryview(self._data)[
+                HEADER.size + first * RECORD.size:
+                HEADER.size + end * RECORD.size
+            ])
+        show_id = self.string_id(show)
+        if show_id is None:
+            return []
+        usable = len(self._index) // INDEX_ENTRY.size * INDEX_ENTRY.size
+        return [
+            RECORD.unpack_from(self._data, HEADER.size + number * RECORD.size)
+            for entry_show, number in INDEX_ENTRY.iter_unpack(
+                memoryview(self._index)[:usable]
+            )
+            if entry_show == show_id and first <= number < end
+        ]
+
+    def string_id(self, text):
+        """Return the number records use to refer to text, or None if no
+        record does."""
+        return self._string_ids.get(text)
+
+    def close(self):
+        for data in (self._data, self._index):
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _map(filename):
+    """Return the contents of filename, memory mapped if it is not empty."""
+    with open(filename, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+GROUPINGS = {
+    "show": lambda record, strings: strings[record[4]] or "(unknown)",
+    "stream": lambda record, strings: strings[record[3]],
+    "hour": lambda record, strings: "{:02d}".format(
+        time.localtime(record[0]).tm_hour),
+    "weekday": lambda record, strings: time.strftime(
+        "%u %a", time.localtime(record[0])),
+    "month": lambda record, strings: time.strftime(
+        "%Y-%m", time.localtime(record[0])),
+    "ending": lambda record, strings: ENDINGS[record[6] - 1],
+}
+
+
+def summarize(records, strings, by=None):
+    """Aggregate records into statistics.
+
+    Args:
+        records: Iterable of raw records, as returned by
+            HistoryReader.records.
+        strings: HistoryReader.strings.
+        by: Name of a grouping in GROUPINGS, "volunteer" to group by who
+            volunteered (counting each silence once per volunteer), or None
+            for one group with everything.
+
+    Returns:
+        Dictionary mapping group names to dictionaries with statistics.
+    """
+    groups = dict()
+    for record in records:
+        if by is None:
+            keys = ("all",)
+        elif by == "volunteer":
+            keys = [strings[user] for user in
+                    record[8:8 + min(record[7], MAX_VOLUNTEERS)]] or \
+                ["(none)"]
+        else:
+            keys = (GROUPINGS[by](record, strings),)
+        for key in keys:
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = ([], [], [0] * len(ENDINGS), [0])
+            durations, to_volunteer, endings, warnings = group
+            durations.append(record[1] - record[0])
+            if record[2] >= 0:
+                to_volunteer.append(record[2])
+            endings[record[6] - 1] += 1
+            warnings[0] += record[5]
+
+    summary = dict()
+    for key, (durations, to_volunteer, endings, warnings) in groups.items():
+        durations.sort()
+        summary[key] = {
+            "silences": len(durations),
+            "total_minutes": sum(durations) / 60,
+            "median_minutes": statistics.median(durations) / 60,
+            "p90_minutes": durations[int(0.9 * (len(durations) - 1))] / 60,
+            "warnings": warnings[0],
+            "volunteered_share": len(to_volunteer) / len(durations),
+            "median_minutes_to_volunteer":
+                statistics.median(to_volunteer) / 60 if to_volunteer
+                else None,
+            "endings": dict(zip(ENDINGS, endings)),
+        }
+    return summary
+
+
+def _parse_date(text):
+    return time.mktime(datetime.datetime.strptime(text, "%Y-%m-%d")
+                       .timetuple())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file",
+                        default=Settings.process_config_path(".episode_history"),
+                        help="the history to read (episode_history_file)")
+    parser.add_argument("--since", type=_parse_date,
+                        help="only silences ending on or after this date "
+                             "(YYYY-MM-DD)")
+    parser.add_argument("--until", type=_parse_date,
+                        help="only silences ending before this date "
+                             "(YYYY-MM-DD)")
+    parser.add_argument("--show", help="only silences during this show")
+    parser.add_argument("--stream", help="only silences on this stream")
+    parser.add_argument("--by", choices=sorted(GROUPINGS) + ["volunteer"],
+                        help="group the statistics")
+    parser.add_argument("--json", action="store_true",
+                        help="print the statistics as JSON")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        reader = HistoryReader(args.file)
+    except (OSError, ValueError) as e:
+        print("Could not read {}: {}".format(args.file, e), file=sys.stderr)
+        return 1
+    try:
+        records = reader.records(args.since, args.until, args.show)
+        if args.stream is not None:
+            stream_id = reader.string_id(args.stream)
+            records = (record for record in records
+                       if record[3] == stream_id)
+        summary = summarize(records, reader.strings, args.by)
+    finally:
+        reader.close()
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+        return 0
+    print("{:<30} {:>7} {:>9} {:>7} {:>7} {:>8} {:>7} {:>10}".format(
+        "", "silences", "total min", "median", "p90", "warnings", "volunt.",
+        "to volunt."))
+    for key in sorted(summary):
+        stats = summary[key]
+        to_volunteer = stats["median_minutes_to_volunteer"]
+        print("{:<30} {:>7} {:>9.0f} {:>7.1f} {:>7.1f} {:>8} {:>6.0%} {:>10}"
+              .format(str(key)[:30], stats["silences"],
+                      stats["total_minutes"], stats["median_minutes"],
+                      stats["p90_minutes"], stats["warnings"],
+                      stats["volunteered_share"],
+                      "-" if to_volunteer is None
+                      else "{:.1f}".format(to_volunteer)))
+    print("Aggregated in {:.1f} ms".format(elapsed * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class EpisodeSnapshot:
+    """Small file with the state of the ongoing silences.
+
+    The file is replaced atomically every time something changes, so a process
+    restarted after a crash can continue each silence where it stopped: in the
+    same state, with the same people responsible and the same warning
+    schedule, and without repeating what was already posted.
+
+    While there are silences, the file is touched every heartbeat_interval
+    seconds. A snapshot which has not been touched for max_age seconds was left
+    by a process stopped long ago (for example killed when the silence ended),
+    and is not resumed. Its episodes are kept in abandoned instead, so they can
+    be recorded as such.
+    """
+    heartbeat_interval = 15.0
+    max_age = 60.0
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._episodes = dict()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        # Episodes of a snapshot too old to resume, and when it was last
+        # touched (seconds since the epoch)
+        self.abandoned = dict()
+        self.abandoned_at = None
+
+    def load(self) -> dict:
+        """Return dictionary mapping the names of streams to their saved
+        episodes, left by the process running before us."""
+        try:
+            modified = os.stat(self.filename).st_mtime
+        except FileNotFoundError:
+            return dict()
+        except OSError:
+            logging.exception("Could not read " + self.filename)
+            return dict()
+
+        try:
+            with open(self.filename) as fp:
+                episodes = json.load(fp)["episodes"]
+        except (OSError, ValueError, KeyError):
+            logging.exception("Could not read " + self.filename)
+            if time.time() - modified > self.max_age:
+                self._remove()
+            return dict()
+
+        age = time.time() - modified
+        if age > self.max_age:
+            logging.info("Ignoring episode snapshot last written {:.0f} "
+                         "seconds ago".format(age))
+            self.abandoned = episodes
+            self.abandoned_at = modified
+            self._remove()
+            return dict()
+        with self._lock:
+            self._episodes = dict(episodes)
+        return episodes
+
+    def save(self, stream, create_episode):
+        """Save the episode of stream.
+
+        Args:
+            stream: Name of the stream.
+            create_episode: Function returning a JSON serializable dictionary
+                describing the episode, or None if there is none any longer.
+                It is called while holding the lock of the snapshot, so saves
+                and clears happen in the order they see the episode.
+        """
+        with self._lock:
+            episode = create_episode()
+            if episode is None:
+                return
+            self._episodes[stream] = episode
+            self._write()
+            self._ensure_heartbeat()
+
+    def clear(self, stream):
+        """Forget the episode of stream, now that it is over."""
+        with self._lock:
+            if self._episodes.pop(stream, None) is not None:
+                self._write()
+
+    def _write(self):
+        """Replace the file with the current episodes, or remove it when there
+        are none."""
+        if not self._episodes:
+            self._remove()
+            return
+        temporary = self.filename + ".tmp"
+        try:
+            with open(temporary, "w") as fp:
+                json.dump({"episodes": self._episodes}, fp)
+            os.replace(temporary, self.filename)
+        except (OSError, TypeError, ValueError):
+            logging.exception("Could not write " + self.filename)
+
+    def _remove(self):
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logging.exception("Could not remove " + self.filename)
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(
+                target=self._touch_periodically,
+                name="episode-snapshot",
+                daemon=True
+            )
+            self._heartbeat.start()
+
+    def _touch_periodically(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                if not self._episodes:
+                    continue
+                try:
+                    os.utime(self.filename)
+                except OSError:
+                    logging.exception("Could not touch " + self.filename)
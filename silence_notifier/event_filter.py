@@ -0,0 +1,77 @@
+import re
+
+from silence_notifier import metrics
+
+# Message subtypes which are written by a person, and may mention us
+HUMAN_SUBTYPES = {None, "thread_broadcast", "file_share", "me_message"}
+
+
+class EventFilter:
+    """Decide which RTM events are meant for us, as cheaply as possible.
+
+    RtmBot hands us every message posted in the workspace. Most of them can be
+    rejected by looking at a couple of fields, so the text is only searched
+    for a mention when the message is of a kind written by people, we are
+    watching a silence, and it was posted where our messages are (in the
+    channel, or as a reply to one of them). Mentions are recognized by the
+    exact form Slack encodes them in, so user ids which merely contain our id
+    or are written in plain text do not count.
+    """
+
+    def __init__(self, userid, monitors):
+        """
+        Args:
+            userid: Our user id on Slack.
+            monitors: Dictionary of the StreamMonitor of each stream, which
+                know whether there is a silence, and where they have posted.
+        """
+        self.userid = userid
+        self.monitors = monitors
+        self._mention = re.compile(
+            r"<@{}(?:\|[^>]*)?>".format(re.escape(userid))
+        )
+        self._results = {
+            result: metrics.RTM_EVENTS.labels(result)
+            for result in ("subtype", "own", "inactive", "channel", "thread",
+                           "no_mention", "accepted")
+        }
+
+    def accept(self, data) -> bool:
+        """Return True if data is a message mentioning us which we should act
+        on.
+
+        Args:
+            data: The message event received from Slack.
+        """
+        result = self._check(data)
+        self._results[result].inc()
+        return result == "accepted"
+
+    def _check(self, data):
+        """Return "accepted", or the reason data was rejected."""
+        if data.get("subtype") not in HUMAN_SUBTYPES:
+            return "subtype"
+        if data.get("user") == self.userid:
+            return "own"
+
+        active = [monitor for monitor in self.monitors.values()
+                  if monitor.is_active()]
+        if not active:
+            return "inactive"
+
+        channels = {monitor.communicator.channel_id for monitor in active}
+        if None not in channels and data.get("channel") not in channels:
+            # We know where our messages are, and this is somewhere else
+            return "channel"
+
+        thread_ts = data.get("thread_ts")
+        if thread_ts and thread_ts != data.get("ts") and not any(
+                monitor.communicator.has_posted(thread_ts)
+                for monitor in active):
+            # A reply in someone else's thread
+            return "thread"
+
+        text = data.get("text")
+        if not text or not self._mention.search(text):
+            return "no_mention"
+        return "accepted"
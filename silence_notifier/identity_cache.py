@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+def fingerprint(token):
+    """Return a fingerprint identifying token, without revealing it."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+class IdentityCache:
+    """File remembering who the bot is logged in as.
+
+    The identity is stored together with the fingerprint of the token used, so
+    a new token is never mistaken for the old one. Only the identity of the
+    latest token is kept.
+
+    The communicators of all streams share one cache, which makes sure the
+    identity it hands out is checked against Slack only once.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Identity returned by get, until claim_check hands it out
+        self._unchecked = None
+        self._checked = False
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """Return (userid, username) stored for token, or None."""
+        try:
+            with open(self.filename) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logging.exception("Could not read " + self.filename)
+            return None
+        if data.get("fingerprint") != fingerprint(token):
+            return None
+        try:
+            identity = data["user_id"], data["user"]
+        except KeyError:
+            return None
+        with self._lock:
+            if not self._checked:
+                self._unchecked = identity
+        return identity
+
+    def claim_check(self):
+        """Return the identity get has handed out, if it is yet to be checked
+        against Slack, or None.
+
+        Only the first call after get returns it, so the caller is the one to
+        check it, once per process.
+        """
+        with self._lock:
+            identity, self._unchecked = self._unchecked, None
+            if identity is not None:
+                self._checked = True
+        return identity
+
+    def put(self, token, userid, username):
+        """Store the identity belonging to token, replacing any other."""
+        temporary = self.filename + ".tmp"
+        try:
+            with open(temporary, "w") as fp:
+                json.dump({
+                    "fingerprint": fingerprint(token),
+                    "user_id": userid,
+                    "user": username,
+                }, fp)
+            os.replace(temporary, self.filename)
+        except OSError:
+            logging.exception("Could not write " + self.filename)
+
+    def remove(self):
+        """Forget the stored identity."""
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logging.exception("Could not remove " + self.filename)
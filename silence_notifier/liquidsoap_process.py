@@ -1,21 +1,67 @@
+import logging
+import os
+import select
+import threading
+import time
 import warnings
 
-import psutil
 import os.path
 
+from silence_notifier import metrics
+from silence_notifier.proc_index import ProcIndex
+
 
 class LiquidSoapProcess:
     """Class representing one running LiquidSoap process"""
 
+    # Shared between instances, so scripts are only resolved once per process
+    _proc_index = None
+
     def __init__(self, script_path):
-        self.proc = self._find_ls_process(script_path)
+        start = time.perf_counter()
+        try:
+            self.proc = self._find_ls_process(script_path)
+        finally:
+            metrics.PROCESS_DISCOVERY_SECONDS.observe(
+                time.perf_counter() - start
+            )
 
     def is_running(self):
         """Check if the LiquidSoap process we saw when initializing still runs.
         """
-        return self.proc.is_running()
+        start = time.perf_counter()
+        try:
+            return self.proc.is_running()
+        finally:
+            metrics.PROCESS_CHECK_SECONDS.observe(time.perf_counter() - start)
+
+    def watch(self, on_exit, loop=None, executor=None):
+        """Call on_exit as soon as the LiquidSoap process exits.
+
+        Args:
+            on_exit: Function taking no arguments. It is called from a
+                background thread.
+            loop: Event loop to wait on, instead of a thread of our own.
+            executor: Executor on_exit is run in when waiting on loop.
+                Defaults to the loop's default executor.
+
+        Returns:
+            The started ProcessWatcher or AsyncProcessWatcher, which can be
+            cancelled.
+        """
+        if loop is not None:
+            watcher = AsyncProcessWatcher(self.proc, on_exit, loop, executor)
+            try:
+                watcher.start()
+                return watcher
+            except (AttributeError, OSError):
+                # No pidfd support, so a thread must wait instead
+                pass
+        watcher = ProcessWatcher(self.proc, on_exit)
+        watcher.start()
+        return watcher
 
-    def _find_ls_process(self, script_path: str) -> psutil.Process:
+    def _find_ls_process(self, script_path: str):
         """Find the LiquidSoap process we are supposed to monitor.
 
         Args:
@@ -23,13 +69,18 @@ class LiquidSoapProcess:
                 by the LiquidSoap process we want to monitor.
 
         Returns:
-            Instance of psutil.Process which is bond to the LiquidSoap process
-            using the provided script_path.
+            Instance of proc_index.ProcHandle or psutil.Process, which is bound
+            to the LiquidSoap process using the provided script_path.
 
         Raises:
             ValueError if no LiquidSoap instance could be found using
             script_path.
         """
+        if ProcIndex.is_available():
+            if LiquidSoapProcess._proc_index is None:
+                LiquidSoapProcess._proc_index = ProcIndex()
+            return LiquidSoapProcess._proc_index.find(script_path)
+
         script_path = os.path.realpath(script_path)
         ls_processes = self._find_all_ls_processes()
         proc_scripts = self._find_scripts(ls_processes)
@@ -46,6 +97,9 @@ class LiquidSoapProcess:
     @staticmethod
     def _find_all_ls_processes() -> list:
         """Return list of all LiquidSoap processes."""
+        # Only imported when /proc is not available
+        import psutil
+
         ls_processes = []
         for proc in psutil.process_iter():
             if proc.name() == "liquidsoap":
@@ -113,4 +167,140 @@ class LiquidSoapProcess:
         return abs_proc_scripts
 
 
+class ProcessWatcher:
+    """Wait in a background thread for a process to exit.
+
+    On Linux, a pidfd is polled so we are woken up by the kernel the moment the
+    process exits. Elsewhere, psutil's wait is used.
+    """
+    # Seconds between each check for cancellation when falling back to psutil
+    fallback_interval = 1.0
+
+    def __init__(self, proc, on_exit):
+        self.proc = proc
+        self.on_exit = on_exit
+        self._cancelled = threading.Event()
+        self._wake_r, self._wake_w = os.pipe()
+        self._pipe_lock = threading.Lock()
+        self._pipe_closed = False
+        self._thread = threading.Thread(
+            target=self._watch,
+            name="process-watcher-{}".format(proc.pid),
+            daemon=True
+        )
+
+    def start(self):
+        """Start watching the process."""
+        self._thread.start()
+
+    def cancel(self):
+        """Stop watching the process, without calling on_exit."""
+        with self._pipe_lock:
+            self._cancelled.set()
+            if not self._pipe_closed:
+                os.write(self._wake_w, b"x")
+
+    def _watch(self):
+        """Wait for the process to exit, then call on_exit if not cancelled."""
+        try:
+            try:
+                self._wait_pidfd()
+            except (AttributeError, OSError):
+                # No pidfd support in this Python or kernel
+                self._wait_psutil()
+        finally:
+            with self._pipe_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._pipe_closed = True
+
+        if not self._cancelled.is_set():
+            logging.debug("Process {} exited".format(self.proc.pid))
+            self.on_exit()
+
+    def _wait_pidfd(self):
+        """Block until the process exits or we are cancelled, using pidfd."""
+        pidfd = os.pidfd_open(self.proc.pid)
+        try:
+            # The pid may have been reused after the process we found exited
+            if not self.proc.is_running():
+                return
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            poller.register(self._wake_r, select.POLLIN)
+            poller.poll()
+        finally:
+            os.close(pidfd)
+
+    def _wait_psutil(self):
+        """Block until the process exits or we are cancelled, using psutil."""
+        import psutil
+
+        if not self.proc.is_running():
+            return
+        try:
+            proc = psutil.Process(self.proc.pid)
+        except psutil.NoSuchProcess:
+            return
+        while not self._cancelled.is_set():
+            try:
+                proc.wait(timeout=self.fallback_interval)
+                return
+            except psutil.TimeoutExpired:
+                continue
+            except psutil.NoSuchProcess:
+                return
+
+
+class AsyncProcessWatcher:
+    """Wait for a process to exit on an asyncio event loop.
+
+    The pidfd of the process is added to the loop's readers, so the loop is
+    woken up by the kernel when the process exits, without a thread of its
+    own. Only available on Linux.
+    """
+
+    def __init__(self, proc, on_exit, loop, executor=None):
+        self.proc = proc
+        self.on_exit = on_exit
+        self.loop = loop
+        self.executor = executor
+        self._pidfd = None
+        self._cancelled = False
+
+    def start(self):
+        """Start watching the process.
+
+        Raises:
+            AttributeError or OSError if pidfds are not supported.
+        """
+        self._pidfd = os.pidfd_open(self.proc.pid)
+        self.loop.call_soon_threadsafe(self._register)
+
+    def cancel(self):
+        """Stop watching the process, without calling on_exit."""
+        self._cancelled = True
+        self.loop.call_soon_threadsafe(self._close)
+
+    def _register(self):
+        if self._cancelled:
+            self._close()
+        elif not self.proc.is_running():
+            # The pid may have been reused after the process we found exited
+            self._exited()
+        else:
+            self.loop.add_reader(self._pidfd, self._exited)
+
+    def _exited(self):
+        self._close()
+        if not self._cancelled:
+            logging.debug("Process {} exited".format(self.proc.pid))
+            # on_exit takes locks and talks to Slack, which the loop must not
+            # wait for
+            self.loop.run_in_executor(self.executor, self.on_exit)
 
+    def _close(self):
+        if self._pidfd is not None:
+            self.loop.remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
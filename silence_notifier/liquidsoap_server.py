@@ -0,0 +1,227 @@
+"""Ask LiquidSoap's server interface what is on air.
+
+LiquidSoap answers each command sent to its server (over telnet, or the Unix
+socket enabled with set("server.socket", true)) with the lines of the answer
+followed by a line saying END. Seeing only whether the process runs, we cannot
+tell a fallback playing silence from a healthy stream; asking the server which
+source is on air can.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from silence_notifier import metrics
+
+
+class LiquidSoapClient:
+    """Persistent connection to LiquidSoap's server interface.
+
+    Commands given together are sent in one write and their answers read back
+    in order, so checking several sources costs one round trip.
+    """
+
+    def __init__(self, address, timeout=2.0):
+        """
+        Args:
+            address: "host:port" of the telnet server, or the path of the
+                server socket.
+            timeout: Seconds to wait for LiquidSoap to answer.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._socket = None
+        self._buffer = b""
+        self._quick_ack = False
+        self._lock = threading.Lock()
+
+    def query(self, commands) -> list:
+        """Send the commands and return their answers.
+
+        A connection which LiquidSoap has closed since the last query (for
+        example because LiquidSoap was restarted) is opened again once.
+
+        Args:
+            commands: List of commands, like ["uptime"].
+
+        Returns:
+            List with the answer to each command, without the END line.
+
+        Raises:
+            OSError if LiquidSoap could not be reached, or did not answer in
+            time.
+        """
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                reused = self._socket is not None
+                try:
+                    return self._query(commands)
+                except ConnectionError:
+                    if not reused:
+                        raise
+                return self._query(commands)
+        finally:
+            metrics.LIQUIDSOAP_QUERY_SECONDS.observe(
+                time.perf_counter() - start
+            )
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _query(self, commands):
+        if self._socket is None:
+            self._connect()
+        try:
+            self._socket.sendall("".join(
+                command + "\n" for command in commands
+            ).encode("utf-8"))
+            return [self._read_answer() for _ in commands]
+        except BaseException:
+            # Answers may be left unread, so the connection cannot be reused
+            self._close()
+            raise
+
+    def _connect(self):
+        if os.sep in self.address:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            host, port = self.address.rsplit(":", 1)
+            sock = socket.create_connection((host, int(port)), self.timeout)
+            # The commands are sent in one write, so there is nothing to wait
+            # for before sending them
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._quick_ack = sock.family != socket.AF_UNIX and \
+            hasattr(socket, "TCP_QUICKACK")
+        self._socket = sock
+        self._buffer = b""
+
+    def _read_answer(self):
+        """Read lines up to the next END line, returning them joined."""
+        lines = []
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                if self._quick_ack:
+                    # LiquidSoap writes each answer by itself. If it delays
+                    # writes until the previous one is acknowledged (Nagle's
+                    # algorithm), a delayed acknowledgement from us would hold
+                    # up the next answer for tens of milliseconds.
+                    self._socket.setsockopt(socket.IPPROTO_TCP,
+                                            socket.TCP_QUICKACK, 1)
+                data = self._socket.recv(4096)
+                if not data:
+                    raise ConnectionError("LiquidSoap closed the connection")
+                self._buffer += data
+                continue
+            line = self._buffer[:end].rstrip(b"\r")
+            self._buffer = self._buffer[end + 1:]
+            if line == b"END":
+                return b"\n".join(lines).decode("utf-8", "replace")
+            lines.append(line)
+
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            self._buffer = b""
+
+
+class SourcePoller:
+    """Tell when LiquidSoap switches to silence and back, by asking its server
+    which source is on air."""
+
+    def __init__(self, client, commands, silent_answers, on_silence_start,
+                 on_silence_stop, poll_interval=1.0):
+        """
+        Args:
+            client: The LiquidSoapClient to ask.
+            commands: List of commands sent together on each poll.
+            silent_answers: The stream is silent when the answer to any of
+                the commands is one of these.
+            on_silence_start: Function called with no arguments when the
+                silence starts.
+            on_silence_stop: Function called with no arguments when the
+                silence stops.
+            poll_interval: Seconds between each poll.
+        """
+        self.client = client
+        self.commands = list(commands)
+        self.silent_answers = set(silent_answers)
+        self.on_silence_start = on_silence_start
+        self.on_silence_stop = on_silence_stop
+        self.poll_interval = poll_interval
+
+        self.silent = False
+        self._reachable = True
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def is_silent(self) -> bool:
+        """Return True if LiquidSoap plays silence right now.
+
+        Raises:
+            OSError if LiquidSoap could not be asked.
+        """
+        answers = self.client.query(self.commands)
+        return any(answer.strip() in self.silent_answers
+                   for answer in answers)
+
+    def poll(self):
+        """Ask LiquidSoap what is on air, and fire events as appropriate.
+
+        A silence which is ongoing when we start polling is found by the first
+        poll, too.
+        """
+        try:
+            silent = self.is_silent()
+        except OSError as e:
+            if self._reachable:
+                logging.warning("Could not ask LiquidSoap at {} what is on "
+                                "air: {}".format(self.client.address, e))
+                self._reachable = False
+            return
+        if not self._reachable:
+            logging.info("LiquidSoap at {} answers again"
+                         .format(self.client.address))
+            self._reachable = True
+
+        if silent == self.silent:
+            return
+        self.silent = silent
+        if silent:
+            logging.debug("LiquidSoap server: silence started")
+            self.on_silence_start()
+        else:
+            logging.debug("LiquidSoap server: silence stopped")
+            self.on_silence_stop()
+
+    def start(self):
+        """Poll in a background thread until stopped."""
+        self._thread = threading.Thread(
+            target=self._poll_forever,
+            name="liquidsoap-server",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling, and close the connection."""
+        self._stopped.set()
+        self.client.close()
+
+    def _poll_forever(self):
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logging.exception("Error while polling LiquidSoap")
+            self._stopped.wait(self.poll_interval)
@@ -0,0 +1,145 @@
+import bisect
+import re
+import string
+
+
+class MessageCatalog:
+    """The messages from the settings, prepared for quick lookup.
+
+    The catalog is compiled once, when the settings are loaded. Messages which
+    depend on the number of minutes get their thresholds sorted, with the
+    candidate messages for each threshold decided ahead of time, so looking up
+    messages is a binary search. All templates are checked against the
+    placeholders available to their message type, so mistakes in the settings
+    are found at startup instead of during a silence.
+    """
+    # Placeholders made available to each message type, in addition to channel
+    placeholders = {
+        "warnings": {"show", "min"},
+        "first_responsible": {"user"},
+        "change_responsible": {"users"},
+        "change_none_responsible": set(),
+        "new_responsible": {"user"},
+        "new_not_responsible": {"user"},
+        "no_responsible": set(),
+        "sound": {"mentions"},
+        "not_running": set(),
+        "status": {"show", "min", "users"},
+        "status_over": {"show", "min", "users"},
+    }
+    common_placeholders = {"channel"}
+    # Settings under messages which are not message types
+    options = {"warnings_cumulative"}
+
+    _field_root = re.compile(r"[^.\[]*")
+
+    def __init__(self, messages):
+        """Compile the catalog.
+
+        Args:
+            messages: The messages setting.
+
+        Raises:
+            ValueError if the messages are not valid.
+        """
+        cumulative = messages.get("warnings_cumulative", False)
+        # message type -> tuple of messages
+        self._plain = dict()
+        # message type -> (sorted thresholds, tuple of candidates per threshold)
+        self._by_minutes = dict()
+
+        for message_type, value in messages.items():
+            if message_type in self.options:
+                continue
+            if isinstance(value, dict):
+                self._by_minutes[message_type] = self._compile_thresholds(
+                    message_type,
+                    value,
+                    cumulative
+                )
+            else:
+                self._plain[message_type] = self._compile_list(
+                    message_type,
+                    value
+                )
+
+    def lookup(self, message_type, num_minutes=None):
+        """Return tuple of the messages to choose from.
+
+        Args:
+            message_type: The key of the messages setting to use.
+            num_minutes: Number of minutes, used to choose messages for message
+                types with thresholds.
+
+        Raises:
+            KeyError if there is no such message type.
+        """
+        if num_minutes is None:
+            return self._plain[message_type]
+
+        thresholds, candidates = self._by_minutes[message_type]
+        i = bisect.bisect_right(thresholds, num_minutes) - 1
+        return candidates[max(i, 0)]
+
+    def threshold(self, message_type, num_minutes):
+        """Return the threshold whose messages are used at num_minutes."""
+        thresholds, _ = self._by_minutes[message_type]
+        i = bisect.bisect_right(thresholds, num_minutes) - 1
+        return thresholds[max(i, 0)]
+
+    def _compile_thresholds(self, message_type, messages, cumulative):
+        """Return sorted thresholds and the messages to use from each."""
+        thresholds = sorted(messages)
+        if thresholds[0] > 0:
+            raise ValueError(
+                "The messages for {} must include ones from 0 minutes"
+                .format(message_type)
+            )
+
+        candidates = []
+        for threshold in thresholds:
+            current = self._compile_list(message_type, messages[threshold])
+            if cumulative and candidates:
+                current = candidates[-1] + current
+            candidates.append(current)
+        return thresholds, tuple(candidates)
+
+    def _compile_list(self, message_type, messages):
+        """Return the messages as a tuple, after validating them."""
+        if isinstance(messages, str):
+            messages = [messages]
+        if not messages:
+            raise ValueError("No messages given for {}".format(message_type))
+
+        allowed = self.common_placeholders | self.placeholders.get(
+            message_type,
+            set()
+        )
+        for message in messages:
+            self._validate(message_type, message, allowed)
+        return tuple(messages)
+
+    def _validate(self, message_type, message, allowed):
+        """Raise ValueError if message uses placeholders not in allowed."""
+        try:
+            fields = [
+                field for _, field, _, _ in string.Formatter().parse(message)
+                if field is not None
+            ]
+        except ValueError as e:
+            raise ValueError("Invalid message for {}: {!r} ({})".format(
+                message_type, message, e
+            ))
+
+        for field in fields:
+            name = self._field_root.match(field).group()
+            if name not in allowed:
+                raise ValueError(
+                    "Unknown placeholder {{{}}} in message for {}: {!r}. "
+                    "Available placeholders: {}".format(
+                        field,
+                        message_type,
+                        message,
+                        ", ".join(sorted(allowed))
+                    )
+                )
@@ -0,0 +1,422 @@
+"""Counters, gauges and latency histograms for the hot paths.
+
+The metrics are exposed in the Prometheus text format, either on a local HTTP
+endpoint or in a file picked up by node_exporter's textfile collector.
+
+Recording is meant to be cheap enough to leave on everywhere: observing a
+value is one bisect and two additions under an uncontended lock, below a
+microsecond (see benchmarks/metrics_overhead.py). Gauges for things we already
+keep track of, like the current state, are computed when collected instead of
+being updated as they change.
+"""
+import bisect
+import logging
+import os
+import threading
+
+# Upper bounds of histogram buckets, in seconds. Both in-memory lookups and
+# calls to remote APIs should be told apart.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """A named metric, possibly split up by labels.
+
+    Metrics without labels are recorded to directly. Metrics with labels are
+    recorded to through the child returned by labels().
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        """
+        Args:
+            name: The name of the metric, like silence_notifier_job_seconds.
+            documentation: One line describing the metric.
+            labelnames: Names of the labels splitting up this metric.
+            registry: The Registry to add the metric to. Defaults to REGISTRY.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = dict()
+        self._children_lock = threading.Lock()
+        self._init_values()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _init_values(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child recording for the given label values."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self.__class__.__new__(self.__class__)
+                    child.name = self.name
+                    child.labelnames = ()
+                    child._init_values()
+                    self._children[values] = child
+        return child
+
+    def remove(self, *values):
+        """Stop exposing the child with the given label values."""
+        with self._children_lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def collect(self):
+        """Yield (suffix, labels, value) for each sample of this metric."""
+        if not self.labelnames:
+            for sample in self._samples():
+                yield sample
+            return
+        with self._children_lock:
+            children = list(self._children.items())
+        for values, child in children:
+            labels = list(zip(self.labelnames, values))
+            for suffix, extra_labels, value in child._samples():
+                yield suffix, labels + extra_labels, value
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A number which only goes up."""
+    type_name = "counter"
+
+    def _init_values(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        """Increase the counter by amount."""
+        # acquire and release are noticeably faster than a with statement
+        lock = self._lock
+        lock.acquire()
+        self._value += amount
+        lock.release()
+
+    def _samples(self):
+        yield "_total", [], self._value
+
+
+class Gauge(Metric):
+    """A number which goes up and down.
+
+    Instead of being set, the value may be computed by a function whenever the
+    gauge is collected.
+    """
+    type_name = "gauge"
+
+    def _init_values(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value):
+        """Set the gauge to value."""
+        self._value = value
+
+    def set_function(self, function):
+        """Compute the value by calling function (without arguments)."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is None:
+            yield "", [], self._value
+            return
+        try:
+            yield "", [], self._function()
+        except Exception:
+            logging.exception("Could not compute gauge " + self.name)
+
+
+class Histogram(Metric):
+    """Distribution of values, like how many seconds something took."""
+    type_name = "histogram"
+    buckets = DEFAULT_BUCKETS
+
+    def _init_values(self):
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one value."""
+        i = bisect.bisect_left(self.buckets, value)
+        lock = self._lock
+        lock.acquire()
+        self._counts[i] += 1
+        self._sum += value
+        lock.release()
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield "_bucket", [("le", _format_value(bound))], cumulative
+        yield "_count", [], cumulative
+        yield "_sum", [], total
+
+
+class Registry:
+    """Collection of the metrics to expose."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def exposition(self) -> str:
+        """Return all metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name,
+                                               metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type_name))
+            for suffix, labels, value in metric.collect():
+                if labels:
+                    label_text = "{" + ",".join(
+                        '{}="{}"'.format(name, _escape(label_value))
+                        for name, label_value in labels
+                    ) + "}"
+                else:
+                    label_text = ""
+                lines.append("{}{}{} {}".format(
+                    metric.name, suffix, label_text, _format_value(value)
+                ))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+SEND_CUSTOM_SECONDS = Histogram(
+    "silence_notifier_send_custom_seconds",
+    "Time spent preparing and queueing a message for Slack."
+)
+SLACK_API_SECONDS = Histogram(
+    "silence_notifier_slack_api_seconds",
+    "Time spent on each call to the Slack Web API.",
+    ["method"]
+)
+SLACK_API_ERRORS = Counter(
+    "silence_notifier_slack_api_errors",
+    "Slack Web API calls which failed or were rate limited.",
+    ["method", "error"]
+)
+SLACK_CALLS_DROPPED = Counter(
+    "silence_notifier_slack_calls_dropped",
+    "Slack Web API calls given up on because the queue was full, or because "
+    "they were not done by the shutdown deadline.",
+    ["method"]
+)
+SLACK_CONNECT_SECONDS = Histogram(
+    "silence_notifier_slack_connect_seconds",
+    "Time spent opening connections to the Slack Web API, including the TLS "
+    "handshake."
+)
+NOTIFIER_SECONDS = Histogram(
+    "silence_notifier_notifier_seconds",
+    "Time spent on each attempt at delivering a message to a notifier "
+    "backend.",
+    ["backend"]
+)
+NOTIFIER_ERRORS = Counter(
+    "silence_notifier_notifier_errors",
+    "Failed attempts at delivering a message to a notifier backend.",
+    ["backend"]
+)
+NOTIFIER_DROPPED = Counter(
+    "silence_notifier_notifier_dropped",
+    "Messages given up on by a notifier backend, after failing every attempt "
+    "or because its queue was full.",
+    ["backend"]
+)
+GET_CURRENT_SHOW_SECONDS = Histogram(
+    "silence_notifier_get_current_show_seconds",
+    "Time spent looking up the show on air."
+)
+RADIO_API_SECONDS = Histogram(
+    "silence_notifier_radio_api_seconds",
+    "Time spent fetching the show schedule from the Radio REST API."
+)
+RADIO_API_ERRORS = Counter(
+    "silence_notifier_radio_api_errors",
+    "Failed attempts at fetching the show schedule."
+)
+POPULATE_IDENTITY_SECONDS = Histogram(
+    "silence_notifier_populate_identity_seconds",
+    "Time spent looking up who we are logged in as on Slack."
+)
+PROCESS_DISCOVERY_SECONDS = Histogram(
+    "silence_notifier_process_discovery_seconds",
+    "Time spent finding the LiquidSoap process."
+)
+PROCESS_CHECK_SECONDS = Histogram(
+    "silence_notifier_process_check_seconds",
+    "Time spent checking whether the LiquidSoap process still runs."
+)
+LIQUIDSOAP_QUERY_SECONDS = Histogram(
+    "silence_notifier_liquidsoap_query_seconds",
+    "Time spent asking LiquidSoap's server what is on air."
+)
+JOB_RUN_SECONDS = Histogram(
+    "silence_notifier_job_run_seconds",
+    "Time spent in SilenceNotifyJob.run.",
+    ["stream"]
+)
+RTM_EVENTS = Counter(
+    "silence_notifier_rtm_events",
+    "Message events received, by whether they were accepted or why not.",
+    ["result"]
+)
+STATE = Gauge(
+    "silence_notifier_state",
+    "1 for the state each stream is in, 0 for the others.",
+    ["stream", "state"]
+)
+RESPONSIBLE_USERS = Gauge(
+    "silence_notifier_responsible_users",
+    "Number of users who have taken responsibility for the silence.",
+    ["stream"]
+)
+SILENCE_MINUTES = Gauge(
+    "silence_notifier_silence_minutes",
+    "Minutes since the ongoing silence started, 0 if there is none.",
+    ["stream"]
+)
+
+
+class MetricsHTTPServer:
+    """Serve the metrics on /metrics, from a background thread."""
+
+    def __init__(self, address, port, registry=None):
+        # Imported here, so http.server is not loaded on the way to the first
+        # warning
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        registry = REGISTRY if registry is None else registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = HTTPServer((address, port), Handler)
+
+    def start(self):
+        threading.Thread(
+            target=self._server.serve_forever,
+            name="metrics-http",
+            daemon=True
+        ).start()
+        logging.info("Serving metrics on port {}".format(
+            self._server.server_port
+        ))
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TextfileWriter:
+    """Write the metrics to a file every interval seconds, for node_exporter's
+    textfile collector."""
+
+    def __init__(self, filename, interval=15.0, registry=None):
+        self.filename = filename
+        self.interval = interval
+        self.registry = REGISTRY if registry is None else registry
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(
+            target=self._run,
+            name="metrics-textfile",
+            daemon=True
+        ).start()
+
+    def close(self):
+        """Stop writing, after writing the metrics one last time."""
+        self._stopped.set()
+        self.write()
+
+    def write(self):
+        """Write the metrics to the file, atomically."""
+        temporary = "{}.{}.tmp".format(self.filename, os.getpid())
+        try:
+            with open(temporary, "w") as fp:
+                fp.write(self.registry.exposition())
+            os.replace(temporary, self.filename)
+        except OSError:
+            logging.exception("Could not write metrics to " + self.filename)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.write()
+            self._stopped.wait(self.interval)
+
+
+def start_exporters(settings):
+    """Start exposing the metrics as configured in settings.
+
+    Returns:
+        List of the started exporters, which have a close method.
+    """
+    exporters = []
+    if settings.metrics_port is not None:
+        server = MetricsHTTPServer(settings.metrics_address,
+                                   settings.metrics_port)
+        server.start()
+        exporters.append(server)
+    if settings.metrics_textfile:
+        writer = TextfileWriter(settings.metrics_textfile)
+        writer.start()
+        exporters.append(writer)
+    return exporters
+
+
+def track_monitor(monitor):
+    """Expose the state, responsible users and silence minutes of the given
+    StreamMonitor."""
+    name = monitor.name
+    for state in ("none", "no_responsible", "some_responsible"):
+        STATE.labels(name, state).set_function(
+            lambda state=state: float(monitor.state_name() == state)
+        )
+    RESPONSIBLE_USERS.labels(name).set_function(
+        lambda: len(monitor.responsible_usernames)
+    )
+    SILENCE_MINUTES.labels(name).set_function(monitor.silence_minutes)
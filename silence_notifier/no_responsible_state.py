@@ -6,15 +6,29 @@ from silence_notifier.state import State
 class NoResponsibleState(State):
     """State for when no one is responsible for fixing the technical problems.
     """
+    name = "no_responsible"
+
     def handle_timer(self, num_invocations, minutes):
         """Send warning, if applicable."""
-        if self.settings.warn_while_no_responsible or num_invocations == 0:
-            self.send(
-                "warnings",
-                minutes,
-                min=minutes,
-                show=self.communicator.get_current_show()
-            )
+        if self.settings.status_message:
+            # Only warnings from a new threshold are posted, the status
+            # message shows that the silence goes on
+            escalation = self.communicator.is_escalation(minutes)
+            if escalation and (self.settings.warn_while_no_responsible or
+                               num_invocations == 0):
+                self._send_warning(minutes)
+            self._update_status(periodic=not escalation)
+        elif self.settings.warn_while_no_responsible or num_invocations == 0:
+            self._send_warning(minutes)
+
+    def _send_warning(self, minutes):
+        """Send warning about the silence having lasted minutes."""
+        self.send(
+            "warnings",
+            minutes,
+            min=minutes,
+            show=self.communicator.get_current_show()
+        )
 
     def handle_message(self, data):
         """Handle a user mentioning us.
@@ -33,6 +47,7 @@ class NoResponsibleState(State):
             mentions_string = ""
 
         self.send("sound", mentions=mentions_string)
+        self._update_status(over=True)
 
     def _handle_responsible(self, userid, data):
         """Handle the first user assigning responsibility to themselves."""
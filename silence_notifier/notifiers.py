@@ -0,0 +1,312 @@
+"""Deliver the messages sent to Slack to other places, too.
+
+Each notifier backend delivers messages to one place: a webhook, a command
+(like a script sending SMS or e-mail) or another Slack channel. The messages
+posted in the Slack channel are handed to every backend by NotifierFanout,
+which delivers them in parallel, from one worker thread per backend. A backend
+which is slow or down thus never holds up the others or the Slack channel, and
+each backend has its own timeout and retries.
+"""
+import logging
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+
+from silence_notifier import metrics
+
+
+class Notifier(metaclass=ABCMeta):
+    """Abstract class representing one place messages are delivered to."""
+    # Type of the backend, as given in the notifiers setting
+    type_name = None
+
+    def __init__(self, name, timeout=5.0, attempts=3, retry_delay=1.0,
+                 messages=None):
+        """
+        Args:
+            name: Name of the backend, used in the log and the metrics.
+            timeout: Seconds to wait for each attempt at delivering a message.
+            attempts: Number of times to try delivering each message.
+            retry_delay: Seconds to wait after the first failed attempt,
+                doubled after each failed attempt after that.
+            messages: List of the message types (keys under messages in the
+                settings) to deliver, or None to deliver all of them.
+        """
+        self.name = name
+        self.timeout = timeout
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.messages = set(messages) if messages else None
+
+    def wants(self, message_type):
+        """Return True if messages of message_type should be delivered."""
+        return self.messages is None or message_type in self.messages
+
+    @abstractmethod
+    def deliver(self, text, message_type):
+        """Deliver one message, giving up after self.timeout seconds.
+
+        Args:
+            text: The text posted on Slack.
+            message_type: The type of the message, or None for messages
+                which were not looked up in the settings.
+
+        Raises:
+            Exception if the message could not be delivered.
+        """
+        pass
+
+
+class WebhookNotifier(Notifier):
+    """POST each message as JSON to a URL, like {"text": "...", "type":
+    "warnings"}."""
+    type_name = "webhook"
+
+    def __init__(self, url, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self._session = None
+
+    def deliver(self, text, message_type):
+        if self._session is None:
+            # Imported here, so requests is only needed with webhooks (though
+            # under RtmBot, slackclient has loaded it already)
+            import requests
+            self._session = requests.Session()
+        r = self._session.post(
+            self.url,
+            json={"text": text, "type": message_type},
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+
+
+class CommandNotifier(Notifier):
+    """Run a command for each message, like a script sending an SMS or an
+    e-mail.
+
+    The text is given to the command on standard input, and the type of the
+    message in the environment variable SILENCE_NOTIFIER_MESSAGE_TYPE. The
+    command must exit with status 0 when the message has been delivered.
+    """
+    type_name = "command"
+
+    def __init__(self, command, **kwargs):
+        """
+        Args:
+            command: List with the program and its arguments, or a string
+                which is split like the shell does.
+            kwargs: See Notifier.
+        """
+        super().__init__(**kwargs)
+        if isinstance(command, str):
+            command = shlex.split(command)
+        self.command = list(command)
+
+    def deliver(self, text, message_type):
+        subprocess.run(
+            self.command,
+            input=text.encode("utf-8"),
+            env=dict(os.environ,
+                     SILENCE_NOTIFIER_MESSAGE_TYPE=message_type or ""),
+            stdout=subprocess.DEVNULL,
+            timeout=self.timeout,
+            check=True
+        )
+
+
+class SlackNotifier(Notifier):
+    """Post each message in another Slack channel.
+
+    The messages are queued on the SlackSender shared with the main channel,
+    which takes care of rate limits and retries, so timeout and attempts do
+    not apply.
+    """
+    type_name = "slack"
+
+    def __init__(self, sender, channel, **kwargs):
+        """
+        Args:
+            sender: The SlackSender to queue the messages on.
+            channel: The channel to post in.
+            kwargs: See Notifier.
+        """
+        super().__init__(**kwargs)
+        self.sender = sender
+        self.channel = channel
+
+    def deliver(self, text, message_type):
+        if not self.sender.submit("chat.postMessage", text=text,
+                                  channel=self.channel, as_user=True):
+            raise RuntimeError("The Slack queue is full")
+
+
+NOTIFIER_TYPES = {
+    notifier_class.type_name: notifier_class
+    for notifier_class in (WebhookNotifier, CommandNotifier, SlackNotifier)
+}
+
+
+class NotifierFanout:
+    """Deliver messages to several notifier backends in parallel.
+
+    Each backend has its own queue and worker thread, so its messages arrive
+    in order, and waiting on it never delays the others.
+    """
+
+    def __init__(self, notifiers, max_queue_size=100):
+        """
+        Args:
+            notifiers: List of Notifier instances to deliver to.
+            max_queue_size: Number of messages which may wait for each
+                backend before new ones are dropped.
+        """
+        self.notifiers = list(notifiers)
+        # Queue of each Notifier
+        self._queues = dict()
+        # Messages handed to a backend which are not delivered or given up
+        # on yet
+        self._unfinished = 0
+        self._unfinished_cond = threading.Condition()
+        # Monotonic time to stop retrying at, set once shutting down
+        self._deadline = None
+        for notifier in self.notifiers:
+            self._queues[notifier] = queue.Queue(max_queue_size)
+            threading.Thread(
+                target=self._work,
+                args=(notifier, self._queues[notifier]),
+                name="notifier-" + notifier.name,
+                daemon=True
+            ).start()
+
+    def notify(self, text, message_type=None):
+        """Hand the message to every backend which wants it, without waiting
+        for any of them."""
+        for notifier in self.notifiers:
+            if not notifier.wants(message_type):
+                continue
+            with self._unfinished_cond:
+                self._unfinished += 1
+            try:
+                self._queues[notifier].put_nowait((text, message_type))
+            except queue.Full:
+                logging.error("Queue of notifier {} is full, dropping {} "
+                              "message".format(notifier.name, message_type))
+                metrics.NOTIFIER_DROPPED.labels(notifier.name).inc()
+                self._done()
+
+    def flush(self, timeout=None):
+        """Wait until all messages are delivered or given up on.
+
+        Returns:
+            True if they are, False if timeout seconds passed first.
+        """
+        with self._unfinished_cond:
+            return self._unfinished_cond.wait_for(
+                lambda: not self._unfinished,
+                timeout
+            )
+
+    def shutdown(self, timeout):
+        """Stop retrying after timeout seconds, and wait until then for the
+        messages which are left.
+
+        Returns:
+            Number of messages which were not delivered by the deadline. They
+            are also logged.
+        """
+        self._deadline = time.monotonic() + timeout
+        self.flush(timeout)
+        with self._unfinished_cond:
+            left = self._unfinished
+        if left:
+            logging.error("Gave up on {} message(s) to the notifiers at "
+                          "shutdown".format(left))
+        return left
+
+    def _done(self):
+        with self._unfinished_cond:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._unfinished_cond.notify_all()
+
+    def _work(self, notifier, messages):
+        while True:
+            text, message_type = messages.get()
+            try:
+                self._deliver(notifier, text, message_type)
+            except Exception:
+                logging.exception("Error in notifier " + notifier.name)
+            finally:
+                self._done()
+
+    def _deliver(self, notifier, text, message_type):
+        """Try delivering the message until it succeeds, the attempts are used
+        up or we are shutting down."""
+        seconds = metrics.NOTIFIER_SECONDS.labels(notifier.name)
+        delay = notifier.retry_delay
+        for attempt in range(1, notifier.attempts + 1):
+            start = time.perf_counter()
+            try:
+                notifier.deliver(text, message_type)
+                return
+            except Exception as e:
+                logging.warning("Could not deliver {} message to notifier {} "
+                                "(attempt {} of {}): {}".format(
+                                    message_type, notifier.name, attempt,
+                                    notifier.attempts, e))
+                metrics.NOTIFIER_ERRORS.labels(notifier.name).inc()
+            finally:
+                seconds.observe(time.perf_counter() - start)
+            if attempt == notifier.attempts or (
+                    self._deadline is not None and
+                    time.monotonic() + delay >= self._deadline):
+                break
+            time.sleep(delay)
+            delay *= 2
+        logging.error("Gave up delivering {} message to notifier {}".format(
+            message_type, notifier.name))
+        metrics.NOTIFIER_DROPPED.labels(notifier.name).inc()
+
+
+def create_fanout(configs, sender) -> NotifierFanout:
+    """Return NotifierFanout delivering to the backends described in the
+    notifiers setting.
+
+    Args:
+        configs: List of dictionaries, each with the type of a backend and
+            the arguments to create it with.
+        sender: The SlackSender used by Slack backends.
+
+    Raises:
+        ValueError if a backend is not described correctly, or two backends
+        have the same name.
+    """
+    notifiers = []
+    names = set()
+    for number, config in enumerate(configs or (), 1):
+        options = dict(config)
+        type_name = options.pop("type", None)
+        notifier_class = NOTIFIER_TYPES.get(type_name)
+        if notifier_class is None:
+            raise ValueError("Unknown notifier type {!r}, expected one of {}"
+                             .format(type_name,
+                                     ", ".join(sorted(NOTIFIER_TYPES))))
+        options.setdefault("name", "{}-{}".format(type_name, number))
+        if options["name"] in names:
+            raise ValueError("There are several notifiers named {}, give "
+                             "them different names".format(options["name"]))
+        names.add(options["name"])
+        if notifier_class is SlackNotifier:
+            options["sender"] = sender
+        try:
+            notifiers.append(notifier_class(**options))
+        except TypeError as e:
+            raise ValueError("Invalid settings for notifier {}: {}".format(
+                options["name"], e
+            ))
+    return NotifierFanout(notifiers)
@@ -0,0 +1,162 @@
+import os
+import os.path
+import warnings
+
+
+class ProcHandle:
+    """Handle to a process found through /proc.
+
+    Knows the start time of the process, so a new process reusing the pid is
+    not mistaken for it.
+    """
+
+    def __init__(self, proc_root, pid, start_time):
+        self.proc_root = proc_root
+        self.pid = pid
+        self.start_time = start_time
+
+    def is_running(self):
+        """Return True if the process is still running."""
+        try:
+            return ProcIndex.read_start_time(self.proc_root, self.pid) == \
+                self.start_time
+        except (OSError, IndexError, ValueError):
+            return False
+
+
+class ProcIndex:
+    """Index of LiquidSoap processes and their scripts, built from /proc.
+
+    One scan lists /proc once and only reads the short comm file of each
+    process. Command line and working directory are read only for LiquidSoap
+    processes, and only when they were not seen in an earlier scan. Processes
+    are identified by their pid together with their start time, so a reused
+    pid is never mistaken for the process we saw earlier. Once indexed, a
+    process is found again by checking its start time alone, without a scan.
+    """
+
+    def __init__(self, proc_root="/proc", name="liquidsoap"):
+        """Create an empty index.
+
+        Args:
+            proc_root: Where the proc filesystem is mounted.
+            name: The process name (as found in comm) to look for.
+        """
+        self.proc_root = proc_root
+        self.name = name
+        # pid -> (start time, absolute script path or None)
+        self._entries = dict()
+
+    @staticmethod
+    def is_available(proc_root="/proc"):
+        """Return True if proc_root looks like a proc filesystem."""
+        return os.path.isdir(os.path.join(proc_root, "self"))
+
+    def scan(self) -> dict:
+        """Update the index and return mapping between pids and scripts.
+
+        Returns:
+            Dictionary mapping the pid of each running LiquidSoap process to the
+            absolute path of the script it uses. Processes whose script could
+            not be determined are left out.
+        """
+        entries = dict()
+        scripts = dict()
+
+        for pid in self._find_named_pids():
+            try:
+                start_time = self.read_start_time(self.proc_root, pid)
+                cached = self._entries.get(pid)
+                if cached is not None and cached[0] == start_time:
+                    script = cached[1]
+                else:
+                    script = self._resolve_script(pid)
+            except OSError:
+                # The process exited while we looked at it
+                continue
+
+            entries[pid] = (start_time, script)
+            if script is not None:
+                scripts[pid] = script
+
+        self._entries = entries
+        return scripts
+
+    def find(self, script_path: str) -> ProcHandle:
+        """Return the LiquidSoap process using script_path.
+
+        Raises:
+            ValueError if no LiquidSoap instance could be found using
+            script_path.
+        """
+        script_path = os.path.realpath(script_path)
+        # The processes seen in the last scan are likely still running, and
+        # checking them costs one read each instead of one per process
+        for pid, (start_time, script) in list(self._entries.items()):
+            if script != script_path:
+                continue
+            try:
+                if self.read_start_time(self.proc_root, pid) == start_time:
+                    return ProcHandle(self.proc_root, pid, start_time)
+            except (OSError, IndexError, ValueError):
+                pass
+            # The pid is gone or reused
+            del self._entries[pid]
+
+        for pid, script in self.scan().items():
+            if script == script_path:
+                return ProcHandle(self.proc_root, pid, self._entries[pid][0])
+        raise ValueError(
+            "No LiquidSoap instance runs using {}".format(script_path)
+        )
+
+    def _find_named_pids(self):
+        """Yield the pid of every process whose comm equals self.name."""
+        name = self.name.encode()
+        with os.scandir(self.proc_root) as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    with open(os.path.join(entry.path, "comm"), "rb") as fp:
+                        comm = fp.read().rstrip(b"\n")
+                except OSError:
+                    continue
+                if comm == name:
+                    yield int(entry.name)
+
+    @staticmethod
+    def read_start_time(proc_root, pid) -> int:
+        """Return the start time of pid, in clock ticks after boot."""
+        with open(os.path.join(proc_root, str(pid), "stat"), "rb") as fp:
+            stat = fp.read()
+        # comm may contain spaces and parentheses, so split after the last ")".
+        # Field 22 (starttime) is then the 20th field.
+        return int(stat.rsplit(b")", 1)[1].split()[19])
+
+    def _resolve_script(self, pid):
+        """Return absolute path of the script used by pid, or None."""
+        # Imported here to avoid a circular import
+        from silence_notifier.liquidsoap_process import LiquidSoapProcess
+
+        with open(self._path(pid, "cmdline"), "rb") as fp:
+            args = os.fsdecode(fp.read()).split("\0")
+        if args and args[-1] == "":
+            args.pop()
+
+        try:
+            script = LiquidSoapProcess._find_script_from_args(args)
+        except ValueError:
+            warnings.warn("Could not figure out what script is used for "
+                          "the process '{}'".format(args))
+            return None
+        if script is None:
+            return None
+
+        if not os.path.isabs(script):
+            cwd = os.readlink(self._path(pid, "cwd"))
+            script = os.path.normpath(os.path.join(cwd, script))
+        return script
+
+    def _path(self, pid, filename):
+        return os.path.join(self.proc_root, str(pid), filename)
@@ -0,0 +1,45 @@
+"""Record RTM events to a file, and read them back for replaying.
+
+Each line of a recording is a JSON object with the time the event was received
+("at", in seconds since the epoch) and the event itself ("event").
+"""
+import json
+import logging
+import time
+
+
+class EventRecorder:
+    """Append the events received from Slack to a recording."""
+
+    # Seconds between each time the recording is flushed to disk
+    flush_interval = 1.0
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fp = open(filename, "a")
+        self._flushed_at = time.monotonic()
+
+    def record(self, data):
+        """Append the event data to the recording."""
+        try:
+            self._fp.write(json.dumps({"at": time.time(), "event": data}))
+            self._fp.write("\n")
+            now = time.monotonic()
+            if now - self._flushed_at >= self.flush_interval:
+                self._fp.flush()
+                self._flushed_at = now
+        except (OSError, ValueError):
+            logging.exception("Could not record event to " + self.filename)
+
+    def close(self):
+        self._fp.close()
+
+
+def read_recording(filename):
+    """Yield (time received, event) for each event in the recording."""
+    with open(filename) as fp:
+        for line in fp:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                yield entry["at"], entry["event"]
@@ -1,26 +1,63 @@
+import functools
 import logging
+import os.path
 import sys
+import threading
+import time
+from collections import OrderedDict
 
 from rtmbot.core import Plugin, Job
 
-from silence_notifier.no_responsible_state import NoResponsibleState
 from silence_notifier.settings import Settings
+from silence_notifier.settings_watcher import SettingsWatcher
 from silence_notifier.communication import Communicator
-from silence_notifier import signal_handler
-from silence_notifier.some_responsible_state import SomeResponsibleState
+from silence_notifier.episode_history import EpisodeHistory
+from silence_notifier.episode_snapshot import EpisodeSnapshot
+from silence_notifier.event_filter import EventFilter
+from silence_notifier.identity_cache import IdentityCache
+from silence_notifier import metrics, signal_handler, startup_trace
 from silence_notifier.liquidsoap_process import LiquidSoapProcess
+from silence_notifier.liquidsoap_server import LiquidSoapClient, SourcePoller
+from silence_notifier.notifiers import create_fanout
+from silence_notifier.rtm_recording import EventRecorder
+from silence_notifier.show_schedule import ShowSchedule
+from silence_notifier.slack_sender import SlackSender
+from silence_notifier.slack_web import SlackWebClient
+from silence_notifier.stream_monitor import StreamMonitor
+from silence_notifier.trigger import TriggerServer
+from silence_notifier.warning_scheduler import WarningScheduler
+
+startup_trace.mark("imports")
 
 
 class SilenceNotifyJob(Job):
-    """Job run every minute to enable periodical warnings"""
+    """Job sending periodical warnings.
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._minutes_to_next = 0
-        self._delays = []
+    RtmBot asks the job whether it should run on every pass through its loop,
+    and the job answers yes exactly when the next warning is due. The
+    asyncio runtime instead sleeps until seconds_until_due has passed, and is
+    woken up by on_schedule_changed.
+    """
+
+    def __init__(self, interval, lock=None, stream="main", clock=None):
+        super().__init__(interval)
+        self.stream = stream
+        # The clock.Clock warnings are scheduled by, or None for the real time
+        self.clock = clock
+        self._run_seconds = metrics.JOB_RUN_SECONDS.labels(stream)
+        # Called without arguments after each warning
+        self.on_warning = None
+        # Called without arguments when the next warning may be due at
+        # another time than before
+        self.on_schedule_changed = None
+        self._loop = None
+        self._executor = None
+        self._scheduler = None
         self._active_state = None
         self.settings = None
         self._ls_proc = None
+        self._ls_watcher = None
+        self._lock = lock or threading.RLock()
 
     def update_state(self, new_state):
         """Update which state is the currently active one.
@@ -29,6 +66,11 @@ class SilenceNotifyJob(Job):
             new_state: Instance of an implementation of State.
         """
         self._active_state = new_state
+        self._schedule_changed()
+
+    def _schedule_changed(self):
+        if self.on_schedule_changed:
+            self.on_schedule_changed()
 
     def set_settings(self, settings):
         """Inform this instance of the settings.
@@ -37,134 +79,584 @@ class SilenceNotifyJob(Job):
             settings: Instance of settings.Settings
         """
         self.settings = settings
+        self._scheduler = WarningScheduler(
+            self.settings.warning_delays,
+            self.settings.sec_per_min,
+            self.settings.max_warning_delay,
+            self.clock
+        )
+        if not self.settings.daemon_mode:
+            # The silence started when we did
+            self._scheduler.start(delay=self.settings.min_silence_duration)
         try:
-            self._ls_proc = LiquidSoapProcess(self.settings.liquidsoap_script)
+            self._track_ls_process()
         except ValueError:
             logging.exception("No LiquidSoap process to track")
-            sys.exit("No LiquidSoap process to track")
+            if not self.settings.daemon_mode:
+                sys.exit("No LiquidSoap process to track")
+        startup_trace.mark("process discovery")
         logging.debug("Settings set on SilenceNotifyJob")
 
-    def _populate_next_delay(self):
-        """Extend self._delays with the next delay."""
-        next_delay = self._calculate_next_delay(self._delays)
-        self._delays.append(next_delay)
+    def update_settings(self, settings):
+        """Use new settings from the next silence on.
+
+        The warnings of an ongoing silence keep their schedule, and the
+        LiquidSoap process is only looked for again if its script changed.
+        """
+        with self._lock:
+            old_settings = self.settings
+            self.settings = settings
+            self._scheduler.update_settings(
+                settings.warning_delays,
+                settings.sec_per_min,
+                settings.max_warning_delay
+            )
+            if settings.liquidsoap_script != old_settings.liquidsoap_script:
+                try:
+                    self._track_ls_process()
+                except ValueError:
+                    logging.exception("No LiquidSoap process to track")
+
+    def _track_ls_process(self):
+        """Find the LiquidSoap process, and get notified when it exits.
+
+        Raises:
+            ValueError if no LiquidSoap process could be found.
+        """
+        if self._ls_watcher:
+            self._ls_watcher.cancel()
+            self._ls_watcher = None
+        self._ls_proc = None
+        self._ls_proc = LiquidSoapProcess(self.settings.liquidsoap_script)
+        self._ls_watcher = self._ls_proc.watch(
+            self._handle_ls_exit,
+            self._loop,
+            self._executor
+        )
+
+    def use_event_loop(self, loop, executor=None):
+        """Wait for LiquidSoap to exit on loop instead of in a thread.
+
+        Args:
+            loop: The asyncio event loop.
+            executor: Executor to handle LiquidSoap exiting in.
+        """
+        with self._lock:
+            self._loop = loop
+            self._executor = executor
+            if self._ls_proc is not None:
+                self._ls_watcher.cancel()
+                self._ls_watcher = self._ls_proc.watch(
+                    self._handle_ls_exit,
+                    loop,
+                    executor
+                )
+
+    def _handle_ls_exit(self):
+        """Called by the process watcher when LiquidSoap exits."""
+        with self._lock:
+            if self._active_state:
+                self._active_state.handle_not_running()
 
-    def _calculate_next_delay(self, previous_delays):
-        """Return the next delay, based on the earlier delays.
+    def start_episode(self, slack_client):
+        """Start the warnings for a new silence, the first one right away
+        unless silences must last min_silence_duration seconds.
+
+        Used in daemon mode, where the job lives on between silences.
 
         Args:
-            previous_delays: List of earlier delays.
-        """
-        num_delays = len(previous_delays)
-        warning_delays = self.settings.warning_delays
-        if num_delays < len(warning_delays):
-            # Use the delays from the settings
-            return warning_delays[num_delays]
-        elif len(warning_delays) == 1:
-            # Just repeat the one delay
-            return warning_delays[0]
-        else:
-            # Do some fib stuff
-            n_2 = previous_delays[-2]
-            n_1 = previous_delays[-1]
-            return n_2 + n_1
+            slack_client: The SlackClient given to run.
+        """
+        with self._lock:
+            self._scheduler.start(delay=self.settings.min_silence_duration)
+            if self._ls_proc is None or not self._ls_proc.is_running():
+                # LiquidSoap may have been restarted since we last looked
+                try:
+                    self._track_ls_process()
+                except ValueError:
+                    logging.exception("No LiquidSoap process to track")
+            self.run(slack_client)
+        self._schedule_changed()
+
+    def warning_progress(self):
+        """Return (number of warnings given, minutes into the silence the next
+        is due), or None."""
+        return self._scheduler.progress()
+
+    def pause_warnings(self):
+        """Stop giving warnings while the sound is back, without forgetting
+        how far into the silence we are."""
+        with self._lock:
+            self._scheduler.pause()
+
+    def continue_warnings(self):
+        """Continue giving warnings after pause_warnings, as if the silence
+        had not been interrupted."""
+        with self._lock:
+            self._scheduler.unpause()
+        self._schedule_changed()
+
+    def resume_warnings(self, start, num_warnings, minutes):
+        """Continue the warnings of a silence started at start (monotonic
+        clock), where num_warnings have been given."""
+        with self._lock:
+            self._scheduler.resume(start, num_warnings, minutes)
+        self._schedule_changed()
+
+    def check(self):
+        """Method run by RtmBot to ask whether run should be called now."""
+        return self._active_state is not None and self._scheduler.is_due()
+
+    def seconds_until_due(self):
+        """Return number of seconds until run should be called, or None if
+        there is no silence to warn about."""
+        if self._active_state is None or self._scheduler.progress() is None:
+            return None
+        return self._scheduler.seconds_until_due()
 
     def run(self, slack_client):
-        """Function run by RtmBot every minute."""
-        if not self._ls_proc.is_running():
-            self._active_state.handle_not_running()
-        else:
-            self._minutes_to_next -= 1
-            logging.debug("Regular job run. Minutes to next warning: " +
-                          str(self._minutes_to_next))
-            if self._minutes_to_next <= 0 and self._active_state:
-                self._active_state.handle_timer(
-                    len(self._delays),
-                    sum(self._delays)
-                )
-                # Prepare to wait for next warning
-                self._populate_next_delay()
-                self._minutes_to_next = self._delays[-1]
-                logging.debug("Warning sent. New delays: " + str(self._delays))
+        """Method run by RtmBot when the next warning is due."""
+        start = time.perf_counter()
+        with self._lock:
+            self._run()
+        self._run_seconds.observe(time.perf_counter() - start)
         return []
 
+    def _run(self):
+        """Send warning if due, while holding the lock.
+
+        LiquidSoap exiting is handled by the process watcher as soon as it
+        happens, so we only need to care about not having found it.
+        """
+        if not self._active_state:
+            # No silence in progress (daemon mode)
+            return
+        if self._ls_proc is None:
+            self._active_state.handle_not_running()
+        elif self._scheduler.is_due():
+            num_warnings, minutes = self._scheduler.next_warning()
+            self._active_state.handle_timer(num_warnings, minutes)
+            if num_warnings == 0:
+                startup_trace.mark("first warning queued")
+            if self.on_warning:
+                self.on_warning()
+            logging.debug("Warning sent. Next warning in {:.0f} seconds".format(
+                self._scheduler.seconds_until_due()
+            ))
+
 
 class SilencePlugin(Plugin):
-    """RtmBot Plugin for sending warnings about silence on the radio stream.
+    """RtmBot Plugin for sending warnings about silence on the radio streams.
+
+    Normally, the plugin assumes that the silence lasts as long as the program
+    is running. In daemon mode, the program keeps running between silences, and
+    is told when a silence starts and stops through the trigger socket.
 
-    The plugin assumes that the silence lasts as long as the program is running.
+    Each stream is watched by its own StreamMonitor. Messages mentioning us are
+    passed on to the monitor of the stream they are about.
+
+    The plugin is normally run by RtmBot, but can also be run by the asyncio
+    runtime in async_runtime.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, http_session=None, handle_signals=True,
+                 **kwargs):
+        """
+        Args:
+            http_session: requests.Session-like object used for the Radio
+                REST API. Created when first needed, if not given.
+            handle_signals: Set to False if the caller calls handle_sigterm
+                on SIGTERM itself.
+            args, kwargs: Passed on to rtmbot's Plugin.
+        """
         super().__init__(*args, **kwargs)
         logging.debug("Initializing SilencePlugin")
-        self._active_state = None
-        self._silence_notify_job = None
-        self.responsible_usernames = []
+        self._http_session = http_session
+        # RtmBot connects to Slack before loading plugins
+        startup_trace.mark("rtm connect")
+        self._trigger_server = None
+        self._metrics_exporters = []
+        self._source_pollers = []
+        self._audio_detectors = []
         self.settings = Settings()
-        self.communicator = Communicator(self.slack_client, self.settings)
-
-        self.activate_state(NoResponsibleState)
-        signal_handler.register(self)
+        startup_trace.mark("settings load")
+        self.web_client = self._create_web_client()
+        self.snapshot = self._create_snapshot()
+        self._saved_episodes = self.snapshot.load() if self.snapshot else {}
+        self.history = self._create_history()
+        self.monitors = self._create_monitors()
+        self._record_abandoned_episodes()
+        # Any communicator will do for things not tied to one stream
+        self.communicator = next(iter(self.monitors.values())).communicator
+        if handle_signals:
+            signal_handler.register(self)
 
-        self.userid = self.communicator.get_userid()
-        self.username = self.communicator.get_username()
+        for monitor in self.monitors.values():
+            monitor.communicator.on_identity_changed = functools.partial(
+                self._update_identity,
+                monitor.communicator
+            )
+        self._update_identity()
+        startup_trace.mark("identity lookup")
+        self._recorder = None
+        if self.settings.rtm_record_file:
+            self._recorder = EventRecorder(self.settings.rtm_record_file)
         logging.debug("Initialized SilencePlugin")
 
+    def _update_identity(self, communicator=None):
+        """Use the identity of communicator (by default the one not tied to
+        a stream), which may have changed, for all streams."""
+        communicator = communicator or self.communicator
+        self.userid = communicator.get_userid()
+        self.username = communicator.get_username()
+        for monitor in self.monitors.values():
+            monitor.communicator.userid = self.userid
+            monitor.communicator.username = self.username
+        self.event_filter = EventFilter(self.userid, self.monitors)
+
+    def _resolve_path(self, filename):
+        """Return absolute path of filename, taken to be relative to the
+        silence-notifier folder."""
+        if os.path.isabs(filename):
+            return filename
+        return Settings.process_config_path(filename)
+
+    def _create_web_client(self):
+        """Return the client to make Slack Web API calls with.
+
+        SlackClient opens a new connection for every call, so it is replaced
+        by a SlackWebClient, which starts connecting to Slack right away.
+        """
+        # Only a loaded slackclient can have created the client, so it need
+        # not (and with it requests) be imported just to check
+        slackclient = sys.modules.get("slackclient")
+        if not self.settings.slack_keep_alive or slackclient is None or \
+                not isinstance(self.slack_client, slackclient.SlackClient):
+            return self.slack_client
+        client = SlackWebClient(
+            self.slack_client.token,
+            self.settings.slack_api_url
+        )
+        client.prewarm()
+        return client
+
+    def _create_snapshot(self):
+        """Return the EpisodeSnapshot to use, or None if disabled."""
+        filename = self.settings.episode_snapshot_file
+        if not filename:
+            return None
+        return EpisodeSnapshot(self._resolve_path(filename))
+
+    def _create_history(self):
+        """Return the EpisodeHistory to use, or None if disabled."""
+        filename = self.settings.episode_history_file
+        if not filename:
+            return None
+        return EpisodeHistory(self._resolve_path(filename))
+
+    def _record_abandoned_episodes(self):
+        """Record the silences of a snapshot too old to resume as crashed.
+
+        Nobody was around to see them end, so they are taken to have ended
+        when the snapshot was last touched.
+        """
+        if self.history is None or self.snapshot is None:
+            return
+        for name, episode in self.snapshot.abandoned.items():
+            monitor = self.monitors.get(name)
+            try:
+                warnings = episode["warnings"]
+                self.history.record(
+                    name,
+                    episode["started_at"],
+                    self.snapshot.abandoned_at,
+                    "crash",
+                    warnings=warnings[0] if warnings else 0,
+                    volunteers=episode.get("volunteers",
+                                           episode["responsible_usernames"]),
+                    first_volunteer=episode.get("first_volunteer_after"),
+                    schedule=monitor.communicator.schedule if monitor
+                    else None
+                )
+            except (KeyError, TypeError, IndexError):
+                logging.exception("Could not record the abandoned silence on "
+                                  + name)
+
+    def _create_monitors(self):
+        """Return ordered dictionary mapping stream names to StreamMonitor
+        instances, which share Slack queue, notifiers and show schedules."""
+        sender = SlackSender(self.web_client)
+        self.notifiers = create_fanout(self.settings.notifiers, sender)
+        identity_cache = None
+        if self.settings.identity_cache_file:
+            identity_cache = IdentityCache(
+                self._resolve_path(self.settings.identity_cache_file)
+            )
+        schedules = dict()
+        monitors = OrderedDict()
+
+        for name, settings in self.settings.streams().items():
+            schedule = schedules.get(settings.rr_api)
+            if schedule is None:
+                schedule = ShowSchedule(
+                    settings.rr_api,
+                    session=self._http_session,
+                    max_age=settings.show_schedule_max_age,
+                    timezone=settings.rr_api_timezone
+                )
+                schedules[settings.rr_api] = schedule
+                if settings.daemon_mode:
+                    schedule.refresh_periodically(
+                        settings.show_schedule_max_age
+                    )
+                else:
+                    schedule.refresh_async()
+
+            communicator = Communicator(
+                self.web_client,
+                settings,
+                sender,
+                schedule,
+                identity_cache,
+                self.notifiers
+            )
+            monitors[name] = StreamMonitor(
+                name,
+                settings,
+                communicator,
+                self.snapshot,
+                self.history
+            )
+            metrics.track_monitor(monitors[name])
+        return monitors
+
     def register_jobs(self):
         """
         Method run by RtmBot to register jobs which should be run periodically.
         """
-        self._silence_notify_job = SilenceNotifyJob(self.settings.sec_per_min)
-        self._silence_notify_job.update_state(self._active_state)
-        self._silence_notify_job.set_settings(
-            self.settings
-        )
-        self.jobs.append(self._silence_notify_job)
+        for monitor in self.monitors.values():
+            job = SilenceNotifyJob(
+                monitor.settings.sec_per_min,
+                monitor.lock,
+                monitor.name
+            )
+            monitor.attach_job(job)
+            self.jobs.append(job)
         logging.debug("Jobs registered")
+        self._resume_episodes()
 
-    def activate_no_responsible_state(self):
-        """Method for states, used to switch to the NoResponsibleState."""
-        self.activate_state(NoResponsibleState)
+        if self.settings.daemon_mode:
+            self._start_trigger_server()
+        self._metrics_exporters = metrics.start_exporters(self.settings)
+        self._start_audio_detectors()
+        self._start_source_pollers()
+        if self.settings.hot_reload_settings:
+            SettingsWatcher(self.settings, self.reload_settings).start()
 
-    def activate_some_responsible_state(self):
-        """Method for states, used to switch to the SomeResponsibleState."""
-        self.activate_state(SomeResponsibleState)
+    def _resume_episodes(self):
+        """Continue the silences which were ongoing when the process running
+        before us crashed."""
+        start = time.perf_counter()
+        for name, episode in self._saved_episodes.items():
+            monitor = self.monitors.get(name)
+            if monitor is None:
+                logging.warning("Cannot resume the silence on {}, which is no "
+                                "longer in the settings".format(name))
+                continue
+            try:
+                monitor.restore(episode)
+            except (KeyError, TypeError, ValueError):
+                logging.exception("Could not resume the silence on " + name)
+        if self._saved_episodes:
+            logging.info("Resumed silences in {:.1f} ms".format(
+                (time.perf_counter() - start) * 1000
+            ))
+        self._saved_episodes = dict()
 
-    def activate_state(self, new_state_class):
-        """Change to the given state.
+    def reload_settings(self, settings):
+        """Switch to new settings without disturbing ongoing silences.
+
+        Streams cannot be added or removed this way; that requires a restart.
+        """
+        streams = settings.streams()
+        for name, monitor in self.monitors.items():
+            if name in streams:
+                monitor.update_settings(streams[name])
+            else:
+                logging.warning("Stream {} was removed from the settings, "
+                                "restart to stop monitoring it".format(name))
+        for name in streams:
+            if name not in self.monitors:
+                logging.warning("Stream {} was added to the settings, restart "
+                                "to start monitoring it".format(name))
+        self.settings = settings
+
+    def _start_audio_detectors(self):
+        """Start listening to the audio of the streams which have the audio
+        detector enabled."""
+        for monitor in self.monitors.values():
+            options = dict(monitor.settings.audio_detector or dict())
+            source = options.pop('source', None)
+            command = options.pop('command', None)
+            if not (source or command):
+                continue
+            if not monitor.settings.daemon_mode:
+                logging.warning("audio_detector requires daemon_mode, not "
+                                "listening for silence")
+                continue
+            # Imported here, so NumPy is only needed when this is used
+            from silence_notifier.audio_detector import AudioSilenceDetector
+            detector = AudioSilenceDetector(
+                monitor.start_episode,
+                monitor.stop_episode,
+                **options
+            )
+            detector.start(source, command)
+            self._audio_detectors.append(detector)
+            logging.debug("Listening for silence on " + monitor.name)
+
+    def _start_source_pollers(self):
+        """Start asking LiquidSoap what is on air, for the streams which have
+        the LiquidSoap server enabled."""
+        for monitor in self.monitors.values():
+            options = dict(monitor.settings.liquidsoap_server or dict())
+            address = options.pop('address', None)
+            if not address:
+                continue
+            if not monitor.settings.daemon_mode:
+                logging.warning("liquidsoap_server requires daemon_mode, not "
+                                "asking LiquidSoap what is on air")
+                continue
+            commands = options.pop('commands', None)
+            if not commands:
+                logging.warning("No commands given under liquidsoap_server, "
+                                "not asking LiquidSoap what is on air")
+                continue
+            poller = SourcePoller(
+                LiquidSoapClient(address, options.pop('timeout', 2.0)),
+                commands,
+                options.pop('silent_answers', None) or [],
+                monitor.start_episode,
+                monitor.stop_episode,
+                **options
+            )
+            poller.start()
+            self._source_pollers.append(poller)
+            logging.debug("Asking LiquidSoap at {} what is on air on {}"
+                          .format(address, monitor.name))
+
+    def _start_trigger_server(self):
+        """Start listening for silences starting and stopping."""
+        self._trigger_server = TriggerServer(
+            self.settings.trigger_socket,
+            {
+                "start": self.start_episode,
+                "stop": self.stop_episode,
+            }
+        )
+        self._trigger_server.start()
+
+    def get_monitor(self, stream=None):
+        """Return the StreamMonitor of the given stream.
 
         Args:
-            new_state_class: The class of the state we should switch to.
+            stream: Name of the stream. May be left out when there is only one.
+
+        Raises:
+            ValueError if there is no such stream.
         """
-        logging.debug("Changing to state " + new_state_class.__name__)
-        new_state_instance = new_state_class(self)
-        self._active_state = new_state_instance
-        if self._silence_notify_job:
-            self._silence_notify_job.update_state(new_state_instance)
+        if stream is None:
+            if len(self.monitors) == 1:
+                return next(iter(self.monitors.values()))
+            raise ValueError("Specify one of the streams: " +
+                             ", ".join(self.monitors))
+        try:
+            return self.monitors[stream]
+        except KeyError:
+            raise ValueError("Unknown stream {}".format(stream))
+
+    def start_episode(self, stream=None):
+        """Start warning about a new silence on stream (daemon mode)."""
+        self.get_monitor(stream).start_episode()
+
+    def stop_episode(self, stream=None):
+        """Announce that the silence on stream is over (daemon mode)."""
+        self.get_monitor(stream).stop_episode()
 
     def handle_sigterm(self):
         """Do whatever must be done when the program is asked to shut down."""
         logging.debug("Reacting to SIGTERM")
-        self._active_state.handle_silence_stop()
+        if self._trigger_server:
+            self._trigger_server.close()
+        for poller in self._source_pollers:
+            poller.stop()
+        for detector in self._audio_detectors:
+            detector.stop()
+        for monitor in self.monitors.values():
+            monitor.handle_sigterm()
+        deadline = time.monotonic() + self.settings.shutdown_timeout
+        self.communicator.sender.shutdown(self.settings.shutdown_timeout)
+        self.notifiers.shutdown(max(0.0, deadline - time.monotonic()))
+        if self.history:
+            self.history.flush(self.history.flush_timeout)
+        for exporter in self._metrics_exporters:
+            exporter.close()
+        if self._recorder:
+            self._recorder.close()
+        if self.web_client is not self.slack_client:
+            self.web_client.close()
 
     def process_message(self, data):
         """Method run by RtmBot to process messages received.
 
-        Check if the message pertains to us, and let the currently active state
-        handle it.
+        Check if the message pertains to us, and let the monitor of the stream
+        it is about handle it.
 
         Args:
             data: The received data from Slack.
         """
         if self.relevant_message(data):
             logging.debug("Relevant message: " + data['text'])
-            self._active_state.handle_message(data)
+            monitor = self.route_message(data)
+            if monitor:
+                monitor.handle_message(data)
+            else:
+                logging.debug("No stream to pass the message on to")
+
+    def route_message(self, data):
+        """Return the StreamMonitor which data is about, or None.
+
+        Replies go to the stream which started the thread. Other messages go
+        to the stream with an ongoing silence in the channel the message was
+        posted in, preferring the most recent silence.
+        """
+        thread_ts = data.get('thread_ts')
+        if thread_ts:
+            for monitor in self.monitors.values():
+                if monitor.communicator.has_posted(thread_ts):
+                    return monitor
+
+        if len(self.monitors) == 1:
+            return next(iter(self.monitors.values()))
+
+        candidates = [
+            monitor for monitor in self.monitors.values()
+            if monitor.is_active() and
+            monitor.communicator.channel_id in (None, data.get('channel'))
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda monitor: monitor.started_at)
 
     def relevant_message(self, data):
         """Check whether the message is relevant to us.
 
-        Relevant here means that our bot is mentioned.
+        Relevant here means that our bot is mentioned, in a message written by
+        someone else where our warnings are, while there is a silence.
         """
-        mentions_us = 'text' in data and self.userid in data['text']
-        return mentions_us
+        return self.event_filter.accept(data)
+
+    def catch_all(self, data):
+        """Method run by RtmBot for every event received."""
+        if self._recorder:
+            self._recorder.record(data)
@@ -1,5 +1,13 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import os
 import os.path
-import yaml
+from collections import OrderedDict
+
+from silence_notifier.message_catalog import MessageCatalog
 
 
 THIS_SCRIPT_FOLDER = os.path.dirname(__file__)
@@ -13,6 +21,8 @@ class Settings:
     """
     def __init__(self, *config_files):
         self._settings = dict()
+        self.message_catalog = None
+        self.config_files = []
         self.load_settings(config_files)
 
     def load_settings(self, config_files=None):
@@ -26,14 +36,22 @@ class Settings:
                 later configuration files overwrite values in earlier ones.
 
         Note that this method is executed as a part of __init__.
+
+        Raises:
+            ValueError if the messages are not valid.
         """
         if not config_files:
             actual_config_files = self.get_default_config_files()
         else:
             actual_config_files = [self.get_default_default_config_file()] + \
-                                  config_files
+                                  list(config_files)
 
-        self._settings = self.load_from_file(actual_config_files)
+        self.config_files = actual_config_files
+        self._settings = self.load_from_file(
+            actual_config_files,
+            self.get_default_cache_file()
+        )
+        self.message_catalog = MessageCatalog(self._settings['messages'])
 
     def get_default_config_files(self):
         """Return the default list of configuration files."""
@@ -50,6 +68,10 @@ class Settings:
         """Return the default path for the default settings file."""
         return self.process_config_path("settings_default.yaml")
 
+    def get_default_cache_file(self):
+        """Return the default path for the compiled settings cache."""
+        return self.process_config_path(".settings_cache")
+
     @staticmethod
     def process_config_path(filename):
         """Process filename so it becomes absolute path, assuming it to be a
@@ -59,28 +81,194 @@ class Settings:
         return os.path.normpath(absolute_path)
 
     @staticmethod
-    def load_from_file(config_files):
+    def load_from_file(config_files, cache_file=None):
         """Create dictionary with settings from the list of files.
 
         Args:
             config_files: List of files to read settings from.
+            cache_file: If given, the merged settings are stored in this file,
+                and used instead of parsing the configuration files for as
+                long as they are unchanged.
 
         Returns:
             Dictionary where items defined in earlier files are overwritten by
             same items found in later files.
         """
-        settings = dict()
+        stats = [Settings._stat(f) for f in config_files]
+        cached = Settings._read_cache(cache_file) if cache_file else None
+        if cached and cached['stats'] == stats:
+            return cached['settings']
 
+        contents = []
         for single_config_file in config_files:
-            with open(single_config_file) as fp:
-                document = yaml.load(fp)
+            with open(single_config_file, 'rb') as fp:
+                contents.append(fp.read())
+        hashes = [hashlib.sha256(content).hexdigest() for content in contents]
+
+        if cached and cached['hashes'] == hashes:
+            # Only the modification times have changed
+            settings = cached['settings']
+        else:
+            # Imported here, so YAML is only loaded (unless the launcher has
+            # already) and parsed when the cache is outdated
+            import yaml
+            # Use the much faster C implementation of the parser if available
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+            settings = dict()
+            for content in contents:
+                document = yaml.load(content, Loader=loader)
+                settings.update(document or dict())
 
-            settings.update(document)
+        if cache_file:
+            Settings._write_cache(cache_file, {
+                'stats': stats,
+                'hashes': hashes,
+                'settings': settings,
+            })
         return settings
 
+    @staticmethod
+    def _stat(filename):
+        """Return what is needed to tell if filename has changed."""
+        stat = os.stat(filename)
+        return filename, stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _read_cache(cache_file):
+        """Return the contents of the settings cache, or None.
+
+        The cache is JSON, so whoever can write to it can at most change the
+        settings, not run code in silence-notifier.
+        """
+        try:
+            with open(cache_file, 'rb') as fp:
+                cached = _from_json(json.loads(fp.read().decode('utf-8')))
+            # JSON turns the tuples from _stat into lists
+            cached['stats'] = [tuple(stat) for stat in cached['stats']]
+            return cached
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.warning("Ignoring unreadable settings cache " + cache_file)
+            return None
+
+    @staticmethod
+    def _write_cache(cache_file, cached):
+        """Replace the settings cache with cached."""
+        temporary_file = cache_file + '.tmp'
+        try:
+            content = json.dumps(_to_json(cached)).encode('utf-8')
+        except TypeError as e:
+            logging.debug("Not caching settings: {}".format(e))
+            return
+        try:
+            with open(temporary_file, 'wb') as fp:
+                fp.write(content)
+            os.replace(temporary_file, cache_file)
+        except OSError:
+            logging.debug("Could not write settings cache " + cache_file)
+
+    def streams(self):
+        """Return ordered dictionary mapping the name of each stream to its
+        settings.
+
+        Streams are defined under the streams setting, where each stream
+        overrides the settings it does not share with the top level settings.
+        Without any streams defined, there is one stream called main which
+        uses the top level settings.
+        """
+        streams = self._settings.get('streams')
+        if not streams:
+            return OrderedDict([('main', self)])
+
+        return OrderedDict(
+            (name, self.derive(overrides or dict()))
+            for name, overrides in streams.items()
+        )
+
+    def derive(self, overrides):
+        """Return new Settings with the given settings replaced.
+
+        Raises:
+            ValueError if the messages are not valid.
+        """
+        derived = Settings.__new__(Settings)
+        derived._settings = dict(self._settings)
+        derived._settings.pop('streams', None)
+        derived._settings.update(overrides)
+        if 'messages' in overrides:
+            derived.message_catalog = MessageCatalog(overrides['messages'])
+        else:
+            derived.message_catalog = self.message_catalog
+        return derived
+
     def __getattr__(self, item):
         """Make settings loaded from files available as properties."""
         try:
             return self._settings[item]
         except KeyError:
             raise AttributeError(item)
+
+
+def _to_json(value):
+    """Return value, as loaded from YAML, in a form JSON can represent.
+
+    Values JSON has no type for, like dictionaries with numbers for keys (as
+    under messages.warnings) and dates, are written as dictionaries telling
+    _from_json what they were.
+
+    Raises:
+        TypeError if value contains something YAML does not produce.
+    """
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and \
+                '__type__' not in value:
+            return {key: _to_json(item) for key, item in value.items()}
+        return {'__type__': 'dict', 'items': [
+            [_to_json(key), _to_json(item)] for key, item in value.items()
+        ]}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {'__type__': 'set',
+                'items': [_to_json(item) for item in value]}
+    if isinstance(value, datetime.datetime):
+        return {'__type__': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__type__': 'date', 'value': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__type__': 'bytes',
+                'value': base64.b64encode(value).decode('ascii')}
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise TypeError("Cannot cache {!r}".format(value))
+
+
+def _from_json(value):
+    """Return value as it was before _to_json."""
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get('__type__')
+    if kind is None:
+        return {key: _from_json(item) for key, item in value.items()}
+    if kind == 'dict':
+        return {_hashable(_from_json(key)): _from_json(item)
+                for key, item in value['items']}
+    if kind == 'set':
+        return {_hashable(_from_json(item)) for item in value['items']}
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(value['value'])
+    if kind == 'date':
+        return datetime.date.fromisoformat(value['value'])
+    if kind == 'bytes':
+        return base64.b64decode(value['value'])
+    raise ValueError("Unknown type {!r} in settings cache".format(kind))
+
+
+def _hashable(value):
+    """Return value with lists turned into tuples, for use as a key."""
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
@@ -0,0 +1,148 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import os.path
+import select
+import struct
+import threading
+
+from silence_notifier.settings import Settings
+
+
+class SettingsWatcher:
+    """Watch the settings files, and load them again when they change.
+
+    inotify is used where available, so changes are seen right away without
+    polling. Elsewhere, the modification times are checked periodically.
+    """
+    poll_interval = 2.0
+    # Seconds to wait for more changes before reloading, since editors often
+    # write files in several steps
+    settle_time = 0.2
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    _event_header = struct.Struct("iIII")
+
+    def __init__(self, settings, on_reload):
+        """
+        Args:
+            settings: The Settings currently in use.
+            on_reload: Function called with a new, validated Settings
+                instance whenever the files have changed.
+        """
+        self.settings = settings
+        self.on_reload = on_reload
+        self._thread = None
+
+    def start(self):
+        """Start watching in a background thread."""
+        self._thread = threading.Thread(
+            target=self._watch,
+            name="settings-watcher",
+            daemon=True
+        )
+        self._thread.start()
+
+    def _watch(self):
+        try:
+            fd = self._inotify_init()
+        except OSError:
+            logging.debug("inotify unavailable, polling the settings files")
+            self._poll()
+        else:
+            self._watch_inotify(fd)
+
+    def _inotify_init(self):
+        """Return inotify file descriptor watching the settings folders.
+
+        Raises:
+            OSError if inotify cannot be used.
+        """
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not supported")
+
+        fd = libc.inotify_init1(self.IN_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch folders rather than files, since editors often replace files
+        mask = (self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO |
+                self.IN_CREATE)
+        for folder in self._folders():
+            if libc.inotify_add_watch(fd, os.fsencode(folder), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        return fd
+
+    def _folders(self):
+        return set(os.path.dirname(os.path.abspath(f))
+                   for f in self.settings.config_files)
+
+    def _watch_inotify(self, fd):
+        """Reload whenever inotify reports a change to a settings file."""
+        names = set(os.path.basename(f) for f in self.settings.config_files)
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        while True:
+            poller.poll()
+            changed = False
+            # Collect all events arriving within the settle time
+            while poller.poll(self.settle_time * 1000):
+                changed |= bool(names & self._read_names(fd))
+            if changed:
+                self._reload()
+
+    def _read_names(self, fd):
+        """Return set of file names in the pending inotify events."""
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self._event_header.unpack_from(data, offset)
+            offset += self._event_header.size
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def _poll(self):
+        """Reload whenever the modification time of a file changes."""
+        stamps = self._stamps()
+        stop = threading.Event()
+        while not stop.wait(self.poll_interval):
+            new_stamps = self._stamps()
+            if new_stamps != stamps:
+                stamps = new_stamps
+                self._reload()
+
+    def _stamps(self):
+        stamps = []
+        for filename in self.settings.config_files:
+            try:
+                stamps.append(os.stat(filename).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def _reload(self):
+        """Load and validate the settings, and hand them over if valid."""
+        try:
+            new_settings = Settings(*self.settings.config_files[1:])
+            new_settings.streams()
+        except Exception:
+            logging.exception("Invalid settings, keeping the current ones")
+            return
+        logging.info("Settings changed, reloading")
+        self.settings = new_settings
+        self.on_reload(new_settings)
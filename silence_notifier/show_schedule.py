@@ -0,0 +1,185 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime
+
+from silence_notifier import metrics
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+
+class ShowSchedule:
+    """Local index of the shows on the Radio REST API's schedule.
+
+    The schedule is fetched in the background, and kept as a list of shows
+    sorted by start time, so the current show is found with a binary search.
+    When the index has grown stale, the stale answer is given while a fresh
+    copy is fetched in the background. Nothing ever waits on the API: until
+    the first fetch is done, the current show is simply not known.
+    """
+    current_shows_uri = "/v2/sendinger/currentshows"
+    # Entries of the currentshows response which are put in the index
+    indexed_entries = ("previous", "current", "next")
+
+    def __init__(self, api_root, session=None, max_age=300.0,
+                 timezone="Europe/Oslo"):
+        """
+        Args:
+            api_root: Location of the Radio REST API, without version.
+            session: requests.Session used for all requests, so connections
+                are reused. Created when first needed, if not given.
+            max_age: Number of seconds after which the index is refreshed.
+            timezone: Name of the timezone the API's times are in, used for
+                times without a UTC offset. The host's local time is used if
+                None, or if zoneinfo is not available.
+        """
+        self.api_root = api_root
+        self.session = session
+        self.max_age = max_age
+        self.tzinfo = None
+        if timezone is not None:
+            if ZoneInfo is None:
+                logging.warning(
+                    "zoneinfo is not available, so the Radio API's times "
+                    "are taken to be in this host's timezone"
+                )
+            else:
+                self.tzinfo = ZoneInfo(timezone)
+        # Start times and (start, end, title) of the shows, sorted by start,
+        # and the title of the show the API said was on air
+        self._index = ([], [], None)
+        self._fetched_at = None
+        self._fetching = threading.Lock()
+
+    def refresh_async(self):
+        """Fetch the schedule in the background, unless already fetching."""
+        if not self._fetching.acquire(blocking=False):
+            return
+        thread = threading.Thread(
+            target=self._refresh_and_release,
+            name="show-schedule",
+            daemon=True
+        )
+        thread.start()
+
+    def refresh_periodically(self, interval):
+        """Keep the index fresh by refreshing it every interval seconds, from a
+        background thread."""
+        def refresh_forever():
+            while True:
+                self.refresh_async()
+                time.sleep(interval)
+
+        threading.Thread(
+            target=refresh_forever,
+            name="show-schedule-timer",
+            daemon=True
+        ).start()
+
+    def _refresh_and_release(self):
+        try:
+            self.refresh()
+        finally:
+            self._fetching.release()
+
+    def refresh(self):
+        """Fetch the schedule and replace the index with it."""
+        start = time.perf_counter()
+        try:
+            if self.session is None:
+                # Imported here, so this module does not load requests on the
+                # way to the first warning (though under RtmBot, slackclient
+                # has loaded it already)
+                import requests
+                self.session = requests.Session()
+            r = self.session.get(
+                self.api_root + self.current_shows_uri,
+                timeout=10.0
+            )
+            r.raise_for_status()
+            data = r.json()
+            shows = self._parse(data)
+            current = (data.get("current") or dict()).get("title")
+        except Exception:
+            logging.exception("Error occurred while retrieving current show")
+            metrics.RADIO_API_ERRORS.inc()
+            return
+        finally:
+            metrics.RADIO_API_SECONDS.observe(time.perf_counter() - start)
+
+        # Replace everything at once, so readers never see it out of sync
+        self._index = ([s[0] for s in shows], shows, current)
+        self._fetched_at = time.monotonic()
+        logging.debug("Show schedule refreshed, {} shows".format(len(shows)))
+
+    def _parse(self, data):
+        """Return list of (start, end, title) sorted by start, from the data
+        returned by the API."""
+        shows = []
+        for key in self.indexed_entries:
+            entry = data.get(key)
+            if not entry or "title" not in entry:
+                continue
+            try:
+                start = self._parse_time(entry["starttime"])
+                end = self._parse_time(entry["endtime"])
+            except (KeyError, ValueError):
+                if key == "current":
+                    # No times given, so assume it lasts until we refresh
+                    now = time.time()
+                    start, end = now, now + self.max_age
+                else:
+                    continue
+            shows.append((start, end, entry["title"]))
+        shows.sort()
+        return shows
+
+    def _parse_time(self, value):
+        """Return the ISO 8601 time string value as a POSIX timestamp.
+
+        Times without a UTC offset are taken to be in self.tzinfo.
+        """
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError("Unknown time format: {}".format(value))
+        if parsed.tzinfo is None and self.tzinfo is not None:
+            parsed = parsed.replace(tzinfo=self.tzinfo)
+        return parsed.timestamp()
+
+    def is_stale(self, now=None):
+        """Return True if the index is old or does not cover now."""
+        if self._fetched_at is None:
+            return True
+        if time.monotonic() - self._fetched_at > self.max_age:
+            return True
+        now = time.time() if now is None else now
+        shows = self._index[1]
+        return not shows or shows[-1][1] <= now
+
+    def current_show(self, now=None):
+        """Return the title of the show on air now, or None if there is none.
+
+        When no show in the index covers now, the show the API said was on
+        air when the schedule was fetched is returned instead.
+
+        Raises:
+            LookupError if the schedule has not been fetched (yet). A fetch is
+            started in the background, but not waited on.
+        """
+        now = time.time() if now is None else now
+        if self.is_stale(now):
+            self.refresh_async()
+
+        starts, shows, current = self._index
+        if self._fetched_at is None:
+            raise LookupError("The show schedule has not been fetched")
+
+        i = bisect.bisect_right(starts, now) - 1
+        if i >= 0 and now < shows[i][1]:
+            return shows[i][2]
+        return current
@@ -1,6 +1,7 @@
 import logging
 import signal
 import threading
+import _thread
 
 
 def create_registerer(plugin):
@@ -9,15 +10,25 @@ def create_registerer(plugin):
     """
     lock = threading.Lock()
 
+    def shut_down():
+        """Let plugin say good bye, then stop RtmBot."""
+        try:
+            plugin.handle_sigterm()
+        finally:
+            # Halt execution, the same way Ctrl+C does
+            _thread.interrupt_main()
+
     def handle_sigterm(signum, frame):
-        """Catch a sigterm and handle the processing to plugin"""
+        """Catch a sigterm and hand the processing to plugin.
+
+        The signal handler interrupts whatever the main thread was doing, so
+        it only starts the shutdown in a thread of its own. RtmBot goes on
+        until the shutdown is done, but no longer has a silence to warn about.
+        """
         # Protect so only one sigterm is handled, not two at once
         if lock.acquire(blocking=False):
             logging.debug("First SIGTERM received.")
-            # Send our good bye message
-            plugin.handle_sigterm()
-            # Halt execution
-            raise KeyboardInterrupt()
+            threading.Thread(target=shut_down, name="shutdown").start()
         else:
             logging.debug("SIGTERM received, but we are already handling one.")
     return handle_sigterm
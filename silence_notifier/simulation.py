@@ -0,0 +1,452 @@
+"""Discrete-event simulation of silences, for tuning the warning settings.
+
+The StreamMonitor and SilenceNotifyJob of one stream are run on a simulated
+clock, against a Communicator whose calls to Slack are recorded instead of
+made. Nothing waits for real time to pass: the simulator jumps straight to the
+next thing which happens, be it a warning becoming due, someone volunteering,
+Slack answering a call, the grace period running out or the silence ending.
+Hours of silence thus take microseconds, and the warnings and messages given
+by different settings can be compared on real outages.
+
+Silences are read from the history written by episode_history, or from a JSON
+file with a list of scripted silences like this one (times in seconds since
+the silence started):
+
+    {"duration": 1800, "show": "Morgenshow", "ending": "sound",
+     "events": [{"at": 300, "message": "U123"},
+                {"at": 900, "message": "U123"},
+                {"at": 1000, "stop": true}, {"at": 1030, "start": true}]}
+
+A "message" is a mention of the bot from the given user, which makes them
+responsible, or no longer responsible if they already were. "stop" and "start"
+make LiquidSoap report the sound coming back and disappearing again, and
+"process_exit" makes LiquidSoap exit. The silence ends after duration seconds,
+with the sound coming back, or with LiquidSoap exiting if ending is
+"not_running".
+
+Usage (from the silence-notifier folder):
+    python -m silence_notifier.simulation (--history .episode_history |
+        --script silences.json) [--settings settings.yaml]
+        [--warning-delays 1 2 3] [--max-warning-delay 60]
+        [--min-silence-duration 0] [--grace-period 0] [--json]
+"""
+import argparse
+import heapq
+import json
+import logging
+import os.path
+import statistics
+import sys
+import time
+
+from silence_notifier.clock import Clock
+from silence_notifier.communication import Communicator
+from silence_notifier.rtmbot_plugin import SilenceNotifyJob
+from silence_notifier.settings import Settings
+from silence_notifier.stream_monitor import StreamMonitor
+
+CHANNEL_ID = "CSIMULATED"
+
+
+class SimulatedClock(Clock):
+    """Clock which only moves when the simulator moves it."""
+
+    def __init__(self, simulator, epoch=None):
+        """
+        Args:
+            simulator: The Simulator making the delayed calls.
+            epoch: Seconds since the epoch when the simulation starts.
+        """
+        self.simulator = simulator
+        self.now = 0.0
+        self.epoch = time.time() if epoch is None else epoch
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    def call_later(self, seconds, function, *args):
+        return self.simulator.at(self.now + seconds, function, *args)
+
+
+class _Event:
+    """Call scheduled by the simulator, which can be cancelled."""
+    __slots__ = ("function", "args", "cancelled")
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class RecordingSender:
+    """Stand-in for SlackSender which records the calls instead of making
+    them, and answers each of them latency simulated seconds later."""
+
+    def __init__(self, simulator, latency):
+        self.simulator = simulator
+        self.latency = latency
+        # Tuples of (simulated time, method, arguments)
+        self.calls = []
+        self._ts = 0
+
+    def submit(self, method, on_success=None, on_failure=None,
+               mergeable=True, **kwargs):
+        clock = self.simulator.clock
+        self.calls.append((clock.now, method, kwargs))
+        if on_success is not None:
+            self._ts += 1
+            data = {
+                "ok": True,
+                "channel": CHANNEL_ID,
+                "ts": "{}.{:06d}".format(int(clock.time()), self._ts),
+            }
+            if "thread_ts" in kwargs:
+                data["message"] = {"thread_ts": kwargs["thread_ts"]}
+            self.simulator.at(clock.now + self.latency, on_success, data)
+        return True
+
+    def flush(self, timeout=None):
+        return True
+
+    def shutdown(self, timeout):
+        return []
+
+
+class SimulatedSchedule:
+    """Stand-in for ShowSchedule, with the show of the simulated silence."""
+
+    def __init__(self):
+        self.show = None
+
+    def current_show(self, now=None):
+        return self.show
+
+    def is_stale(self, now=None):
+        return False
+
+    def refresh_async(self):
+        pass
+
+
+class RecordingCommunicator(Communicator):
+    """Communicator which records the type of every message it sends.
+
+    Messages are composed as usual, and their calls to Slack are recorded by
+    a RecordingSender.
+    """
+
+    def __init__(self, settings, sender, schedule, clock):
+        super().__init__(None, settings, sender, schedule)
+        self.clock = clock
+        # Tuples of (simulated time, message type)
+        self.sent = []
+
+    def send(self, message_type, num_minutes=None, reply_to=None, **kwargs):
+        self.sent.append((self.clock.monotonic(), message_type))
+        super().send(message_type, num_minutes, reply_to, **kwargs)
+
+
+class SimulatedProcess:
+    """Stand-in for the LiquidSoap process."""
+    pid = 0
+
+    def __init__(self):
+        self.running = True
+
+    def is_running(self):
+        return self.running
+
+
+class SimulatedJob(SilenceNotifyJob):
+    """SilenceNotifyJob tracking a SimulatedProcess instead of LiquidSoap."""
+
+    def _track_ls_process(self):
+        self._ls_proc = SimulatedProcess()
+
+    def exit_process(self):
+        """Make LiquidSoap exit."""
+        if self._ls_proc is not None:
+            self._ls_proc.running = False
+        self._handle_ls_exit()
+
+
+class Simulator:
+    """Run silences through the state machine of one stream on simulated
+    time."""
+    # Simulated seconds between two silences, so they are not taken as one
+    gap = 86400.0
+
+    def __init__(self, settings, slack_latency=0.5):
+        """
+        Args:
+            settings: The Settings to simulate. They are used in daemon mode
+                whatever they say.
+            slack_latency: Simulated seconds Slack takes to answer each call.
+        """
+        self.settings = settings.derive({"daemon_mode": True})
+        self.clock = SimulatedClock(self)
+        self._events = []
+        self._sequence = 0
+        self.sender = RecordingSender(self, slack_latency)
+        self.schedule = SimulatedSchedule()
+        self.communicator = RecordingCommunicator(
+            self.settings,
+            self.sender,
+            self.schedule,
+            self.clock
+        )
+        self.monitor = StreamMonitor(
+            "main",
+            self.settings,
+            self.communicator,
+            clock=self.clock
+        )
+        self.job = SimulatedJob(
+            self.settings.sec_per_min,
+            self.monitor.lock,
+            clock=self.clock
+        )
+        self.monitor.attach_job(self.job)
+
+    def at(self, when, function, *args):
+        """Call function with args when the simulated clock reaches when.
+
+        Returns:
+            Object with a cancel method.
+        """
+        event = _Event(function, args)
+        self._sequence += 1
+        heapq.heappush(self._events, (when, self._sequence, event))
+        return event
+
+    def run(self):
+        """Make the calls and give the warnings in order of time, until there
+        is nothing more to do."""
+        while True:
+            due = self.job.seconds_until_due()
+            if self._events:
+                next_at = self._events[0][0]
+            elif due is None:
+                return
+            else:
+                next_at = float("inf")
+            if due is not None and self.clock.now + due <= next_at:
+                self.clock.now += due
+                self.job.run(None)
+                continue
+            when, _, event = heapq.heappop(self._events)
+            if event.cancelled:
+                continue
+            self.clock.now = max(self.clock.now, when)
+            event.function(*event.args)
+
+    def run_episode(self, episode) -> dict:
+        """Simulate one silence, described as in the module docstring.
+
+        Returns:
+            Dictionary with the number of messages sent of each type, the
+            number of calls to Slack, the seconds until the first warning and
+            until the first volunteer (or None), and the number of warnings
+            given before someone volunteered.
+        """
+        start = self.clock.now
+        first_message = len(self.communicator.sent)
+        first_call = len(self.sender.calls)
+        self.schedule.show = episode.get("show")
+
+        self.monitor.start_episode()
+        for event in episode.get("events", ()):
+            self.at(start + event["at"], self._handle_event, event)
+        end = start + episode["duration"]
+        if episode.get("ending") == "not_running":
+            self.at(end, self.job.exit_process)
+        else:
+            self.at(end, self.monitor.stop_episode)
+        self.run()
+        self.clock.now += self.gap
+
+        messages = dict()
+        first_warning = None
+        first_volunteer = None
+        warnings_before_volunteer = 0
+        for at, message_type in self.communicator.sent[first_message:]:
+            messages[message_type] = messages.get(message_type, 0) + 1
+            if message_type == "warnings":
+                if first_warning is None:
+                    first_warning = at - start
+                if first_volunteer is None:
+                    warnings_before_volunteer += 1
+            elif message_type == "new_responsible" and \
+                    first_volunteer is None:
+                first_volunteer = at - start
+        return {
+            "messages": messages,
+            "slack_calls": len(self.sender.calls) - first_call,
+            "first_warning_after": first_warning,
+            "first_volunteer_after": first_volunteer,
+            "warnings_before_volunteer": warnings_before_volunteer,
+        }
+
+    def _handle_event(self, event):
+        if "message" in event:
+            self.monitor.handle_message({
+                "type": "message",
+                "channel": CHANNEL_ID,
+                "user": event["message"],
+                "text": "",
+                "ts": "{:.6f}".format(self.clock.time()),
+            })
+        elif event.get("stop"):
+            self.monitor.stop_episode()
+        elif event.get("start"):
+            self.monitor.start_episode()
+        elif event.get("process_exit"):
+            self.job.exit_process()
+        else:
+            raise ValueError("Unknown event {!r}".format(event))
+
+
+def episodes_from_history(filename, since=None, until=None):
+    """Yield the silences recorded in the history as scripted silences.
+
+    Only when the first volunteer came is recorded, so every volunteer is
+    taken to have volunteered then.
+    """
+    # Imported here, so the history is only needed when used
+    from silence_notifier.episode_history import ENDINGS, MAX_VOLUNTEERS, \
+        HistoryReader
+    reader = HistoryReader(filename)
+    try:
+        for record in reader.records(since, until):
+            first_volunteer = record[2]
+            volunteers = record[8:8 + min(record[7], MAX_VOLUNTEERS)]
+            events = []
+            if first_volunteer >= 0:
+                events = [{"at": first_volunteer,
+                           "message": reader.strings[user]}
+                          for user in volunteers]
+            yield {
+                "duration": max(0.0, record[1] - record[0]),
+                "show": reader.strings[record[4]],
+                "ending": ENDINGS[record[6] - 1],
+                "events": events,
+            }
+    finally:
+        reader.close()
+
+
+def summarize(results, settings) -> dict:
+    """Aggregate the results of Simulator.run_episode."""
+    messages = dict()
+    for result in results:
+        for message_type, count in result["messages"].items():
+            messages[message_type] = messages.get(message_type, 0) + count
+    first_warnings = [result["first_warning_after"] for result in results
+                      if result["first_warning_after"] is not None]
+    volunteered = [result for result in results
+                   if result["first_volunteer_after"] is not None]
+    num_silences = len(results) or 1
+    return {
+        "silences": len(results),
+        "messages": messages,
+        "messages_per_silence": sum(messages.values()) / num_silences,
+        "warnings_per_silence": messages.get("warnings", 0) / num_silences,
+        "slack_calls_per_silence":
+            sum(result["slack_calls"] for result in results) / num_silences,
+        "silences_warned_about": len(first_warnings),
+        "median_minutes_to_first_warning":
+            statistics.median(first_warnings) / settings.sec_per_min
+            if first_warnings else None,
+        "warnings_before_volunteer":
+            statistics.mean(result["warnings_before_volunteer"]
+                            for result in volunteered)
+            if volunteered else None,
+    }
+
+
+def _load_settings(filename):
+    """Return Settings from settings_default.yaml and filename, if given and
+    present."""
+    if filename and os.path.exists(filename):
+        return Settings(filename)
+    return Settings(Settings.process_config_path("settings_default.yaml"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--history",
+                        help="simulate the silences in this history")
+    source.add_argument("--script",
+                        help="simulate the silences in this JSON file")
+    parser.add_argument("--settings",
+                        default=Settings.process_config_path("settings.yaml"),
+                        help="settings to use on top of settings_default.yaml")
+    parser.add_argument("--warning-delays", type=float, nargs="+",
+                        help="override warning_delays")
+    parser.add_argument("--max-warning-delay", type=float,
+                        help="override max_warning_delay")
+    parser.add_argument("--min-silence-duration", type=float,
+                        help="override min_silence_duration")
+    parser.add_argument("--grace-period", type=float,
+                        help="override episode_grace_period")
+    parser.add_argument("--slack-latency", type=float, default=0.5,
+                        help="seconds Slack takes to answer")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+    # Every simulated silence logs what a real one would
+    logging.disable(logging.ERROR)
+
+    overrides = {
+        name: value for name, value in (
+            ("warning_delays", args.warning_delays),
+            ("max_warning_delay", args.max_warning_delay),
+            ("min_silence_duration", args.min_silence_duration),
+            ("episode_grace_period", args.grace_period),
+        ) if value is not None
+    }
+    settings = _load_settings(args.settings).derive(overrides)
+    if args.history:
+        episodes = list(episodes_from_history(args.history))
+    else:
+        with open(args.script) as fp:
+            episodes = json.load(fp)
+
+    start = time.perf_counter()
+    simulator = Simulator(settings, args.slack_latency)
+    results = [simulator.run_episode(episode) for episode in episodes]
+    elapsed = time.perf_counter() - start
+    summary = summarize(results, simulator.settings)
+    summary["seconds"] = elapsed
+
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+        return 0
+    print("Simulated {} silences ({:.1f} hours) in {:.2f} s".format(
+        len(results),
+        sum(episode["duration"] for episode in episodes) / 3600,
+        elapsed
+    ))
+    for message_type, count in sorted(summary["messages"].items()):
+        print("  {:<24} {:7} ({:.2f} per silence)".format(
+            message_type, count, count / (len(results) or 1)))
+    print("Slack calls per silence: {:.2f}".format(
+        summary["slack_calls_per_silence"]))
+    if summary["median_minutes_to_first_warning"] is not None:
+        print("Median minutes to first warning: {:.1f}".format(
+            summary["median_minutes_to_first_warning"]))
+    if summary["warnings_before_volunteer"] is not None:
+        print("Warnings before someone volunteered: {:.2f}".format(
+            summary["warnings_before_volunteer"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
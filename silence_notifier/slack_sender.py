@@ -0,0 +1,462 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+from silence_notifier import metrics
+
+
+class TokenBucket:
+    """Rate limiter allowing bursts of up to capacity calls, refilled at rate
+    calls per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def take(self):
+        """Take one token, and return how many seconds the caller must wait
+        before using it (0 if it can be used right away)."""
+        self._refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    def wait_time(self):
+        """Return how many seconds must pass before a token can be taken
+        without waiting."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def hold(self, seconds):
+        """Make sure no token is available for the next seconds."""
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class OutgoingCall:
+    """One queued Slack Web API call."""
+
+    def __init__(self, method, on_success=None, on_failure=None,
+                 mergeable=True, **kwargs):
+        """
+        Args:
+            method: Name of the Slack Web API method, like chat.postMessage.
+            on_success: Function called with the response data once the call
+                has succeeded. Called from the sender thread.
+            on_failure: Function called with the response data (or None) if
+                the call is given up on. Called from the sender thread.
+            mergeable: Set to False to never merge this message with others.
+            kwargs: Arguments given to the API method.
+        """
+        self.method = method
+        self.kwargs = kwargs
+        self.mergeable = mergeable
+        self.callbacks = [on_success] if on_success else []
+        self.failure_callbacks = [on_failure] if on_failure else []
+        # The submitted calls this call sends, itself included
+        self.parts = [self]
+        self.attempts = 0
+        # Monotonic time before which the call must not be retried
+        self.not_before = 0.0
+
+    @property
+    def channel(self):
+        return self.kwargs.get("channel")
+
+    def can_be_merged_with(self, other):
+        """Return True if other can be posted as part of this message."""
+        return (
+            self.method == other.method == "chat.postMessage" and
+            self.mergeable and other.mergeable and
+            {k: v for k, v in self.kwargs.items() if k != "text"} ==
+            {k: v for k, v in other.kwargs.items() if k != "text"}
+        )
+
+    def merge(self, other):
+        """Append the text of other to this message."""
+        self.kwargs["text"] = self.kwargs["text"] + "\n" + other.kwargs["text"]
+        self.callbacks.extend(other.callbacks)
+        self.failure_callbacks.extend(other.failure_callbacks)
+        self.parts.extend(other.parts)
+
+    def describe(self):
+        """Return short description of the call, for the log."""
+        text = self.kwargs.get("text", "")
+        if len(text) > 60:
+            text = text[:57] + "..."
+        return "{} to {}: {!r}".format(self.method, self.channel, text)
+
+    def fail(self, data=None):
+        """Tell those waiting for this call that it was given up on."""
+        for callback in self.failure_callbacks:
+            callback(data)
+
+
+class SlackSender:
+    """Send Slack Web API calls from a background thread.
+
+    Calls are put on a bounded queue, so submitting one costs next to nothing.
+    The sender thread keeps within Slack's rate limit of about one message per
+    second per channel, waits as long as Slack tells it to when rate limited,
+    and merges queued messages to the same channel or thread when a backlog
+    builds up. Calls waiting for their channel's rate limit, or to be retried,
+    are set aside, so they never hold up calls to other channels.
+
+    On shutdown, whatever is left is sent in parallel instead, and given up on
+    when the deadline has passed.
+    """
+    # Slack allows one message per second per channel, with short bursts.
+    # Editing messages and adding reactions are not limited per channel.
+    rate_limited_methods = {"chat.postMessage"}
+    rate_per_channel = 1.0
+    burst_per_channel = 3
+    # Number of calls which must be waiting before messages are merged
+    coalesce_threshold = 3
+    max_attempts = 5
+    # Seconds to wait when rate limited without a Retry-After, or on errors,
+    # times the number of attempts made. A random part of up to half of it is
+    # added or taken away, so calls failing together are not retried together.
+    default_retry_after = 1.0
+    retry_jitter = 0.5
+
+    def __init__(self, slack_client, max_queue_size=100):
+        self.slack_client = slack_client
+        self._queue = queue.Queue(max_queue_size)
+        self._buckets = dict()
+        # Calls taken off the queue which are waiting to be sent, in order
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # Submitted calls which are not done yet
+        self._unfinished = set()
+        self._unfinished_cond = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Monotonic time to give up sending at, set once shutting down
+        self._deadline = None
+
+    def submit(self, method, on_success=None, on_failure=None,
+               mergeable=True, **kwargs):
+        """Queue a call to the Slack Web API method.
+
+        See OutgoingCall for a description of the arguments.
+
+        Returns:
+            True if the call was queued, False if the queue was full and the
+            call was dropped.
+        """
+        call = OutgoingCall(method, on_success, on_failure, mergeable,
+                            **kwargs)
+        with self._unfinished_cond:
+            self._unfinished.add(call)
+        if self._deadline is not None:
+            # Shutting down, so there is no time to wait in the queue
+            self._send_in_background(call)
+            return True
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(call)
+        except queue.Full:
+            logging.error("Outgoing Slack queue is full, dropping " +
+                          call.describe())
+            metrics.SLACK_CALLS_DROPPED.labels(method).inc()
+            self._calls_done(call.parts)
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until all queued calls are done.
+
+        Returns:
+            True if all calls are done, False if timeout seconds passed first.
+        """
+        with self._unfinished_cond:
+            return self._unfinished_cond.wait_for(
+                lambda: not self._unfinished,
+                timeout
+            )
+
+    def shutdown(self, timeout):
+        """Send the calls which are left, and give up on them after timeout
+        seconds.
+
+        The queued calls are merged where possible and sent in parallel,
+        without waiting for our rate limiting, and so are calls submitted
+        from now on. Each call is retried only while there is time left.
+
+        Returns:
+            List of the calls which were not confirmed sent by the deadline.
+            They are also logged.
+        """
+        start = time.monotonic()
+        with self._pending_lock:
+            self._deadline = start + timeout
+            calls, self._pending = self._pending, []
+        while True:
+            try:
+                calls.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for call in self._coalesce(calls):
+            self._send_in_background(call)
+
+        with self._unfinished_cond:
+            self._unfinished_cond.wait_for(
+                lambda: not self._unfinished,
+                max(0.0, self._deadline - time.monotonic())
+            )
+            dropped = list(self._unfinished)
+
+        for call in dropped:
+            logging.error("Gave up on Slack call at shutdown, " +
+                          call.describe())
+            metrics.SLACK_CALLS_DROPPED.labels(call.method).inc()
+        logging.info("Slack calls sent in {:.0f} ms at shutdown, {} dropped"
+                     .format((time.monotonic() - start) * 1000, len(dropped)))
+        return dropped
+
+    def _ensure_started(self):
+        """Start the sender thread, unless it is running already."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="slack-sender",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _calls_done(self, calls):
+        with self._unfinished_cond:
+            self._unfinished.difference_update(calls)
+            self._unfinished_cond.notify_all()
+
+    def _send_in_background(self, call):
+        """Send call from a thread of its own."""
+        threading.Thread(
+            target=self._send_and_finish,
+            args=(call,),
+            name="slack-shutdown",
+            daemon=True
+        ).start()
+
+    def _send_and_finish(self, call):
+        try:
+            self._send(call)
+        except Exception:
+            logging.exception("Error while sending " + call.method)
+            call.fail()
+        finally:
+            self._calls_done(call.parts)
+
+    def _run(self):
+        """Send queued calls forever."""
+        while True:
+            with self._pending_lock:
+                wait = min(
+                    (self._ready_in(call) for call in self._pending),
+                    default=None
+                )
+            calls = []
+            if wait is None or wait > 0:
+                try:
+                    calls.append(self._queue.get(timeout=wait))
+                except queue.Empty:
+                    pass
+            # Take whatever else has piled up while we were busy
+            while True:
+                try:
+                    calls.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self._pending_lock:
+                self._pending.extend(calls)
+                if self._deadline is not None:
+                    # Shutting down, so send the rest in parallel
+                    calls, self._pending = self._pending, []
+                else:
+                    calls = []
+                    if len(self._pending) >= self.coalesce_threshold:
+                        self._pending = self._coalesce(self._pending)
+                    # The first call of each channel is the one to send next
+                    # there, so the first ready call keeps them in order
+                    for call in self._pending:
+                        if self._ready_in(call) <= 0:
+                            self._pending.remove(call)
+                            calls.append(call)
+                            break
+            for call in calls:
+                if self._deadline is not None:
+                    self._send_in_background(call)
+                else:
+                    self._send_once(call)
+
+    @staticmethod
+    def _coalesce(calls):
+        """Merge consecutive messages going to the same place."""
+        merged = []
+        for call in calls:
+            if merged and merged[-1].can_be_merged_with(call):
+                merged[-1].merge(call)
+            else:
+                merged.append(call)
+        if len(merged) < len(calls):
+            logging.debug("Merged {} Slack calls into {}".format(
+                len(calls), len(merged)
+            ))
+        return merged
+
+    def _bucket(self, call):
+        """Return the TokenBucket limiting call, or None."""
+        if call.method not in self.rate_limited_methods:
+            return None
+        bucket = self._buckets.get(call.channel)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_channel, self.burst_per_channel)
+            self._buckets[call.channel] = bucket
+        return bucket
+
+    def _ready_in(self, call):
+        """Return seconds until call may be sent (0 or less if it may be sent
+        now)."""
+        wait = call.not_before - time.monotonic()
+        bucket = self._bucket(call)
+        if bucket is not None:
+            wait = max(wait, bucket.wait_time())
+        return wait
+
+    def _send_once(self, call):
+        """Make one attempt at call, and set it aside if it must be retried
+        later."""
+        bucket = self._bucket(call)
+        if bucket is not None:
+            bucket.take()
+        try:
+            retry_after = self._attempt(call)
+        except Exception:
+            logging.exception("Error while sending " + call.method)
+            retry_after = None
+            call.fail()
+        if retry_after is not None:
+            if call.attempts < self.max_attempts:
+                call.not_before = time.monotonic() + retry_after
+                with self._pending_lock:
+                    if self._deadline is None:
+                        # Ahead of the later calls to the same channel
+                        self._pending.insert(0, call)
+                        return
+                self._send_in_background(call)
+                return
+            logging.error("Giving up on Slack call {} after {} attempts"
+                          .format(call.method, call.attempts))
+            call.fail()
+        self._calls_done(call.parts)
+
+    def _send(self, call):
+        """Perform the call, retrying on failure, when shutting down.
+
+        The rate limits are not waited for, and no more attempts are made once
+        the deadline has passed.
+        """
+        while True:
+            timeout = None
+            if self._deadline is not None:
+                timeout = self._deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            retry_after = self._attempt(call, timeout)
+            if retry_after is None:
+                return
+            if call.attempts >= self.max_attempts or \
+                    not self._sleep(retry_after):
+                break
+
+        logging.error("Giving up on Slack call {} after {} attempts".format(
+            call.method, call.attempts
+        ))
+        call.fail()
+
+    def _attempt(self, call, timeout=None):
+        """Make one attempt at the call.
+
+        Returns:
+            None if the call is done with (it succeeded, or retrying will not
+            help), or the number of seconds to wait before retrying it.
+        """
+        call.attempts += 1
+        kwargs = call.kwargs
+        if timeout is not None:
+            kwargs = dict(kwargs, timeout=timeout)
+        start = time.perf_counter()
+        try:
+            data = self.slack_client.api_call(call.method, **kwargs)
+        except Exception:
+            logging.exception("Error while calling " + call.method)
+            metrics.SLACK_API_ERRORS.labels(call.method, "exception").inc()
+            return self._backoff(call)
+        finally:
+            metrics.SLACK_API_SECONDS.labels(call.method).observe(
+                time.perf_counter() - start
+            )
+
+        if data.get("ok"):
+            for callback in call.callbacks:
+                callback(data)
+            return None
+
+        metrics.SLACK_API_ERRORS.labels(
+            call.method,
+            data.get("error", "unknown")
+        ).inc()
+        if data.get("error") == "ratelimited":
+            # SlackClient does not give us the headers
+            headers = data.get("headers", {})
+            if "Retry-After" in headers:
+                retry_after = float(headers["Retry-After"])
+            else:
+                retry_after = self._backoff(call)
+            logging.warning("Rate limited by Slack, retrying {} in {:.1f} "
+                            "seconds".format(call.describe(), retry_after))
+            bucket = self._bucket(call)
+            if bucket is not None:
+                bucket.hold(retry_after)
+            return retry_after
+
+        # Retrying will not help
+        logging.error("Slack call {} failed: {}".format(call.method, data))
+        call.fail(data)
+        return None
+
+    def _backoff(self, call):
+        """Return the number of seconds to wait before retrying call, when
+        Slack has not said."""
+        delay = self.default_retry_after * call.attempts
+        return delay * random.uniform(1 - self.retry_jitter,
+                                      1 + self.retry_jitter)
+
+    def _sleep(self, seconds):
+        """Sleep before retrying, unless that would take us past the deadline.
+
+        Returns:
+            False if there is no time left to retry.
+        """
+        if self._deadline is not None and \
+                time.monotonic() + seconds >= self._deadline:
+            return False
+        time.sleep(seconds)
+        return True
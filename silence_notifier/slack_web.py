@@ -0,0 +1,242 @@
+"""Slack Web API client keeping its HTTPS connections open.
+
+SlackClient.api_call makes every request on a new connection, so each message,
+reaction and auth.test pays for the TCP and TLS handshakes before the request
+itself is sent. SlackWebClient keeps connections open between calls, and can
+open one ahead of the first call, while the rest of silence-notifier starts.
+"""
+import http.client
+import json
+import logging
+import select
+import ssl
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from silence_notifier import metrics
+
+
+class SlackWebClient:
+    """Stand-in for SlackClient with persistent connections, for Web API calls.
+
+    Calls made one after another share one connection, while calls made at the
+    same time (like those of the Slack queue and the identity check) get one
+    each.
+    """
+    base_url = "https://slack.com/api/"
+    # Seconds to wait for Slack, unless told otherwise
+    timeout = 30.0
+    # Idle connections kept open
+    max_idle_connections = 2
+
+    def __init__(self, token, base_url=None, ssl_context=None):
+        """
+        Args:
+            token: The Slack token to authenticate with.
+            base_url: Location of the Web API, ending in a slash.
+            ssl_context: The ssl.SSLContext used for HTTPS. Defaults to one
+                verifying certificates the usual way, created when needed.
+        """
+        self.token = token
+        self.base_url = base_url or self.base_url
+        parts = urlsplit(self.base_url)
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = parts.path
+        self._ssl_context = ssl_context
+        self._idle = []
+        self._lock = threading.Lock()
+        # Set once the connection opened by prewarm is ready (or failed)
+        self._warmed = None
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def prewarm(self):
+        """Open a connection in the background, so the first call need not
+        wait for the handshakes."""
+        with self._lock:
+            if self._warmed is not None:
+                return
+            self._warmed = threading.Event()
+        threading.Thread(
+            target=self._prewarm,
+            name="slack-prewarm",
+            daemon=True
+        ).start()
+
+    def _prewarm(self):
+        try:
+            self._release(self._connect(self.timeout))
+        except OSError as e:
+            logging.warning("Could not connect to Slack ahead of time: {}"
+                            .format(e))
+        finally:
+            self._warmed.set()
+
+    def api_call(self, method, timeout=None, **kwargs) -> dict:
+        """Call the Web API method with the given arguments, like
+        SlackClient.api_call.
+
+        A connection which Slack has closed since it was last used is replaced
+        by a new one. The request is only sent again if sending it failed, as
+        once it is sent, Slack may have acted on it (say, posted the message)
+        even though no answer came.
+
+        Returns:
+            The decoded response. When rate limited, this has "ok" set to
+            False, "error" set to "ratelimited" and the Retry-After header
+            under "headers", like SlackClient's.
+
+        Raises:
+            OSError if Slack could not be reached, or did not answer in time.
+            http.client.HTTPException if Slack answered with an error status.
+        """
+        kwargs["token"] = self.token
+        body = urlencode(encode_arguments(kwargs)).encode()
+        timeout = timeout or self.timeout
+        start = time.perf_counter()
+        while True:
+            connection, reused = self._acquire(timeout)
+            try:
+                connection.sock.settimeout(timeout)
+                connection.request("POST", self._path + method, body, {
+                    "Content-Type": "application/x-www-form-urlencoded",
+                })
+            except ConnectionError:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            break
+        try:
+            response = connection.getresponse()
+            content = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        logging.debug("Slack answered {} in {:.1f} ms, on a {} connection"
+                      .format(method, (time.perf_counter() - start) * 1000,
+                              "reused" if reused else "new"))
+
+        if response.status == 429:
+            return {
+                "ok": False,
+                "error": "ratelimited",
+                "headers": {"Retry-After": response.getheader(
+                    "Retry-After", "1"
+                )},
+            }
+        if response.status >= 400:
+            raise http.client.HTTPException("{} {} from Slack for {}".format(
+                response.status,
+                response.reason,
+                method
+            ))
+        return json.loads(content.decode("utf-8"))
+
+    def close(self):
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _acquire(self, timeout):
+        """Return (connection, whether it was used before)."""
+        if self._warmed is not None:
+            # Better to wait for the handshakes in progress than to start over
+            self._warmed.wait(timeout)
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+            if _is_closed(connection):
+                connection.close()
+                continue
+            return connection, True
+        return self._connect(timeout), False
+
+    def _connect(self, timeout):
+        """Open a connection to Slack, doing the handshakes right away."""
+        start = time.perf_counter()
+        if self._https:
+            connection = http.client.HTTPSConnection(
+                self._host,
+                self._port,
+                timeout=timeout,
+                context=self.ssl_context
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                self._host,
+                self._port,
+                timeout=timeout
+            )
+        try:
+            connection.connect()
+        except BaseException:
+            connection.close()
+            raise
+        metrics.SLACK_CONNECT_SECONDS.observe(time.perf_counter() - start)
+        return connection
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle_connections:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+def encode_arguments(kwargs):
+    """Return the Web API arguments in kwargs, ready to be sent as a form.
+
+    Values which are not strings are encoded as JSON, like SlackClient does,
+    so as_user=True is sent as "true".
+    """
+    return {
+        name: value if isinstance(value, str) else json.dumps(value)
+        for name, value in kwargs.items()
+    }
+
+
+def _is_closed(connection):
+    """Return True if the server has closed the idle connection.
+
+    An idle connection has nothing to read, unless the server has closed it.
+    Checking saves sending a request which is never answered.
+    """
+    sock = connection.sock
+    if sock is None:
+        return True
+    try:
+        if not select.select([sock], [], [], 0)[0]:
+            return False
+    except (OSError, ValueError):
+        return True
+    # TLS 1.3 servers send session tickets after the handshake, which make the
+    # socket readable with nothing for us to read
+    sock.setblocking(False)
+    try:
+        sock.recv(1)
+        return True
+    except (ssl.SSLWantReadError, BlockingIOError):
+        return False
+    except OSError:
+        return True
+    finally:
+        sock.settimeout(connection.timeout)
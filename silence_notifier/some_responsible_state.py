@@ -4,10 +4,12 @@ from silence_notifier.state import State
 class SomeResponsibleState(State):
     """State for when at least one person has taken responsibility for fixing
     the problems."""
+    name = "some_responsible"
+
     def handle_timer(self, num_invocations, minutes):
         """Do not send any warning, since someone is looking into it."""
-        # Not warning anyone
-        pass
+        # Not warning anyone, just keeping the status message up to date
+        self._update_status(periodic=True)
 
     def handle_message(self, data):
         """Handle either someone taking responsibility, or someone leaving it.
@@ -44,6 +46,7 @@ class SomeResponsibleState(State):
         """Notice the appropriate people of the silence ending."""
         mentions_string = self._get_reponsible_mention()
         self.send("sound", mentions=mentions_string)
+        self._update_status(over=True)
 
     def _handle_additional_responsible(self, userid, data):
         """Handle that one more person has taken responsibility.
@@ -0,0 +1,79 @@
+"""Record how long each step from startup to the first warning takes.
+
+Steps are marked as they happen, and once the first message has been posted to
+Slack, a report with the time of each step (counted from the start of the
+process) is logged and optionally written to a file.
+"""
+import logging
+import os
+import time
+
+_marks = []
+_reported = False
+
+
+def _process_start():
+    """Return monotonic time at which this process started.
+
+    Falls back to the time this module was imported, where /proc is missing.
+    """
+    try:
+        with open("/proc/self/stat", "rb") as fp:
+            start_ticks = int(fp.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as fp:
+            uptime = float(fp.read().split()[0])
+        ticks_per_sec = os.sysconf("SC_CLK_TCK")
+        age = uptime - start_ticks / ticks_per_sec
+        return time.monotonic() - age
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+_start = _process_start()
+
+
+def mark(step):
+    """Record that step has just been completed."""
+    if not _reported:
+        _marks.append((step, time.monotonic()))
+
+
+def get_marks():
+    """Return list of (step, seconds since start of process)."""
+    return [(step, at - _start) for step, at in _marks]
+
+
+def report():
+    """Return the recorded steps as a human readable report."""
+    lines = ["Startup trace (milliseconds since the process started):"]
+    previous = 0.0
+    for step, seconds in get_marks():
+        lines.append("{:>9.1f}  (+{:>7.1f})  {}".format(
+            seconds * 1000,
+            (seconds - previous) * 1000,
+            step
+        ))
+        previous = seconds
+    return "\n".join(lines)
+
+
+def finish(filename=None):
+    """Mark the first warning as posted, and report the trace once.
+
+    Args:
+        filename: If given, the report is also written to this file.
+    """
+    global _reported
+    if _reported:
+        return
+    mark("first post")
+    _reported = True
+
+    text = report()
+    logging.info(text)
+    if filename:
+        try:
+            with open(filename, "w") as fp:
+                fp.write(text + "\n")
+        except OSError:
+            logging.exception("Could not write startup trace to " + filename)
@@ -1,27 +1,31 @@
 import logging
-import sys
 from abc import ABCMeta, abstractmethod
 
 
 class State(metaclass=ABCMeta):
-    """Abstract class representing one state SilencePlugin can be in.
+    """Abstract class representing one state a StreamMonitor can be in.
 
     Methods required by all state classes are defined as abstract methods on
     this class. Methods used by all state classes are also located here.
     """
-    def __init__(self, plugin):
-        self.communicator = plugin.communicator
-        self.activate_no_responsible_state = self._create_activate_no_func(plugin)
-        self.activate_some_responsible_state = self._create_activate_some_func(plugin)
-        self.responsible_usernames = plugin.responsible_usernames
-        self.settings = plugin.settings
+    # Short name of the state, as exposed in the metrics
+    name = None
+
+    def __init__(self, monitor):
+        self.communicator = monitor.communicator
+        self.activate_no_responsible_state = self._create_activate_no_func(monitor)
+        self.activate_some_responsible_state = self._create_activate_some_func(monitor)
+        self.end_episode = monitor.end_episode
+        self.responsible_usernames = monitor.responsible_usernames
+        self.settings = monitor.settings
+        self.silence_minutes = monitor.silence_minutes
 
     @staticmethod
-    def _create_activate_no_func(plugin):
+    def _create_activate_no_func(monitor):
         """Create function for activating the NoResponsibleState state.
 
         Args:
-            plugin: Instance of SilencePlugin to activate states on.
+            monitor: Instance of StreamMonitor to activate states on.
 
         Returns:
             Function which takes no arguments, which activates the
@@ -30,16 +34,16 @@ class State(metaclass=ABCMeta):
         Work-around the fact that Python does not support cyclic dependencies.
         """
         return State._create_activate_func(
-            plugin,
-            plugin.activate_no_responsible_state
+            monitor,
+            monitor.activate_no_responsible_state
         )
 
     @staticmethod
-    def _create_activate_some_func(plugin):
+    def _create_activate_some_func(monitor):
         """Create function for activating the SomeResponsibleState state.
 
         Args:
-            plugin: Instance of SilencePlugin to activate states on.
+            monitor: Instance of StreamMonitor to activate states on.
 
         Returns:
             Function which takes no arguments, which activates the
@@ -48,12 +52,12 @@ class State(metaclass=ABCMeta):
         Work-around the fact that Python does not support cyclic dependencies.
         """
         return State._create_activate_func(
-            plugin,
-            plugin.activate_some_responsible_state
+            monitor,
+            monitor.activate_some_responsible_state
         )
 
     @staticmethod
-    def _create_activate_func(plugin, func):
+    def _create_activate_func(monitor, func):
         """Create function which calls func when called."""
         # TODO: Refactor this so it is set directly in the constructor.
         def activate_state():
@@ -81,12 +85,17 @@ class State(metaclass=ABCMeta):
     def handle_not_running(self):
         """Called when the LiquidSoap process has quit running."""
         self.send("not_running")
-        logging.debug("LiquidSoap is no longer running, exiting")
-        sys.exit(0)
+        self._update_status(over=True)
+        logging.debug("LiquidSoap is no longer running, ending the silence")
+        self.end_episode()
 
     def _send_change_responsible(self):
         """Send message summarizing who is recorded as responsible for fixing
         the technical problems."""
+        if self.settings.status_message:
+            # Shown in the status message instead
+            self._update_status()
+            return
         if self.responsible_usernames:
             self.send(
                 "change_responsible",
@@ -97,6 +106,23 @@ class State(metaclass=ABCMeta):
                 "change_none_responsible"
             )
 
+    def _update_status(self, over=False, periodic=False):
+        """Show the duration, show and responsible users in the status
+        message, if enabled.
+
+        Args:
+            over: Set to True when the silence is over.
+            periodic: Set to True when nothing but the duration has changed.
+        """
+        if not self.settings.status_message:
+            return
+        self.communicator.update_status(
+            int(self.silence_minutes()),
+            self._get_reponsible_mention() or None,
+            over=over,
+            periodic=periodic
+        )
+
     def _acknowledge_additional_responsible(self, userid, data):
         """Acknowledge one additional person signing themselves up as
         responsible.
@@ -0,0 +1,110 @@
+import threading
+
+
+class StatusMessage:
+    """One message per silence, edited in place as the silence goes on.
+
+    The message is posted the first time a text is set, and edited with
+    chat.update after that. At most one call for the message is queued at a
+    time. Texts set while a call is queued are collapsed, so a burst of changes
+    results in one update with the latest text once the queued call is done.
+    """
+
+    def __init__(self, sender, channel, on_posted=None):
+        """
+        Args:
+            sender: The SlackSender to queue calls on.
+            channel: The channel to post the message to.
+            on_posted: Function called with the response data once the
+                message has been posted.
+        """
+        self.sender = sender
+        self.channel = channel
+        self.on_posted = on_posted
+        self.ts = None
+        self.channel_id = None
+        self._text = None
+        self._sent_text = None
+        self._busy = False
+        # Increased for every silence, so late answers about the message of
+        # an earlier silence are ignored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Start over with a new message for the next silence."""
+        with self._lock:
+            self._generation += 1
+            self.ts = None
+            self.channel_id = None
+            self._text = None
+            self._sent_text = None
+            self._busy = False
+
+    def restore(self, ts, channel_id):
+        """Continue editing the message posted by the process before us."""
+        with self._lock:
+            self.ts = ts
+            self.channel_id = channel_id
+
+    def set_text(self, text):
+        """Show text in the message, as soon as Slack lets us."""
+        with self._lock:
+            self._text = text
+            if not self._busy:
+                self._submit()
+
+    def _submit(self):
+        """Queue a call showing the latest text, while holding the lock."""
+        if self._text == self._sent_text:
+            return
+        text = self._text
+        generation = self._generation
+
+        def on_success(data):
+            self._done(generation, text, data)
+
+        def on_failure(data):
+            self._failed(generation)
+
+        if self.ts is None:
+            self._busy = self.sender.submit(
+                "chat.postMessage",
+                on_success=on_success,
+                on_failure=on_failure,
+                mergeable=False,
+                channel=self.channel,
+                text=text,
+                as_user=True
+            )
+        else:
+            self._busy = self.sender.submit(
+                "chat.update",
+                on_success=on_success,
+                on_failure=on_failure,
+                channel=self.channel_id,
+                ts=self.ts,
+                text=text,
+                as_user=True
+            )
+
+    def _done(self, generation, text, data):
+        posted = False
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._busy = False
+            if self.ts is None:
+                self.ts = data['ts']
+                self.channel_id = data['channel']
+                posted = True
+            self._sent_text = text
+            self._submit()
+        if posted and self.on_posted:
+            self.on_posted(data)
+
+    def _failed(self, generation):
+        with self._lock:
+            if generation == self._generation:
+                # The next change tries again
+                self._busy = False
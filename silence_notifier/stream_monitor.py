@@ -0,0 +1,391 @@
+import logging
+import sys
+import threading
+import _thread
+
+from silence_notifier.clock import SYSTEM_CLOCK
+from silence_notifier.no_responsible_state import NoResponsibleState
+from silence_notifier.some_responsible_state import SomeResponsibleState
+
+STATES = {state.name: state for state in
+          (NoResponsibleState, SomeResponsibleState)}
+
+
+class StreamMonitor:
+    """Everything needed to warn about silence on one LiquidSoap stream.
+
+    Each stream has its own state machine, channel, responsible users and
+    LiquidSoap process. The Slack connection, outgoing message queue and HTTP
+    session are shared with the other streams.
+    """
+    def __init__(self, name, settings, communicator, snapshot=None,
+                 history=None, clock=None):
+        """
+        Args:
+            name: Name of the stream, used by the trigger commands.
+            settings: Instance of settings.Settings for this stream.
+            communicator: Instance of communication.Communicator for this
+                stream.
+            snapshot: Instance of episode_snapshot.EpisodeSnapshot to save
+                the ongoing silence to, if any.
+            history: Instance of episode_history.EpisodeHistory to record
+                the silences to when they are over, if any.
+            clock: The clock.Clock to tell the time with. Defaults to the
+                real time.
+        """
+        self.name = name
+        self.clock = clock or SYSTEM_CLOCK
+        self.settings = settings
+        self.communicator = communicator
+        self.responsible_usernames = []
+        self.started_at = None
+        # Everyone who has been responsible during the silence, and when the
+        # first of them volunteered (clock.monotonic)
+        self._volunteers = []
+        self._first_volunteer_at = None
+        # When the sound came back, while waiting for the grace period
+        self._sound_back_at = None
+        self._active_state = None
+        self._silence_notify_job = None
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._history = history
+        # Called without arguments instead of exiting when the silence is
+        # over outside of daemon mode, if set
+        self.on_exit = None
+        # Ends the silence unless it starts again first, while the sound is
+        # back during the grace period (daemon mode)
+        self._grace_timer = None
+        # Increased for every grace period, so a timer which fires after it
+        # was cancelled can tell
+        self._grace_generation = 0
+
+        if not self.settings.daemon_mode:
+            # The silence started when we did
+            self.started_at = self.clock.monotonic()
+            self.activate_state(NoResponsibleState)
+        # Set only now, so the snapshot left by a crash is not overwritten
+        # before we have had the chance to restore it
+        self._snapshot = snapshot
+        self.communicator.on_posted = self.save_snapshot
+
+    @property
+    def lock(self):
+        """Lock held while the state machine of this stream is used."""
+        return self._lock
+
+    def attach_job(self, job):
+        """Use job to send the periodical warnings for this stream.
+
+        Args:
+            job: Instance of rtmbot_plugin.SilenceNotifyJob created with
+                this stream's lock.
+        """
+        self._silence_notify_job = job
+        job.on_warning = self.save_snapshot
+        job.update_state(self._active_state)
+        job.set_settings(self.settings)
+
+    def update_settings(self, settings):
+        """Start using new settings, keeping the ongoing silence as it is."""
+        with self._lock:
+            self.settings = settings
+            self.communicator.settings = settings
+            if self._active_state:
+                self._active_state.settings = settings
+            if self._silence_notify_job:
+                self._silence_notify_job.update_settings(settings)
+
+    def is_active(self):
+        """Return True if there is a silence on this stream right now."""
+        return self._active_state is not None
+
+    def state_name(self):
+        """Return name of the active state, or "none" outside of silences."""
+        state = self._active_state
+        return "none" if state is None else state.name
+
+    def _warnings_given(self):
+        """Return number of warnings given about the ongoing silence."""
+        job = self._silence_notify_job
+        progress = job.warning_progress() if job else None
+        return progress[0] if progress else 0
+
+    def silence_minutes(self):
+        """Return number of minutes the ongoing silence has lasted, or 0."""
+        if self._active_state is None or self.started_at is None:
+            return 0.0
+        return (self.clock.monotonic() - self.started_at) / self.settings.sec_per_min
+
+    def activate_no_responsible_state(self):
+        """Method for states, used to switch to the NoResponsibleState."""
+        self.activate_state(NoResponsibleState)
+
+    def activate_some_responsible_state(self):
+        """Method for states, used to switch to the SomeResponsibleState."""
+        self.activate_state(SomeResponsibleState)
+
+    def activate_state(self, new_state_class):
+        """Change to the given state.
+
+        Args:
+            new_state_class: The class of the state we should switch to.
+        """
+        logging.debug("Changing {} to state {}".format(
+            self.name,
+            new_state_class.__name__
+        ))
+        new_state_instance = new_state_class(self)
+        self._active_state = new_state_instance
+        if self._silence_notify_job and self._grace_timer is None:
+            self._silence_notify_job.update_state(new_state_instance)
+        self.save_snapshot()
+
+    def save_snapshot(self):
+        """Save the ongoing silence, so it can be resumed after a crash."""
+        if self._snapshot:
+            self._snapshot.save(self.name, self._describe_episode)
+
+    def _describe_episode(self):
+        """Return dictionary describing the ongoing silence, or None."""
+        state = self._active_state
+        if state is None:
+            return None
+        job = self._silence_notify_job
+        progress = job.warning_progress() if job else None
+        return {
+            "state": state.name,
+            "started_at": self.clock.time() -
+            (self.clock.monotonic() - self.started_at),
+            "responsible_usernames": list(self.responsible_usernames),
+            "volunteers": list(self._volunteers),
+            "first_volunteer_after": None if self._first_volunteer_at is None
+            else self._first_volunteer_at - self.started_at,
+            "warnings": progress,
+            "communicator": self.communicator.snapshot(),
+        }
+
+    def restore(self, episode):
+        """Continue the silence described by episode, as saved by the process
+        running before us."""
+        with self._lock:
+            self.started_at = self.clock.monotonic() - \
+                (self.clock.time() - episode["started_at"])
+            self.responsible_usernames[:] = episode["responsible_usernames"]
+            self._volunteers[:] = episode.get("volunteers",
+                                              self.responsible_usernames)
+            first_volunteer_after = episode.get("first_volunteer_after")
+            if first_volunteer_after is not None:
+                self._first_volunteer_at = \
+                    self.started_at + first_volunteer_after
+            self.communicator.restore(episode["communicator"])
+            if episode["warnings"] is not None:
+                num_warnings, minutes = episode["warnings"]
+                self._silence_notify_job.resume_warnings(
+                    self.started_at, num_warnings, minutes
+                )
+            # Saves the snapshot again, so it is kept fresh
+            self.activate_state(STATES[episode["state"]])
+        logging.info("Resumed the silence on {}, which started {:.0f} seconds "
+                     "ago".format(self.name,
+                                  self.clock.time() - episode["started_at"]))
+
+    def _clear_snapshot(self):
+        if self._snapshot:
+            self._snapshot.clear(self.name)
+
+    def _note_volunteers(self):
+        """Remember who has taken responsibility during the silence."""
+        for userid in self.responsible_usernames:
+            if userid not in self._volunteers:
+                if not self._volunteers:
+                    self._first_volunteer_at = self.clock.monotonic()
+                self._volunteers.append(userid)
+
+    def _record_history(self, ending):
+        """Queue the silence which is ending to be written to the history.
+
+        Args:
+            ending: How it ended, one of episode_history.ENDINGS.
+        """
+        if self._history is None or self._active_state is None or \
+                self.started_at is None:
+            return
+        now = self.clock.monotonic()
+        ended = now if self._sound_back_at is None else self._sound_back_at
+        first_volunteer = None
+        if self._first_volunteer_at is not None:
+            first_volunteer = self._first_volunteer_at - self.started_at
+        self._history.record(
+            self.name,
+            self.clock.time() - (now - self.started_at),
+            self.clock.time() - (now - ended),
+            ending,
+            warnings=self._warnings_given(),
+            volunteers=self._volunteers,
+            first_volunteer=first_volunteer,
+            schedule=self.communicator.schedule
+        )
+
+    def start_episode(self):
+        """Start warning about a new silence (daemon mode).
+
+        A silence starting during the grace period of the previous one
+        continues it instead.
+        """
+        with self._lock:
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+                self._sound_back_at = None
+                logging.info("Silence started on {} during the grace period, "
+                             "continuing the previous silence"
+                             .format(self.name))
+                self._silence_notify_job.continue_warnings()
+                self._silence_notify_job.update_state(self._active_state)
+                return
+            if self._active_state is not None:
+                logging.debug("Silence started on {}, but one is already "
+                              "active".format(self.name))
+                return
+            logging.debug("Silence started on " + self.name)
+            self.started_at = self.clock.monotonic()
+            del self.responsible_usernames[:]
+            del self._volunteers[:]
+            self._first_volunteer_at = None
+            self._sound_back_at = None
+            self.communicator.reset()
+            if self.communicator.schedule.is_stale():
+                self.communicator.schedule.refresh_async()
+            self.activate_state(NoResponsibleState)
+            self._silence_notify_job.start_episode(
+                self.communicator.slack_client
+            )
+
+    def stop_episode(self):
+        """Announce that the silence is over and wait for the next one (daemon
+        mode).
+
+        Silences which ended before the first warning are not announced.
+        Otherwise, the announcement waits for the grace period to pass, in
+        case the silence starts again.
+        """
+        with self._lock:
+            if self._active_state is None or self._grace_timer is not None:
+                logging.debug("Silence stopped on {}, but none is active"
+                              .format(self.name))
+                return
+            if self._warnings_given() == 0:
+                logging.info("Silence on {} was too short to warn about"
+                             .format(self.name))
+                self.end_episode("short")
+                return
+            grace_period = self.settings.episode_grace_period
+            if grace_period:
+                logging.debug("Silence stopped on {}, announcing it in {} "
+                              "seconds".format(self.name, grace_period))
+                # No warnings while the sound is back
+                self._silence_notify_job.pause_warnings()
+                self._silence_notify_job.update_state(None)
+                self._sound_back_at = self.clock.monotonic()
+                self._grace_generation += 1
+                self._grace_timer = self.clock.call_later(
+                    grace_period,
+                    self._end_grace_period,
+                    self._grace_generation
+                )
+                return
+            logging.debug("Silence stopped on " + self.name)
+            self._active_state.handle_silence_stop()
+            self.end_episode("sound")
+
+    def _end_grace_period(self, generation):
+        """Announce that the silence is over, since it did not start again
+        during the grace period."""
+        with self._lock:
+            if self._grace_timer is None or \
+                    generation != self._grace_generation:
+                # Cancelled while we waited for the lock
+                return
+            self._grace_timer = None
+            logging.debug("Silence stopped on " + self.name)
+            self._active_state.handle_silence_stop()
+            self.end_episode("sound")
+
+    def end_episode(self, ending="not_running"):
+        """Method for states, used when there is nothing more to warn about.
+
+        Outside of daemon mode, this means the program exits.
+
+        Args:
+            ending: How the silence ended, for the history. States only end
+                it when LiquidSoap is no longer running.
+        """
+        with self._lock:
+            self._record_history(ending)
+        if not self.settings.daemon_mode:
+            # Let the last messages reach Slack before we exit
+            deadline = self.clock.monotonic() + self.settings.shutdown_timeout
+            self.communicator.sender.shutdown(self.settings.shutdown_timeout)
+            if self.communicator.notifiers is not None:
+                self.communicator.notifiers.shutdown(
+                    max(0.0, deadline - self.clock.monotonic())
+                )
+            if self._history:
+                self._history.flush(self._history.flush_timeout)
+            self._clear_snapshot()
+            if self.on_exit:
+                with self._lock:
+                    # We exit right after, so the silence is over for us
+                    self._active_state = None
+                    if self._silence_notify_job:
+                        self._silence_notify_job.update_state(None)
+                self.on_exit()
+            elif threading.current_thread() is threading.main_thread():
+                sys.exit(0)
+            else:
+                # Called by the process watcher. Stop RtmBot the same way
+                # SIGTERM does.
+                _thread.interrupt_main()
+                return
+        with self._lock:
+            self._active_state = None
+            if self._silence_notify_job:
+                self._silence_notify_job.update_state(None)
+            self._clear_snapshot()
+
+    def handle_message(self, data):
+        """Let the active state handle a message mentioning us."""
+        with self._lock:
+            if self._active_state:
+                self._active_state.handle_message(data)
+                self._note_volunteers()
+                self.save_snapshot()
+
+    def handle_sigterm(self):
+        """Do whatever must be done for this stream when shutting down."""
+        if self.settings.daemon_mode:
+            with self._lock:
+                if self._grace_timer is not None:
+                    # The sound is back, and we will not be around to say so
+                    # when the grace period is over
+                    self._grace_timer.cancel()
+                    self._grace_timer = None
+                    self._active_state.handle_silence_stop()
+                    self.end_episode("sound")
+            # Otherwise, the daemon stopping says nothing about the sound
+            # coming back
+            return
+        with self._lock:
+            if self._active_state and self._warnings_given() == 0:
+                logging.info("Silence on {} was too short to warn about"
+                             .format(self.name))
+                self._record_history("short")
+            elif self._active_state:
+                self._record_history("sound")
+                self._active_state.handle_silence_stop()
+                # We exit right after, so the silence is over for us
+                self._active_state = None
+                if self._silence_notify_job:
+                    self._silence_notify_job.update_state(None)
+            self._clear_snapshot()
@@ -0,0 +1,172 @@
+"""Local trigger socket used to start and stop silences in daemon mode.
+
+The daemon listens on a Unix socket, and LiquidSoap's fallback transitions
+use the small client found in this module to tell it when the silence starts
+and stops:
+
+    python -m silence_notifier.trigger start
+    python -m silence_notifier.trigger stop
+
+When several streams are monitored, the name of the stream is given after the
+command, like "start main".
+"""
+import argparse
+import logging
+import os
+import socket
+import stat
+import sys
+import threading
+
+
+COMMANDS = ("start", "stop")
+
+
+class TriggerServer:
+    """Listen for commands on a Unix socket and dispatch them to handlers."""
+
+    def __init__(self, path, handlers):
+        """Create a new, not yet listening, trigger server.
+
+        Args:
+            path: Path of the Unix socket to listen on.
+            handlers: Dictionary mapping each command to the function which
+                should be called when it is received. Any words following the
+                command are given to the function as arguments.
+        """
+        self.path = path
+        self.handlers = handlers
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        """Start listening on the socket in a background thread."""
+        self._remove_stale_socket()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        # Let the group (which LiquidSoap's user should be a member of) use it
+        os.chmod(self.path, 0o660)
+        sock.listen(8)
+        self._sock = sock
+
+        self._thread = threading.Thread(
+            target=self._serve,
+            name="trigger-server",
+            daemon=True
+        )
+        self._thread.start()
+        logging.debug("Listening for triggers on " + self.path)
+
+    def close(self):
+        """Stop listening and remove the socket file."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self._remove_stale_socket()
+
+    def _remove_stale_socket(self):
+        """Remove the socket file left behind by an earlier process."""
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise ValueError(
+                "{} exists and is not a socket".format(self.path)
+            )
+        os.unlink(self.path)
+
+    def _serve(self):
+        """Accept connections until the socket is closed."""
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                # The socket was closed
+                return
+            with conn:
+                self._handle_connection(conn)
+
+    def _handle_connection(self, conn):
+        """Read one command from conn, run its handler and reply."""
+        conn.settimeout(1.0)
+        try:
+            line = conn.recv(256).decode("utf-8", "replace")
+        except OSError:
+            logging.exception("Error while reading trigger command")
+            return
+
+        words = line.split() or [""]
+        command, args = words[0], words[1:]
+        handler = self.handlers.get(command)
+        if handler is None:
+            reply = "error unknown command {!r}".format(command)
+        else:
+            logging.debug("Trigger received: " + line.strip())
+            try:
+                handler(*args)
+                reply = "ok"
+            except Exception as e:
+                logging.exception("Error while handling trigger " + command)
+                reply = "error {}".format(e)
+
+        try:
+            conn.sendall((reply + "\n").encode("utf-8"))
+        except OSError:
+            logging.warning("Could not reply to trigger " + command)
+
+
+def send_command(path, command, timeout=5.0):
+    """Send command to the daemon listening on path, and return its reply.
+
+    Raises:
+        OSError if the daemon could not be reached.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(command.encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        return sock.recv(1024).decode("utf-8").strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tell a running silence-notifier daemon that the silence "
+                    "has started or stopped."
+    )
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument(
+        "stream",
+        nargs="?",
+        help="Name of the stream, when several streams are monitored."
+    )
+    parser.add_argument(
+        "--socket",
+        help="Path of the daemon's trigger socket. Defaults to the "
+             "trigger_socket setting."
+    )
+    args = parser.parse_args(argv)
+
+    path = args.socket
+    if path is None:
+        from silence_notifier.settings import Settings
+        path = Settings().trigger_socket
+
+    try:
+        command = args.command
+        if args.stream:
+            command += " " + args.stream
+        reply = send_command(path, command)
+    except OSError as e:
+        print("Could not reach silence-notifier: {}".format(e), file=sys.stderr)
+        return 1
+
+    if reply != "ok":
+        print(reply, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+from silence_notifier.clock import SYSTEM_CLOCK
+
+
+def generate_delays(warning_delays, max_delay=None):
+    """Generate the delays (in minutes) between each warning.
+
+    The delays from the settings are used first. With only one delay, it is
+    repeated. Otherwise, the next delay is the sum of the two previous ones,
+    like Fibonacci. Only the last two delays are kept, so this uses constant
+    memory however many delays are generated.
+
+    Args:
+        warning_delays: The warning_delays setting.
+        max_delay: No delay is longer than this, if given.
+    """
+    def cap(delay):
+        return delay if max_delay is None else min(delay, max_delay)
+
+    for delay in warning_delays:
+        yield cap(delay)
+
+    if len(warning_delays) == 1:
+        # Just repeat the one delay
+        while True:
+            yield cap(warning_delays[0])
+
+    n_2, n_1 = cap(warning_delays[-2]), cap(warning_delays[-1])
+    while True:
+        n_2, n_1 = n_1, cap(n_2 + n_1)
+        yield n_1
+
+
+class WarningScheduler:
+    """Keep track of when the next warning is due.
+
+    Deadlines are absolute points on the monotonic clock, counted from the
+    start of the silence, so they do not drift however late we are woken up.
+    """
+
+    def __init__(self, warning_delays, sec_per_min, max_delay=None,
+                 clock=None):
+        """
+        Args:
+            warning_delays: The warning_delays setting.
+            sec_per_min: Number of seconds in one minute.
+            max_delay: Maximum number of minutes between two warnings.
+            clock: The clock.Clock to tell the time with. Defaults to the
+                real time.
+        """
+        self.clock = clock or SYSTEM_CLOCK
+        self.warning_delays = warning_delays
+        self.sec_per_min = sec_per_min
+        self.max_delay = max_delay
+        self._start = None
+        self._delays = None
+        self._num_warnings = 0
+        self._minutes = 0
+        self._deadline = None
+        self._paused_at = None
+        # Settings given to update_settings, not used before the next silence
+        self._pending_settings = None
+
+    def update_settings(self, warning_delays, sec_per_min, max_delay=None):
+        """Use new settings from the next silence on.
+
+        The deadlines of the silence in progress stay as they are, since they
+        are counted in minutes of sec_per_min seconds.
+        """
+        self._pending_settings = (warning_delays, sec_per_min, max_delay)
+
+    def _use_pending_settings(self):
+        if self._pending_settings is not None:
+            self.warning_delays, self.sec_per_min, self.max_delay = \
+                self._pending_settings
+            self._pending_settings = None
+
+    def start(self, now=None, delay=0.0):
+        """Start a new silence, with the first warning due after delay
+        seconds (right away by default)."""
+        self._use_pending_settings()
+        self._start = self.clock.monotonic() if now is None else now
+        self._delays = generate_delays(self.warning_delays, self.max_delay)
+        self._num_warnings = 0
+        self._minutes = 0
+        self._deadline = self._start + delay
+        self._paused_at = None
+
+    def resume(self, start, num_warnings, minutes):
+        """Continue a silence which started at start (on the monotonic clock),
+        where num_warnings warnings have been given over minutes minutes."""
+        self._use_pending_settings()
+        self._start = start
+        self._delays = generate_delays(self.warning_delays, self.max_delay)
+        for _ in range(num_warnings):
+            next(self._delays)
+        self._num_warnings = num_warnings
+        self._minutes = minutes
+        self._deadline = self._start + self._minutes * self.sec_per_min
+        self._paused_at = None
+
+    def pause(self, now=None):
+        """Stop the clock of the silence, while the sound is back."""
+        self._paused_at = self.clock.monotonic() if now is None else now
+
+    def unpause(self, now=None):
+        """Start the clock of the silence again, so the time spent paused
+        does not count towards the next warning."""
+        if self._paused_at is None:
+            return
+        now = self.clock.monotonic() if now is None else now
+        paused = now - self._paused_at
+        self._paused_at = None
+        self._start += paused
+        self._deadline += paused
+
+    def progress(self):
+        """Return tuple of the number of warnings given so far and the number
+        of minutes into the silence the next one is due, or None if no silence
+        was started."""
+        if self._deadline is None:
+            return None
+        return self._num_warnings, self._minutes
+
+    def is_due(self, now=None):
+        """Return True if it is time for the next warning."""
+        if self._deadline is None:
+            return False
+        now = self.clock.monotonic() if now is None else now
+        return now >= self._deadline
+
+    def seconds_until_due(self, now=None):
+        """Return number of seconds until the next warning is due."""
+        now = self.clock.monotonic() if now is None else now
+        return max(0.0, self._deadline - now)
+
+    def next_warning(self):
+        """Move on to the next warning.
+
+        Returns:
+            Tuple of the number of warnings given before this one, and the
+            number of minutes since the silence started.
+        """
+        warning = (self._num_warnings, self._minutes)
+        self._num_warnings += 1
+        self._minutes += next(self._delays)
+        self._deadline = self._start + self._minutes * self.sec_per_min
+        return warning
+